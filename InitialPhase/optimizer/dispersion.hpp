@@ -28,6 +28,9 @@
 
 #include <fftw3.h>
 
+#include "spec1d/dispersionfile.hpp"
+#include "spec1d/textfile.hpp"
+
 class DispersionData {
 public:
 
@@ -37,54 +40,45 @@ public:
     MAP_TYPE_PRODUCT
   } te_map_t;
   
-  DispersionData(double _fmin, double _fmax) :
+  DispersionData(double _fmin, double _fmax, double _band_margin = -1.0) :
     fmin(_fmin),
     fmax(_fmax),
-    fullspec(NULL),
-    fullenv(NULL),
+    band_margin(_band_margin),
+    band_first(0),
     sigma_phase(0.1e03)
   {
   }
 
-  bool load(const char *filename)
+  bool load(const char *_filename)
   {
-    FILE *fp = fopen(filename, "r");
-    if (fp == NULL) {
-      fprintf(stderr, "error: failed to open %s for reading\n", filename);
-      return false;
-    }
+    //
+    // Either version of a station pair may be given, the current one is loaded
+    //
+    std::string path = DispersionBinaryFile::preferred_path(_filename);
+    const char *filename = path.c_str();
 
-    if (fscanf(fp, "%lf %lf %lf %lf %lf\n",
-               &lon1, &lat1, &lon2, &lat2, &distkm) != 5) {
-      fprintf(stderr, "error: failed to parse line 1\n");
-      return false;
+    if (DispersionBinaryFile::is_binary(filename)) {
+      if (!load_binary(filename)) {
+	return false;
+      }
+    } else {
+      if (!load_text(filename)) {
+	return false;
+      }
     }
 
-    if (fscanf(fp, "%lf %d %lf %lf %d\n",
-	       &samplerate, &daycount, &asnr, &csnr, &samples) != 5) {
-      fprintf(stderr, "error: failed to parse line 2\n");
-      return false;
+    //
+    // Only the band of interest is kept if a margin is set
+    //
+    spectrum_samples = samples;
+    if (band_margin >= 0.0) {
+      crop_band(fmin - band_margin, fmax + band_margin);
     }
 
-    freq.resize(samples);
-    sreal.resize(samples);
-    simag.resize(samples);
-    nreal.resize(samples);
-    nimag.resize(samples);
-
     ffirst = samples;
     flast = 0;
     for (int i = 0; i < samples; i ++) {
 
-      
-      if (fscanf(fp, "%lf %lf %lf %lf %lf\n",
-		 &freq[i],
-		 &sreal[i], &simag[i],
-		 &nreal[i], &nimag[i]) != 5) {
-	fprintf(stderr, "error: failed to read spectrum\n");
-	return false;
-      }
-
       if (freq[i] >= fmin && i < ffirst) {
 	ffirst = i;
       }
@@ -95,9 +89,6 @@ public:
 
     }
 
-    fclose(fp);
-
-
     target_phase.resize(freq.size());
     target_error.resize(freq.size());
 
@@ -108,24 +99,133 @@ public:
     return true;
   }
 
-  bool load_phase(const char *filename)
+  //
+  // Only keep the samples from the last at or below fbandmin to the first at or
+  // above fbandmax. Sample i of the cropped spectrum is sample band_first + i of
+  // the spectrum in the file.
+  //
+  void crop_band(double fbandmin, double fbandmax)
   {
-    FILE *fp;
+    int first = 0;
+    while (first < samples - 1 && freq[first + 1] <= fbandmin) {
+      first ++;
+    }
 
-    fp = fopen(filename, "r");
-    if (fp == NULL) {
+    int last = samples - 1;
+    while (last > first && freq[last - 1] >= fbandmax) {
+      last --;
+    }
+
+    crop(freq, first, last);
+    crop(sreal, first, last);
+    crop(simag, first, last);
+    crop(nreal, first, last);
+    crop(nimag, first, last);
+
+    band_first += first;
+    samples = last - first + 1;
+  }
+
+  static void crop(std::vector<double> &v, int first, int last)
+  {
+    std::vector<double>(v.begin() + first, v.begin() + last + 1).swap(v);
+  }
+
+  bool load_binary(const char *filename)
+  {
+    DispersionBinaryFile file;
+    if (!file.open(filename)) {
+      return false;
+    }
+
+    lon1 = file.header->lon1;
+    lat1 = file.header->lat1;
+    lon2 = file.header->lon2;
+    lat2 = file.header->lat2;
+    distkm = file.header->distkm;
+
+    samplerate = file.header->samplerate;
+    daycount = file.header->daycount;
+    asnr = file.header->asnr;
+    csnr = file.header->csnr;
+    samples = file.header->samples;
+
+    freq.assign(file.freq, file.freq + samples);
+    sreal.resize(samples);
+    simag.resize(samples);
+    nreal.resize(samples);
+    nimag.resize(samples);
+
+    for (int i = 0; i < samples; i ++) {
+      sreal[i] = file.spec[2*i];
+      simag[i] = file.spec[2*i + 1];
+      nreal[i] = file.ncf[2*i];
+      nimag[i] = file.ncf[2*i + 1];
+    }
+
+    return true;
+  }
+
+  bool load_text(const char *filename)
+  {
+    TextFile file;
+    if (!file.open(filename)) {
+      fprintf(stderr, "error: failed to open %s for reading\n", filename);
+      return false;
+    }
+
+    if (!(file.read(lon1) && file.read(lat1) &&
+	  file.read(lon2) && file.read(lat2) &&
+	  file.read(distkm))) {
+      fprintf(stderr, "error: failed to parse line 1\n");
+      return false;
+    }
+
+    if (!(file.read(samplerate) && file.read(daycount) &&
+	  file.read(asnr) && file.read(csnr) &&
+	  file.read(samples))) {
+      fprintf(stderr, "error: failed to parse line 2\n");
+      return false;
+    }
+
+    freq.resize(samples);
+    sreal.resize(samples);
+    simag.resize(samples);
+    nreal.resize(samples);
+    nimag.resize(samples);
+
+    for (int i = 0; i < samples; i ++) {
+
+      if (!(file.read(freq[i]) &&
+	    file.read(sreal[i]) && file.read(simag[i]) &&
+	    file.read(nreal[i]) && file.read(nimag[i]))) {
+	fprintf(stderr, "error: failed to read spectrum\n");
+	return false;
+      }
+
+    }
+
+    return true;
+  }
+
+  bool load_phase(const char *filename)
+  {
+    TextFile file;
+    if (!file.open(filename)) {
       fprintf(stderr, "error: failed to open phase file: %s\n", filename);
       return false;
     }
 
-    while (!feof(fp)) {
+    while (!file.eof()) {
 
       double lf, lc;
       int sign, offset;
       double le;
-      
-      if (fscanf(fp, "%lf %lf %d %d %lf\n", &lf, &lc, &sign, &offset, &le) != 5) {
-	if (feof(fp)) {
+
+      if (!(file.read(lf) && file.read(lc) &&
+	    file.read(sign) && file.read(offset) &&
+	    file.read(le))) {
+	if (file.eof()) {
 	  break;
 	} else {
 
@@ -141,7 +241,6 @@ public:
 
     }
 
-    fclose(fp);
     return true;
   }
 
@@ -253,11 +352,11 @@ public:
   double fmin;
   double fmax;
 
+  double band_margin;
+  int band_first;
+  int spectrum_samples;
+
   int ffirst, flast;
-  
-  fftw_plan plan;
-  fftw_complex *fullspec;
-  fftw_complex *fullenv;
 
   std::vector<double> predicted_k;
   std::vector<double> predicted_group;
@@ -33,7 +33,7 @@
 #include "simple.hpp"
 #include "quasinewton.hpp"
 
-static char short_options[] = "i:c:I:C:r:f:F:R:V:X:S:o:s:p:b:t:P:N:e:QWM:T:h";
+static char short_options[] = "i:c:I:C:r:f:F:R:V:X:S:o:s:p:b:t:P:N:e:QWM:T:B:h";
 static struct option long_options[] = {
   {"input-love", required_argument, 0, 'i'},
   {"phase-love", required_argument, 0, 'c'},
@@ -67,6 +67,8 @@ static struct option long_options[] = {
 
   {"thin", required_argument, 0, 'T'},
 
+  {"band-margin", required_argument, 0, 'B'},
+
   {"help", no_argument, 0, 'h'},
   
   {0, 0, 0, 0}
@@ -109,6 +111,7 @@ int main(int argc, char *argv[])
 
   double fmin;
   double fmax;
+  double band_margin;
 
   double threshold;
   int order;
@@ -147,6 +150,7 @@ int main(int argc, char *argv[])
   
   fmin = 1.0/40.0;
   fmax = 1.0/2.0;
+  band_margin = -1.0;
   
   maxiterations = 5;
   epsilon = 1.0;
@@ -319,6 +323,14 @@ int main(int argc, char *argv[])
       }
       break;
 
+    case 'B':
+      band_margin = atof(optarg);
+      if (band_margin < 0.0) {
+	fprintf(stderr, "error: band margin must be 0 or greater\n");
+	return -1;
+      }
+      break;
+
     default:
       fprintf(stderr, "unknown option %c\n", c);
     case 'h':
@@ -357,8 +369,8 @@ int main(int argc, char *argv[])
     return -1;
   }
 
-  DispersionData data_love(fmin, fmax);
-  DispersionData data_rayleigh(fmin, fmax);
+  DispersionData data_love(fmin, fmax, band_margin);
+  DispersionData data_rayleigh(fmin, fmax, band_margin);
 
   if (!data_love.load(input_love)) {
     fprintf(stderr, "error: failed to load love data\n");
@@ -480,6 +492,8 @@ void usage(const char *pname)
           " -f|--frequency <float>          Frequency\n"
           " -s|--scale <float>              Laguerre scaling (initial)\n"
           "\n"
+          " -B|--band-margin <float>        Only keep the spectrum within fmin - margin .. fmax + margin (Hz)\n"
+          "\n"
           " -h|--help                       Show usage information\n"
           "\n",
           pname);
@@ -33,7 +33,7 @@
 #include "simple.hpp"
 #include "quasinewton.hpp"
 
-static char short_options[] = "i:C:r:f:F:R:V:X:S:o:s:p:b:t:P:e:N:QM:h";
+static char short_options[] = "i:C:r:f:F:R:V:X:S:o:s:p:b:t:P:e:N:QM:B:h";
 static struct option long_options[] = {
   {"input", required_argument, 0, 'i'},
   {"phase", required_argument, 0, 'C'},
@@ -63,6 +63,8 @@ static struct option long_options[] = {
   
   {"mode", required_argument, 0, 'M'},
 
+  {"band-margin", required_argument, 0, 'B'},
+
   {"help", no_argument, 0, 'h'},
   
   {0, 0, 0, 0}
@@ -98,6 +100,7 @@ int main(int argc, char *argv[])
 
   double fmin;
   double fmax;
+  double band_margin;
   
   double threshold;
   int order;
@@ -126,6 +129,7 @@ int main(int argc, char *argv[])
 
   fmin = 1.0/40.0;
   fmax = 1.0/2.0;
+  band_margin = -1.0;
 
   order = 5;
   highorder = 5;
@@ -270,6 +274,14 @@ int main(int argc, char *argv[])
       }
       break;
 
+    case 'B':
+      band_margin = atof(optarg);
+      if (band_margin < 0.0) {
+	fprintf(stderr, "error: band margin must be 0 or greater\n");
+	return -1;
+      }
+      break;
+
     default:
       fprintf(stderr, "unknown option %c\n", c);
     case 'h':
@@ -298,7 +310,7 @@ int main(int argc, char *argv[])
     return -1;
   }
 
-  DispersionData data(fmin, fmax);
+  DispersionData data(fmin, fmax, band_margin);
 
   if (!data.load(input_file)) {
     return -1;
@@ -391,6 +403,8 @@ void usage(const char *pname)
           " -f|--frequency <float>          Frequency\n"
           " -s|--scale <float>              Laguerre scaling (initial)\n"
           "\n"
+          " -B|--band-margin <float>        Only keep the spectrum within fmin - margin .. fmax + margin (Hz)\n"
+          "\n"
           " -h|--help                       Show usage information\n"
           "\n",
           pname);
@@ -33,7 +33,7 @@
 #include "simple.hpp"
 #include "quasinewton.hpp"
 
-static char short_options[] = "i:C:r:f:F:R:V:X:S:o:s:p:b:t:P:e:N:QM:T:h";
+static char short_options[] = "i:C:r:f:F:R:V:X:S:o:s:p:b:t:P:e:N:QM:T:B:h";
 static struct option long_options[] = {
   {"input", required_argument, 0, 'i'},
   {"phase", required_argument, 0, 'C'},
@@ -64,6 +64,8 @@ static struct option long_options[] = {
 
   {"thin", required_argument, 0, 'T'},
 
+  {"band-margin", required_argument, 0, 'B'},
+
   {"help", no_argument, 0, 'h'},
   
   {0, 0, 0, 0}
@@ -101,6 +103,7 @@ int main(int argc, char *argv[])
 
   double fmin;
   double fmax;
+  double band_margin;
   
   double threshold;
   int order;
@@ -131,6 +134,7 @@ int main(int argc, char *argv[])
 
   fmin = 1.0/40.0;
   fmax = 1.0/2.0;
+  band_margin = -1.0;
 
   order = 5;
   highorder = 5;
@@ -301,6 +305,14 @@ int main(int argc, char *argv[])
       }
       break;
 
+    case 'B':
+      band_margin = atof(optarg);
+      if (band_margin < 0.0) {
+	fprintf(stderr, "error: band margin must be 0 or greater\n");
+	return -1;
+      }
+      break;
+
     default:
       fprintf(stderr, "unknown option %c\n", c);
     case 'h':
@@ -329,7 +341,7 @@ int main(int argc, char *argv[])
     return -1;
   }
 
-  DispersionData data(fmin, fmax);
+  DispersionData data(fmin, fmax, band_margin);
 
   if (!data.load(input_file)) {
     return -1;
@@ -418,6 +430,8 @@ void usage(const char *pname)
           " -f|--frequency <float>          Frequency\n"
           " -s|--scale <float>              Laguerre scaling (initial)\n"
           "\n"
+          " -B|--band-margin <float>        Only keep the spectrum within fmin - margin .. fmax + margin (Hz)\n"
+          "\n"
           " -h|--help                       Show usage information\n"
           "\n",
           pname);
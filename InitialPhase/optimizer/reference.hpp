@@ -28,6 +28,8 @@
 
 #include "common.hpp"
 
+#include "spec1d/textfile.hpp"
+
 class ReferenceModel
 {
 public:
@@ -39,14 +41,14 @@ public:
   bool load(const char *filename, bool promote, size_t promote_order)
   {
 
-    FILE *fp = fopen(filename, "r");
-    if (fp == NULL) {
+    TextFile file;
+    if (!file.open(filename)) {
       fprintf(stderr, "error: failed to open %s for reading\n", filename);
       return -1;
     }
     
     int nlayers;
-    if (fscanf(fp, "%d\n", &nlayers) != 1) {
+    if (!file.read(nlayers)) {
       fprintf(stderr, "error: failed to read no. layers\n");
       return false;
     }
@@ -57,7 +59,7 @@ public:
       int corder;
       double vs;
       double vsstd;
-      if (fscanf(fp, "%lf %d", &thicknesskm, &corder) != 2) {
+      if (!(file.read(thicknesskm) && file.read(corder))) {
 	fprintf(stderr, "error: failed to read line\n");
 	return false;
       }
@@ -74,7 +76,7 @@ public:
 	
 	if (corder == 0 && promote) {
 
-	  if (fscanf(fp, "%lf", &vs) != 1) {
+	  if (!file.read(vs)) {
 	    fprintf(stderr, "error: failed to read vs\n");
 	    return -1;
 	  }
@@ -96,7 +98,7 @@ public:
 	    model.cells[i].nodes[j] = cell_parameter_t(rho, vs, 1.0, vpvs);
 	  }
 
-	  if (fscanf(fp, "%lf", &vsstd) != 1) {
+	  if (!file.read(vsstd)) {
 	    fprintf(stderr, "error: failed to read vs error\n");
 	    return -1;
 	  }
@@ -112,7 +114,7 @@ public:
 	  
 	  for (int j = 0; j <= corder; j ++) {
 	    
-	    if (fscanf(fp, "%lf", &vs) != 1) {
+	    if (!file.read(vs)) {
 	      fprintf(stderr, "error: failed to read vs\n");
 	      return -1;
 	    }
@@ -126,14 +128,14 @@ public:
 	    model.cells[i].nodes[j] = cell_parameter_t(rho, vs, 1.0, vpvs);
 	  }
 	  
-	  if (fscanf(fp, "%lf", &vsstd) != 1) {
+	  if (!file.read(vsstd)) {
 	    fprintf(stderr, "error: failed to read vs error\n");
 	    return -1;
 	  }
 	}
 	
       } else {
-	if (fscanf(fp, "%lf %lf", &vs, &vsstd) != 2) {
+	if (!(file.read(vs) && file.read(vsstd))) {
 	  fprintf(stderr, "error: failed to read vs\n");
 	  return -1;
 	}
@@ -157,7 +159,6 @@ public:
       }
     }
       
-    fclose(fp);
 
     reference = model;
     return true;
@@ -0,0 +1,214 @@
+import sys
+import os
+import glob
+import argparse
+import multiprocessing
+
+import dispersionfile
+import besselzeros
+import phasepick
+import pickprofile
+
+#
+# Pick initial phase dispersion for many station pairs using a pool of worker
+# processes. Each worker loads the reference curves and Bessel zeros once and
+# writes the same <output-path>/phase_<pair>.love/.rayleigh files as
+# estimate_joint_phase_amplitude.py (or only .rayleigh with --rayleigh-only).
+# With --profile each pair's profile is also written to phase_<pair>.profile.json
+# and the sum over all pairs to <output-path>/profile.json.
+#
+
+#
+# Per worker state, set by initworker
+#
+worker = None
+
+class PickWorker:
+
+    def __init__(self, args):
+
+        self.args = args
+        self.options = phasepick.PickOptions(args.freq_min, args.freq_max, args.filter,
+                                             offset_window = args.offset_window,
+                                             crop = args.crop)
+
+        if args.rayleigh_only:
+            self.lovephaseref = None
+        else:
+            self.lovephaseref = phasepick.load_reference(args.love_reference)
+        self.rayleighphaseref = phasepick.load_reference(args.rayleigh_reference)
+
+    def pick(self, station_pair):
+
+        args = self.args
+        output = os.path.join(args.output_path, 'phase_%s' % station_pair)
+
+        pickprofile.reset_worker()
+
+        if not args.rayleigh_only:
+            lovedata = dispersionfile.dispersionpath(args.path, 'LoveResponse', station_pair)
+            (_, _, _, _, distkm, _), freq, _, _, _, _, lovencf = dispersionfile.loaddispersion(lovedata)
+
+        rayleighdata = dispersionfile.dispersionpath(args.path, 'RayleighResponse', station_pair)
+        (_, _, _, _, distkm, _), freq, _, _, _, _, rayleighncf = dispersionfile.loaddispersion(rayleighdata)
+
+        if args.rayleigh_only:
+
+            rayleighpicks = phasepick.pick_rayleigh((freq, rayleighncf), distkm, self.rayleighphaseref, self.options)
+
+        else:
+
+            lovepicks, rayleighpicks = phasepick.pick_station_pair((freq, lovencf), (freq, rayleighncf), distkm,
+                                                                   (self.lovephaseref, self.rayleighphaseref),
+                                                                   self.options)
+
+            phasepick.save_picks('%s.love' % output, lovepicks)
+
+        phasepick.save_picks('%s.rayleigh' % output, rayleighpicks)
+
+        if args.profile:
+            pickprofile.save('%s.profile.json' % output, {'station_pair' : station_pair})
+
+def initworker(args):
+
+    global worker
+
+    if not args.verbose:
+        #
+        # The picking trace from many workers interleaved is unreadable
+        #
+        sys.stdout = open(os.devnull, 'w')
+
+    if args.profile:
+        pickprofile.enable()
+
+    worker = PickWorker(args)
+
+def runworker(station_pair):
+
+    try:
+        worker.pick(station_pair)
+        return station_pair, None
+    except Exception as e:
+        return station_pair, '%s: %s' % (type(e).__name__, e)
+
+#
+# Station pairs of the dispersion_<pair>.txt/.bin files matching pattern in
+# path/response (in sorted order, a pair may appear twice if both exist)
+#
+def glob_pairs(path, response, pattern):
+
+    pairs = []
+    for fname in sorted(glob.glob(os.path.join(path, response, pattern))):
+        base, ext = os.path.splitext(os.path.basename(fname))
+        if base.startswith('dispersion_') and (ext == '.txt' or ext == '.bin'):
+            pairs.append(base[len('dispersion_'):])
+
+    return pairs
+
+def station_pairs(args):
+
+    pairs = list(args.station_pair)
+
+    if not args.manifest is None:
+        f = open(args.manifest, 'r')
+        for line in f.readlines():
+            line = line.split('#')[0].strip()
+            if len(line) > 0:
+                pairs.append(line)
+        f.close()
+
+    if not args.glob is None:
+        #
+        # Match against the Rayleigh responses as these are needed in both modes
+        #
+        pairs.extend(glob_pairs(args.path, 'RayleighResponse', args.glob))
+
+    #
+    # Remove duplicates (eg both .txt and .bin present) preserving order
+    #
+    unique = []
+    seen = set()
+    for p in pairs:
+        if not p in seen:
+            seen.add(p)
+            unique.append(p)
+
+    return unique
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('station_pair', type = str, nargs = '*', help = 'Station pairs to process')
+
+    parser.add_argument('-m', '--manifest', type = str, default = None, help = 'File listing station pairs, one per line')
+    parser.add_argument('-g', '--glob', type = str, default = None, help = 'Glob of dispersion files to process, eg "dispersion_HOT05_*.txt"')
+
+    parser.add_argument('-p', '--path', type = str, required = True, help = 'Data base path')
+    parser.add_argument('-o', '--output-path', type = str, required = True, help = 'Output directory')
+
+    parser.add_argument('-j', '--jobs', type = int, default = multiprocessing.cpu_count(), help = 'Number of worker processes')
+
+    parser.add_argument('-r', '--love-reference', type = str, default = os.path.join(sys.path[0], '../../tutorial/reference/reference_love_fine.txt'), help = 'Reference Love phase')
+    parser.add_argument('-R', '--rayleigh-reference', type = str, default = os.path.join(sys.path[0], '../../tutorial/reference/reference_rayleigh_fine.txt'), help = 'Reference Rayleigh phase')
+
+    parser.add_argument('-f', '--freq-min', type = float, default = 1.0/40.0, help = 'Min frequency')
+    parser.add_argument('-F', '--freq-max', type = float, default = 0.35, help = 'Max frequency')
+
+    parser.add_argument('--filter', type = float, default = 3, help = 'Filter width')
+
+    parser.add_argument('--crop', action = 'store_true', default = False, help = 'Crop spectra to the band of interest before smoothing and picking')
+
+    parser.add_argument('--offset-window', type = int, default = 0, help = 'Pick all offsets -N..N (step 2) and use the best rather than searching offsets one at a time')
+
+    parser.add_argument('--rayleigh-only', action = 'store_true', default = False, help = 'Pick Rayleigh only (as estimate_rayleigh_phase_amplitude.py)')
+
+    parser.add_argument('--profile', action = 'store_true', default = False, help = 'Record time and calls per picking stage for each pair and in total')
+
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = 'Show picking output of workers')
+
+    args = parser.parse_args()
+
+    pairs = station_pairs(args)
+    if len(pairs) == 0:
+        print('error: no station pairs given')
+        sys.exit(-1)
+
+    if not os.path.isdir(args.output_path):
+        os.makedirs(args.output_path)
+
+    #
+    # Build the Bessel zero table before forking so workers just map it
+    #
+    besselzeros.table()
+
+    jobs = max(1, min(args.jobs, len(pairs)))
+    pool = multiprocessing.Pool(jobs, initworker, (args,))
+
+    failed = []
+    for i, (station_pair, error) in enumerate(pool.imap_unordered(runworker, pairs)):
+        if error is None:
+            sys.stderr.write('%4d/%4d %s\n' % (i + 1, len(pairs), station_pair))
+        else:
+            sys.stderr.write('%4d/%4d %s failed: %s\n' % (i + 1, len(pairs), station_pair, error))
+            failed.append(station_pair)
+
+    pool.close()
+    pool.join()
+
+    if args.profile:
+        profiles = []
+        for station_pair in pairs:
+            fname = os.path.join(args.output_path, 'phase_%s.profile.json' % station_pair)
+            if not station_pair in failed and os.path.exists(fname):
+                profiles.append(pickprofile.load(fname))
+
+        total = pickprofile.aggregate(profiles)
+        print(pickprofile.report(total))
+
+        pickprofile.write(os.path.join(args.output_path, 'profile.json'), total)
+
+    if len(failed) > 0:
+        print('%d of %d station pairs failed: %s' % (len(failed), len(pairs), ' '.join(failed)))
+        sys.exit(-1)
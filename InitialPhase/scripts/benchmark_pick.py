@@ -0,0 +1,201 @@
+import sys
+import os
+import time
+import argparse
+import multiprocessing
+
+import numpy
+
+import dispersionfile
+import besselzeros
+import phasepick
+import synthetic_dispersion
+
+#
+# Picking throughput and accuracy on a synthetic data set written by
+# synthetic_dispersion.py. Every pair of the data set (or the first --limit) is
+# picked with a pool of worker processes as batch_pick.py does and the picks are
+# compared to the known true phase velocity. Reported are the pairs picked per
+# second and, per wave type and distance, the median RMS relative error of the
+# picks and the fraction of pairs whose error is within the tolerance (a cycle
+# skip gives an error of a few percent or more).
+#
+
+#
+# Per worker state, set by initworker
+#
+worker = None
+
+class BenchmarkWorker:
+
+    def __init__(self, args):
+
+        self.args = args
+        self.options = phasepick.PickOptions(args.freq_min, args.freq_max, args.filter,
+                                             offset_window = args.offset_window,
+                                             crop = args.crop)
+
+        self.lovephaseref = phasepick.load_reference(args.love_reference)
+        self.rayleighphaseref = phasepick.load_reference(args.rayleigh_reference)
+
+    def pick(self, entry):
+
+        args = self.args
+        station_pair, distkm, noise, lovescale, rayleighscale = entry
+
+        t0 = time.time()
+
+        rayleighdata = dispersionfile.dispersionpath(args.path, 'RayleighResponse', station_pair)
+        _, freq, _, _, _, _, rayleighncf = dispersionfile.loaddispersion(rayleighdata, cache = False)
+
+        if args.rayleigh_only:
+
+            rayleighpicks = phasepick.pick_rayleigh((freq, rayleighncf), distkm, self.rayleighphaseref, self.options)
+            picks = [('Rayleigh', rayleighpicks, self.rayleighphaseref, rayleighscale)]
+
+        else:
+
+            lovedata = dispersionfile.dispersionpath(args.path, 'LoveResponse', station_pair)
+            _, _, _, _, _, _, lovencf = dispersionfile.loaddispersion(lovedata, cache = False)
+
+            lovepicks, rayleighpicks = phasepick.pick_station_pair((freq, lovencf), (freq, rayleighncf), distkm,
+                                                                   (self.lovephaseref, self.rayleighphaseref),
+                                                                   self.options)
+            picks = [('Love', lovepicks, self.lovephaseref, lovescale),
+                     ('Rayleigh', rayleighpicks, self.rayleighphaseref, rayleighscale)]
+
+        seconds = time.time() - t0
+
+        errors = []
+        for name, p, phaseref, scale in picks:
+            truth = synthetic_dispersion.load_truth(phaseref, scale)
+            p = p[(p['f'] >= truth.x[0]) & (p['f'] <= truth.x[-1])]
+            if p.size == 0:
+                errors.append((name, 0, numpy.inf, 0.0))
+            else:
+                ct = truth(p['f'])
+                relative = numpy.abs(p['c'] - ct)/ct
+                errors.append((name, p.size, phasepick.reference_misfit(p, truth),
+                               numpy.mean(relative < args.tolerance)))
+
+        return seconds, errors
+
+def initworker(args):
+
+    global worker
+
+    if not args.verbose:
+        sys.stdout = open(os.devnull, 'w')
+
+    worker = BenchmarkWorker(args)
+
+def runworker(entry):
+
+    try:
+        seconds, errors = worker.pick(entry)
+        return entry, seconds, errors, None
+    except Exception as e:
+        return entry, 0.0, None, '%s: %s' % (type(e).__name__, e)
+
+def summary(results, tolerance):
+
+    #
+    # Median error and fraction within tolerance per wave type and distance
+    #
+    rows = {}
+    for (station_pair, distkm, _, _, _), seconds, errors, error in results:
+        if error is None:
+            for name, n, rms, within in errors:
+                rows.setdefault((name, distkm), []).append(rms)
+                rows.setdefault((name, None), []).append(rms)
+
+    lines = ['  %-10s %10s %6s %15s %10s' % ('wave', 'distkm', 'pairs', 'median error', 'correct')]
+    for (name, distkm), rms in sorted(rows.items(), key = lambda r: (r[0][0], r[0][1] is None, r[0][1])):
+        rms = numpy.array(rms)
+        if distkm is None:
+            d = 'all'
+        else:
+            d = '%.1f' % distkm
+        lines.append('  %-10s %10s %6d %15.6f %10.3f' % (name, d, rms.size, numpy.median(rms), numpy.mean(rms < tolerance)))
+
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-p', '--path', type = str, required = True, help = 'Synthetic data set path (see synthetic_dispersion.py)')
+
+    parser.add_argument('-n', '--limit', type = int, default = 0, help = 'Only pick the first n pairs (0 for all)')
+
+    parser.add_argument('-j', '--jobs', type = int, default = multiprocessing.cpu_count(), help = 'Number of worker processes')
+
+    parser.add_argument('-r', '--love-reference', type = str, default = os.path.join(sys.path[0], '../../tutorial/reference/reference_love_fine.txt'), help = 'Reference Love phase')
+    parser.add_argument('-R', '--rayleigh-reference', type = str, default = os.path.join(sys.path[0], '../../tutorial/reference/reference_rayleigh_fine.txt'), help = 'Reference Rayleigh phase')
+
+    parser.add_argument('-f', '--freq-min', type = float, default = 1.0/40.0, help = 'Min frequency')
+    parser.add_argument('-F', '--freq-max', type = float, default = 0.35, help = 'Max frequency')
+
+    parser.add_argument('--filter', type = float, default = 3, help = 'Filter width')
+
+    parser.add_argument('--crop', action = 'store_true', default = False, help = 'Crop spectra to the band of interest before smoothing and picking')
+
+    parser.add_argument('--offset-window', type = int, default = 0, help = 'Pick all offsets -N..N (step 2) and use the best rather than searching offsets one at a time')
+
+    parser.add_argument('--rayleigh-only', action = 'store_true', default = False, help = 'Pick Rayleigh only')
+
+    parser.add_argument('-t', '--tolerance', type = float, default = 0.01, help = 'Relative phase velocity error for a pick (or pair) to count as correct')
+
+    parser.add_argument('-o', '--output', type = str, default = None, help = 'Output per pair timing and errors')
+
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = 'Show picking output of workers')
+
+    args = parser.parse_args()
+
+    pairs = synthetic_dispersion.load_manifest(args.path)
+    if args.limit > 0:
+        pairs = pairs[:args.limit]
+
+    if len(pairs) == 0:
+        print('error: no station pairs in %s' % args.path)
+        sys.exit(-1)
+
+    besselzeros.table()
+
+    jobs = max(1, min(args.jobs, len(pairs)))
+    pool = multiprocessing.Pool(jobs, initworker, (args,))
+
+    t0 = time.time()
+    results = []
+    for i, result in enumerate(pool.imap_unordered(runworker, pairs)):
+        results.append(result)
+        if (i + 1) % 100 == 0 or i + 1 == len(pairs):
+            sys.stderr.write('%6d/%6d\n' % (i + 1, len(pairs)))
+    seconds = time.time() - t0
+
+    pool.close()
+    pool.join()
+
+    failed = [entry[0] for entry, _, _, error in results if not error is None]
+    picked = len(results) - len(failed)
+    pickseconds = sum([s for _, s, _, error in results if error is None])
+
+    print('Pairs: %d picked, %d failed, %d jobs' % (picked, len(failed), jobs))
+    print('Throughput: %.2f pairs/s (%.3f s per pair per job)' % (len(results)/seconds, pickseconds/max(picked, 1)))
+    print('Accuracy (error is the RMS relative phase velocity error, correct within %g):' % args.tolerance)
+    print(summary(results, args.tolerance))
+
+    if not args.output is None:
+
+        f = open(args.output, 'w')
+        f.write('# pair distkm noise seconds [wave picks error within]...\n')
+        for (station_pair, distkm, noise, _, _), s, errors, error in sorted(results):
+            if error is None:
+                f.write('%s %10.3f %10.6f %10.6f %s\n' % (station_pair, distkm, noise, s,
+                                                          ' '.join(['%s %d %15.9f %10.6f' % e for e in errors])))
+            else:
+                f.write('%s %10.3f %10.6f failed %s\n' % (station_pair, distkm, noise, error))
+        f.close()
+
+    if len(failed) > 0:
+        print('Failed: %s' % ' '.join(failed))
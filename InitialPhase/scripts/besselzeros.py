@@ -0,0 +1,87 @@
+#
+# Tables of the first TABLE_SIZE positive zeros of J0 and J1 used by the
+# picking scripts and estimaterepair.
+#
+# The zeros are computed with scipy.special.jn_zeros on first use and stored
+# as a (2, TABLE_SIZE) float64 .npy file (row 0 J0, row 1 J1). Subsequent
+# loads memory map the file read only so that worker processes share the
+# same pages rather than each recomputing the table. The location defaults
+# to besselzeros_<TABLE_SIZE>.npy alongside this module and can be changed
+# with the AKI_BESSEL_ZEROS environment variable.
+#
+import os
+
+import numpy
+
+TABLE_SIZE = 1024
+
+_table = None
+
+def tablepath():
+
+    path = os.environ.get('AKI_BESSEL_ZEROS')
+    if path is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'besselzeros_%d.npy' % TABLE_SIZE)
+
+    return path
+
+def compute():
+
+    import scipy.special
+
+    return numpy.array([scipy.special.jn_zeros(0, TABLE_SIZE),
+                        scipy.special.jn_zeros(1, TABLE_SIZE)])
+
+def save(fname, table):
+
+    #
+    # Write to a temporary and rename so that concurrent first runs never see
+    # a partial table
+    #
+    tmpname = '%s.tmp%d' % (fname, os.getpid())
+    try:
+        fp = open(tmpname, 'wb')
+        numpy.save(fp, table)
+        fp.close()
+        os.rename(tmpname, fname)
+
+    except (IOError, OSError):
+        #
+        # Read only installation, the table is just recomputed per process
+        #
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+
+def load(fname):
+
+    try:
+        table = numpy.load(fname, mmap_mode = 'r')
+    except (IOError, OSError, ValueError):
+        return None
+
+    if table.shape != (2, TABLE_SIZE) or table.dtype != numpy.float64:
+        return None
+
+    return table
+
+def table():
+
+    global _table
+
+    if _table is None:
+        fname = tablepath()
+        t = load(fname)
+        if t is None:
+            t = compute()
+            save(fname, t)
+
+        _table = t
+
+    return _table
+
+def j0zeros():
+    return table()[0]
+
+def j1zeros():
+    return table()[1]
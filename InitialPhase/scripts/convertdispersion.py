@@ -0,0 +1,40 @@
+import os
+import argparse
+
+import dispersionfile
+
+#
+# Convert text dispersion_<pair>.txt files to the binary format read by both
+# the picking scripts and the optimizers (see dispersionfile.py for the layout).
+#
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('input', type = str, nargs = '+', help = 'Input text dispersion files')
+
+    parser.add_argument('-o', '--output-path', type = str, default = None, help = 'Output directory (default alongside input)')
+    parser.add_argument('-f', '--force', action = 'store_true', default = False, help = 'Overwrite existing binary files')
+
+    args = parser.parse_args()
+
+    for fname in args.input:
+
+        if dispersionfile.isbinary(fname):
+            print('Skipping %s: already binary' % fname)
+            continue
+
+        base, _ = os.path.splitext(os.path.basename(fname))
+        if args.output_path is None:
+            outname = os.path.join(os.path.dirname(fname), base + '.bin')
+        else:
+            outname = os.path.join(args.output_path, base + '.bin')
+
+        if os.path.exists(outname) and not args.force:
+            print('Skipping %s: %s exists' % (fname, outname))
+            continue
+
+        header, f, samplerate, acsn, csn, spec, ncf = dispersionfile.loaddispersion_text(fname)
+        dispersionfile.savedispersion_binary(outname, header, f, samplerate, acsn, csn, spec, ncf)
+
+        print('%s -> %s' % (fname, outname))
@@ -0,0 +1,254 @@
+#
+# Reading and writing of dispersion_<pair> spectrum files.
+#
+# Two formats are supported and detected automatically on load:
+#
+# Text (dispersion_<pair>.txt), as written by the cross-correlation codes
+#
+#   slon slat dlon dlat distkm
+#   samplerate daycount acsn csn N
+#   f spec_real spec_imag ncf_real ncf_imag      (N lines)
+#
+# Binary (dispersion_<pair>.bin), little endian, a fixed 88 byte header
+#
+#   offset  type        field
+#        0  char[8]     magic "AKISPEC1"
+#        8  int32       version (1)
+#       12  int32       N, number of frequency samples
+#       16  float64[4]  slon, slat, dlon, dlat
+#       48  float64     distkm
+#       56  float64     samplerate
+#       64  int32       daycount
+#       68  int32       reserved (0)
+#       72  float64     acsn
+#       80  float64     csn
+#
+# followed by contiguous arrays
+#
+#       88  float64[N]      frequency
+#   88 + 8N complex128[N]   spectrum (real, imaginary interleaved)
+#  88 + 24N complex128[N]   noise correlation function (real, imaginary interleaved)
+#
+# The binary arrays are returned as read only numpy.memmap's so that only the
+# pages actually used are read from disk.
+#
+# Parsed text files are cached in a dispersion_<pair>.txt.npz sidecar keyed on
+# the modification time and size of the text file, so that reloading a pair
+# (replotting, repicking) does not reparse the text.
+#
+import os
+import struct
+import sys
+
+import numpy
+
+MAGIC = b'AKISPEC1'
+VERSION = 1
+
+HEADER_FORMAT = '<8sii4dddii2d'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+def isbinary(fname):
+
+    f = open(fname, 'rb')
+    magic = f.read(len(MAGIC))
+    f.close()
+
+    return magic == MAGIC
+
+def dispersionpath(path, response, station_pair):
+
+    #
+    # Prefer the binary version of a station pair if one has been converted
+    # and the text file has not been rewritten since
+    #
+    base = os.path.join(path, response, 'dispersion_%s' % station_pair)
+    return preferredpath(base + '.txt')
+
+def preferredpath(fname):
+
+    #
+    # The binary or text version of a dispersion_<pair> file, whichever is
+    # current: the .bin if it exists and is no older than the .txt (or there
+    # is no .txt), otherwise the .txt with a warning if a stale .bin exists
+    #
+    base, ext = os.path.splitext(fname)
+    if not ext in ('.txt', '.bin'):
+        return fname
+
+    binname = base + '.bin'
+    txtname = base + '.txt'
+    if not os.path.exists(binname):
+        return txtname
+
+    if not os.path.exists(txtname) or os.path.getmtime(binname) >= os.path.getmtime(txtname):
+        return binname
+
+    sys.stderr.write('warning: %s is older than %s, using the text file\n' % (binname, txtname))
+    return txtname
+
+def loaddispersion_text(fname):
+
+    f = open(fname, 'r')
+    slon, slat, dlon, dlat, distkm = map(float, f.readline().split())
+    freq, count, acsn, csn, N = map(float, f.readline().split())
+
+    #
+    # Single pass parse of the remaining columns f, spec r/i, ncf r/i
+    #
+    data = numpy.fromstring(f.read(), sep = ' ')
+    f.close()
+
+    if data.size != int(N) * 5:
+        raise Exception('Expected %d spectrum samples in %s, got %d values' % (int(N), fname, data.size))
+    data = data.reshape((int(N), 5))
+
+    spec = data[:,1] + data[:,2]*1.0j
+    ncf = data[:,3] + data[:,4]*1.0j
+    return (slon, slat, dlon, dlat, distkm, int(count)), data[:,0].copy(), freq, acsn, csn, spec, ncf
+
+def cachename(fname):
+
+    return fname + '.npz'
+
+def cachekey(fname):
+
+    st = os.stat(fname)
+    return numpy.array([st.st_mtime, float(st.st_size)])
+
+def loaddispersion_cache(fname):
+
+    cname = cachename(fname)
+    if not os.path.exists(cname):
+        return None
+
+    try:
+        cache = numpy.load(cname)
+        try:
+            if not numpy.array_equal(cache['key'], cachekey(fname)):
+                return None
+
+            slon, slat, dlon, dlat, distkm, count = map(float, cache['header'])
+            freq, acsn, csn = map(float, cache['scalars'])
+            return (slon, slat, dlon, dlat, distkm, int(count)), cache['f'], freq, acsn, csn, cache['spec'], cache['ncf']
+        finally:
+            cache.close()
+
+    except (IOError, OSError, KeyError, ValueError):
+        #
+        # Corrupt or old cache, will be rebuilt
+        #
+        return None
+
+def savedispersion_cache(fname, header, f, freq, acsn, csn, spec, ncf):
+
+    cname = cachename(fname)
+    tmpname = '%s.tmp%d' % (cname, os.getpid())
+    try:
+        fp = open(tmpname, 'wb')
+        numpy.savez(fp,
+                    key = cachekey(fname),
+                    header = numpy.array(header, dtype = 'float'),
+                    scalars = numpy.array([freq, acsn, csn]),
+                    f = f,
+                    spec = spec,
+                    ncf = ncf)
+        fp.close()
+        os.rename(tmpname, cname)
+
+    except (IOError, OSError):
+        #
+        # Read only data directories are fine, just no caching
+        #
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+
+def loaddispersion_binary(fname):
+
+    f = open(fname, 'rb')
+    header = f.read(HEADER_SIZE)
+    f.close()
+
+    if len(header) != HEADER_SIZE:
+        raise Exception('Truncated header in %s' % fname)
+
+    magic, version, N, slon, slat, dlon, dlat, distkm, freq, count, _, acsn, csn = struct.unpack(HEADER_FORMAT, header)
+    if magic != MAGIC:
+        raise Exception('Not a binary dispersion file: %s' % fname)
+    if version != VERSION:
+        raise Exception('Unsupported binary dispersion version %d: %s' % (version, fname))
+
+    expected = HEADER_SIZE + N*(8 + 16 + 16)
+    if os.path.getsize(fname) != expected:
+        raise Exception('Size mismatch in %s, expected %d bytes' % (fname, expected))
+
+    offset = HEADER_SIZE
+    f = numpy.memmap(fname, dtype = '<f8', mode = 'r', offset = offset, shape = (N,))
+    offset = offset + 8*N
+    spec = numpy.memmap(fname, dtype = '<c16', mode = 'r', offset = offset, shape = (N,))
+    offset = offset + 16*N
+    ncf = numpy.memmap(fname, dtype = '<c16', mode = 'r', offset = offset, shape = (N,))
+
+    return (slon, slat, dlon, dlat, distkm, count), f, freq, acsn, csn, spec, ncf
+
+def loaddispersion(fname, cache = True):
+
+    if isbinary(fname):
+        return loaddispersion_binary(fname)
+
+    if cache:
+        result = loaddispersion_cache(fname)
+        if not result is None:
+            return result
+
+    result = loaddispersion_text(fname)
+    if cache:
+        savedispersion_cache(fname, *result)
+
+    return result
+
+def savedispersion_binary(fname, header, f, samplerate, acsn, csn, spec, ncf):
+
+    slon, slat, dlon, dlat, distkm, count = header
+    N = len(f)
+    if len(spec) != N or len(ncf) != N:
+        raise Exception('Spectrum length mismatch')
+
+    #
+    # Write to a temporary and rename so that readers never see a partial file
+    #
+    tmpname = '%s.tmp%d' % (fname, os.getpid())
+    fp = open(tmpname, 'wb')
+    fp.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, N,
+                         slon, slat, dlon, dlat, distkm,
+                         samplerate, int(count), 0,
+                         acsn, csn))
+    fp.write(numpy.ascontiguousarray(f, dtype = '<f8').tobytes())
+    fp.write(numpy.ascontiguousarray(spec, dtype = '<c16').tobytes())
+    fp.write(numpy.ascontiguousarray(ncf, dtype = '<c16').tobytes())
+    fp.close()
+
+    os.rename(tmpname, fname)
+
+def savedispersion_text(fname, header, f, samplerate, acsn, csn, spec, ncf):
+
+    slon, slat, dlon, dlat, distkm, count = header
+    N = len(f)
+    if len(spec) != N or len(ncf) != N:
+        raise Exception('Spectrum length mismatch')
+
+    #
+    # Same layout (and precision) as written by the cross-correlation codes
+    #
+    lines = ['%15.9f %15.9f %15.9f %15.9f %15.9f' % (slon, slat, dlon, dlat, distkm),
+             '%10.6f %d %15.9f %15.9f %d' % (samplerate, int(count), acsn, csn, N)]
+    lines.extend(['%10.6f %16.9e %16.9e %16.9e %16.9e' % row for row in
+                  zip(f, numpy.real(spec), numpy.imag(spec), numpy.real(ncf), numpy.imag(ncf))])
+
+    tmpname = '%s.tmp%d' % (fname, os.getpid())
+    fp = open(tmpname, 'w')
+    fp.write('\n'.join(lines))
+    fp.write('\n')
+    fp.close()
+
+    os.rename(tmpname, fname)
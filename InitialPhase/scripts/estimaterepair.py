@@ -2,16 +2,19 @@
 import numpy
 import scipy.special
 
+import besselzeros
+import uniforminterp
+
 #
 # Predict next linear
 #
 def predict_next_linear(f, c, zero, distkm, cref):
     h = 0.001
 
-    if ((f - h) < numpy.min(cref.x) or (f + h) > numpy.max(cref.x)):
+    if ((f - h) < cref.x[0] or (f + h) > cref.x[-1]):
         return -1.0, 0.0
     
-    dcdf = (cref(f + h) - cref(f - h))/(2.0*h)
+    dcdf = cref.dcdf(f, h)
 
     fnext = ((c - f*dcdf)*zero)/(2.0*numpy.pi*distkm - dcdf*zero)
     cnext = 2.0*numpy.pi*fnext*distkm/zero
@@ -20,10 +23,29 @@ def predict_next_linear(f, c, zero, distkm, cref):
 
     return fnext, cnext
 
+#
+# Coefficients (x^2, x, 1) of the quadratic through (f, c) with slope dcdf at f
+# and through (flin, c2), ie the solution of
+#
+#   [ f^2     f    1 ] [ q0 ]   [ c    ]
+#   [ flin^2  flin 1 ] [ q1 ] = [ c2   ]
+#   [ 2f      1    0 ] [ q2 ]   [ dcdf ]
+#
+# in closed form, works elementwise on arrays.
+#
+def quadratic_fit(f, c, flin, c2, dcdf):
+
+    df = flin - f
+    q0 = (c2 - c - dcdf*df)/(df*df)
+    q1 = dcdf - 2.0*q0*f
+    q2 = c - dcdf*f + q0*f*f
+
+    return q0, q1, q2
+
 def predict_next(f, c, zero, distkm, cref):
     h = 0.001
 
-    if ((f - h) < numpy.min(cref.x) or (f + h) > numpy.max(cref.x)):
+    if ((f - h) < cref.x[0] or (f + h) > cref.x[-1]):
         return -1.0, 0.0
     
     flin, clin = predict_next_linear(f, c, zero, distkm, cref)
@@ -34,16 +56,12 @@ def predict_next(f, c, zero, distkm, cref):
     
     c2 = cref(flin) + dc
     
-    dcdf = (cref(f + h) - cref(f - h))/(2.0*h)
+    dcdf = cref.dcdf(f, h)
 
     if (numpy.abs(f - flin) < 1.0e-9):
         return flin, clin
     
-    A = numpy.array([[f*f, f, 1.0],
-                     [flin*flin, flin, 1.0],
-                     [2.0*f, 1.0, 0]])
-    b = numpy.array([c, c2, dcdf])
-    q = numpy.linalg.solve(A, b)
+    q = quadratic_fit(f, c, flin, c2, dcdf)
 
     factor = zero/(2.0*numpy.pi*distkm)
     qa = factor * q[0]
@@ -109,6 +127,92 @@ def predict_next(f, c, zero, distkm, cref):
         
     
 
+#
+# predict_next for arrays of f, c and zero (broadcast together). The same
+# arithmetic applied elementwise, with the root chosen by masks rather than
+# branches, so each element is identical to the scalar prediction. Elements
+# outside the reference return (-1, 0) as predict_next does.
+#
+def predict_next_batch(f, c, zero, distkm, cref):
+    h = 0.001
+
+    f, c, zero = numpy.broadcast_arrays(numpy.asarray(f, dtype = 'float'),
+                                        numpy.asarray(c, dtype = 'float'),
+                                        numpy.asarray(zero, dtype = 'float'))
+    shape = f.shape
+    f = f.ravel()
+    c = c.ravel()
+    zero = zero.ravel()
+
+    fnext = numpy.full(f.size, -1.0)
+    cnext = numpy.zeros(f.size)
+
+    i = numpy.where(((f - h) >= cref.x[0]) & ((f + h) <= cref.x[-1]))[0]
+    f = f[i]
+    c = c[i]
+    zero = zero[i]
+
+    dcdf = cref.dcdf(f, h)
+    flin = ((c - f*dcdf)*zero)/(2.0*numpy.pi*distkm - dcdf*zero)
+    clin = 2.0*numpy.pi*flin*distkm/zero
+
+    k = numpy.where((flin >= cref.x[0]) & (flin <= cref.x[-1]))[0]
+    i, f, c, zero, dcdf, flin, clin = [a[k] for a in (i, f, c, zero, dcdf, flin, clin)]
+
+    c2 = cref(flin) + (c - cref(f))
+
+    linear = numpy.abs(f - flin) < 1.0e-9
+    fnext[i[linear]] = flin[linear]
+    cnext[i[linear]] = clin[linear]
+
+    k = numpy.where(~linear)[0]
+    i, f, c, zero, dcdf, flin, c2 = [a[k] for a in (i, f, c, zero, dcdf, flin, c2)]
+
+    q0, q1, q2 = quadratic_fit(f, c, flin, c2, dcdf)
+
+    factor = zero/(2.0*numpy.pi*distkm)
+    qa = factor * q0
+    qb = q1*factor - 1.0
+    qc = q2*factor
+
+    qd = qb*qb - 4.0*qa*qc
+    if numpy.any(qd < 0.0):
+        raise Exception('No solution')
+
+    qd = numpy.sqrt(qd)
+    f1 = (-qb - qd)/(2.0*qa)
+    f2 = (-qb + qd)/(2.0*qa)
+
+    #
+    # Going down (flin < f) the root below f nearest to it, going up the root
+    # above f nearest to it, either root if it is f itself
+    #
+    near1 = numpy.abs(f1 - f) < 1.0e-9
+    near2 = ~near1 & (numpy.abs(f2 - f) < 1.0e-9)
+    rest = ~(near1 | near2)
+    down = flin < f
+
+    between12 = (f1 < f) & (f2 > f)
+    between21 = (f2 < f) & (f1 > f)
+    below = (f1 < f) & (f2 < f)
+    above = (f1 > f) & (f2 > f)
+
+    first = near1 | (rest & down & (between12 | (below & (f1 > f2)))) | \
+            (rest & ~down & (between21 | (above & (f1 < f2))))
+    second = near2 | (rest & down & (between21 | (below & ~(f1 > f2)))) | \
+             (rest & ~down & (between12 | (above & ~(f1 < f2))))
+
+    unhandled = ~(first | second)
+    if numpy.any(unhandled):
+        j = numpy.where(unhandled)[0][0]
+        raise Exception('Unhandled %.15e : %.15e %f' % (f[j], f1[j], f2[j]))
+
+    fn = numpy.where(first, f1, f2)
+    fnext[i] = fn
+    cnext[i] = 2.0*numpy.pi*fn*distkm/zero
+
+    return fnext.reshape(shape), cnext.reshape(shape)
+        
 #
 # Given peaks/troughs and offset, determine the next peak/trough starting
 # at i in batches. If it looks like a peak/trough has been missed, add one
@@ -479,11 +583,10 @@ def fix_backward(f0, j1zeros, batches, distkm, phaseref):
 if __name__ == '__main__':
 
     import numpy
-    import scipy.interpolate
     loveref = numpy.loadtxt('../Reference/reference/reference_love_fine.txt', skiprows = 1)
-    loveref = scipy.interpolate.interp1d(loveref[:,0], loveref[:,1]/1.0e3)
+    loveref = uniforminterp.UniformInterp1d(loveref[:,0], loveref[:,1]/1.0e3)
     
-    j1zeros = scipy.special.jn_zeros(1, 500)
+    j1zeros = besselzeros.j1zeros()[:500]
 
     offset = 0
     f = 0.10
@@ -0,0 +1,2217 @@
+#
+# Phase picking routines shared by estimate_joint_phase_amplitude.py,
+# estimate_rayleigh_phase_amplitude.py and batch_pick.py. pick_station_pair and
+# pick_rayleigh pick from in memory spectra for use from other Python code.
+#
+import os
+import sys
+import multiprocessing
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import numpy
+
+import scipy.interpolate
+import scipy.ndimage
+
+import besselzeros
+import dispersionfile
+import estimaterepair
+import pickprofile
+import uniforminterp
+
+MAX_GRADIENT_DEVIATION = 5.0
+
+WINDOW_HALF_WIDTH = 0.5
+
+#
+# Number of trial offsets either side evaluated together when searching for the
+# reference trough nearest the first detected trough
+#
+OFFSET_SEARCH_BLOCK = 8
+
+#
+# Frequency range searched for the first (largest) peak/trough
+#
+START_FMIN = 0.075
+START_FMAX = 0.2
+
+#
+# Number of extremum spacings beyond the picking range kept when cropping to the
+# band of interest (see crop_band)
+#
+BAND_SPACINGS = 4.0
+
+class bcolors:
+    HEADER = '\033[95m'
+    OKBLUE = '\033[94m'
+    OKGREEN = '\033[92m'
+    WARNING = '\033[93m'
+    FAIL = '\033[91m'
+    ENDC = '\033[0m'
+    BOLD = '\033[1m'
+    UNDERLINE = '\033[4m'
+    
+def validate(points, phaseref):
+
+    s, f, c, o = zip(*points)
+
+    p = numpy.poly1d(numpy.polyfit(f, c, 2))
+    pd = p.deriv()
+
+    if (numpy.max(c) > 6.0):
+        print(bcolors.FAIL + '  Invalid: maxium phase: ' + bcolors.ENDC, numpy.max(c))
+        return False, 2
+
+    return True, 0
+
+def find_reference_troughs(zeros, distkm, freq, cref):
+
+    #
+    # For each zero, the frequency bin within the reference range where
+    # freq - cref(freq)*zero/(2 pi d) is closest to zero, evaluated for all zeros
+    # at once as a (zeros x bins) array
+    #
+    f0 = cref.x[0]
+    fl = cref.x[-1]
+
+    i0 = numpy.where(freq >= f0)[0][0]
+    i1 = max(numpy.searchsorted(freq, fl, 'right'), i0 + 1)
+
+    f = freq[i0:i1]
+    A = numpy.asarray(zeros)/(2.0 * numpy.pi * distkm)
+
+    res = f[numpy.newaxis,:] - cref(f)[numpy.newaxis,:] * A[:,numpy.newaxis]
+    j = numpy.abs(res).argmin(axis = 1)
+
+    return i0 + j, f[j], res[numpy.arange(j.size), j]
+
+def find_reference_trough(zero, distkm, freq, cref):
+
+    fi, f, res = find_reference_troughs([zero], distkm, freq, cref)
+
+    return fi[0], f[0], res[0]
+
+def reference_offset_block(j1zeros, offset0, offset1, distkm, freq, f, cref):
+
+    #
+    # Reference trough frequency and distance from f for every other offset in
+    # [offset0, offset1]
+    #
+    offsets = numpy.arange(offset0, offset1 + 1, 2)
+    offsets = offsets[(offsets >= 0) & (offsets < len(j1zeros))]
+    _, fref, _ = find_reference_troughs(j1zeros[offsets], distkm, freq, cref)
+
+    return offsets, fref, numpy.abs(f - fref)
+
+def estimate_first_trough_offset(j1zeros, points, distkm, freq, signal, cref):
+
+    maxamplitude = numpy.max(numpy.abs(signal))
+    ampthreshold = maxamplitude * 0.25
+
+    #
+    # Find first trough
+    #
+    for i, (s, f, c, o) in enumerate(points):
+        if s == -1:
+
+            ai = numpy.abs(f - freq).argmin()
+            if signal[ai] < -ampthreshold:
+                break
+
+    #
+    # Extra check: if first trough is higher frequency, reduce threshold
+    # to try and get one closer to f = 0
+    #
+    if (f > 0.10):
+        ampthreshold = maxamplitude * 0.10
+        #
+        # Find first trough
+        #
+        for i, (s, f, c, o) in enumerate(points):
+            if s == -1:
+                
+                ai = numpy.abs(f - freq).argmin()
+                if signal[ai] < -ampthreshold:
+                    break
+        
+            
+
+    #
+    # Esimate next, from the picked and the reference phase velocity together
+    #
+    refc = cref(f)
+    (est_nextzf, refest_nextzf), _ = estimaterepair.predict_next_batch(f, [c, refc], j1zeros[o + 2],
+                                                                        distkm, cref)
+
+    #
+    #
+    #
+    width = est_nextzf - f
+    n = numpy.floor((f - width/2.0)/width)
+    tf = f - (float(n) * width)
+
+    print('  First detected trough at: %15.9f %d' % (f, o))
+    print('  First estimated trough  : %15.9f %d' % (tf, o - n*2))
+
+    orig = float(o)/2.0 * width + width/2.0
+    print('  Origin est              : %15.9f %15.9f' % (f - orig, (f - orig)/width))
+    
+    #
+    # Estimate using reference
+    #
+    width = est_nextzf - f
+    n = numpy.floor((f - width/2.0)/width)
+    tf = f - (float(n) * width)
+
+    print('  First estimated trough r: %15.9f %d' % (tf, o - n*2))
+
+    best_offset = o
+    offsets, frefs, dists = reference_offset_block(j1zeros,
+                                                   best_offset - 2*OFFSET_SEARCH_BLOCK,
+                                                   best_offset + 2*OFFSET_SEARCH_BLOCK,
+                                                   distkm, freq, f, cref)
+    k = (best_offset - offsets[0])//2
+    fref = frefs[k]
+    best_dist = dists[k]
+
+    score = best_dist
+    delta_offset = 0
+    
+    print('  Reference offset pred: %15.9f %15.9f %15.9f' % (f, fref, best_dist))
+
+    if (f > fref):
+        # Try +ve offsets
+        step = 2
+        direction = 'up'
+    else:
+        # Try -ve offsets
+        step = -2
+        direction = 'dn'
+
+    trial_offset = best_offset + step
+    trial_dist = 1e9
+    while trial_offset >= 0 and trial_offset < len(j1zeros):
+
+        k = (trial_offset - offsets[0])//2
+        if k < 0 or k >= offsets.size:
+            #
+            # Walked off the evaluated block, evaluate the next one
+            #
+            if step > 0:
+                offsets, frefs, dists = reference_offset_block(j1zeros,
+                                                               trial_offset,
+                                                               trial_offset + 2*(OFFSET_SEARCH_BLOCK - 1),
+                                                               distkm, freq, f, cref)
+            else:
+                offsets, frefs, dists = reference_offset_block(j1zeros,
+                                                               trial_offset - 2*(OFFSET_SEARCH_BLOCK - 1),
+                                                               trial_offset,
+                                                               distkm, freq, f, cref)
+            k = (trial_offset - offsets[0])//2
+
+        fref = frefs[k]
+        trial_dist = dists[k]
+
+        print('    %s Trial offset pred: %d %15.9f %15.9f' % (direction, trial_offset, fref, trial_dist))
+        if (trial_dist < best_dist):
+            best_offset = trial_offset
+            best_dist = trial_dist
+            trial_offset = trial_offset + step
+            delta_offset = delta_offset + step
+
+        else:
+            break
+
+    print('    Almost between two reference peaks', delta_offset, score, delta_offset + step, trial_dist)
+    return delta_offset, score, (delta_offset, best_dist, delta_offset + step, trial_dist)
+
+def lstscore(points, phaseref):
+
+    s, f, c, o = zip(*points)
+    p = numpy.poly1d(numpy.polyfit(f, c, 6))
+
+    xmin, xmax = 0.05, 0.075
+
+    if min(f) > xmin or max(f) < xmax:
+        print('exiting')
+        return 1.0e9
+    
+    x = numpy.linspace(xmin, xmax, 32)
+    score = numpy.sqrt(numpy.sum((p(x) - phaseref(x))**2))
+
+    print(score)
+
+    pd = p.deriv()
+    h = 0.001
+    dscore = 0.0
+    for ix in x:
+        d = pd(ix) - phaseref.dcdf(ix, h)
+        dscore = dscore + d*d
+
+    print(dscore)
+        
+    return score #+ 2.0e-1*numpy.sqrt(dscore)
+
+#
+# Smoothed signal with, built once, the sorted indices of its local maxima, local
+# minima and sign changes and the end point of a hill climb (to a peak) or descent
+# (to a trough) from every bin in either direction. The windowed searches below
+# use these when given an IndexedSignal rather than rescanning the signal.
+#
+class IndexedSignal(numpy.ndarray):
+
+    def __new__(cls, signal):
+
+        s = numpy.asarray(signal, dtype = 'float')
+        obj = s.view(cls)
+
+        n = s.size
+        i = numpy.arange(n)
+
+        #
+        # Local extrema: a window's first maximum (minimum) is either one of its end
+        # points or an interior bin greater (less) than the previous and not less
+        # (greater) than the next
+        #
+        obj.maxima = numpy.where((s[1:-1] > s[:-2]) & (s[1:-1] >= s[2:]))[0] + 1
+        obj.minima = numpy.where((s[1:-1] < s[:-2]) & (s[1:-1] <= s[2:]))[0] + 1
+        obj.crossings = numpy.where((s[:-1] * s[1:]) < 0.0)[0]
+
+        stop = numpy.ones(n, dtype = 'bool')
+        stop[1:] = ~(s[:-1] > s[1:])
+        obj.peaklower = numpy.maximum.accumulate(numpy.where(stop, i, 0))
+
+        stop = numpy.ones(n, dtype = 'bool')
+        stop[:-1] = ~(s[1:] > s[:-1])
+        obj.peakhigher = numpy.minimum.accumulate(numpy.where(stop, i, n - 1)[::-1])[::-1]
+
+        stop = numpy.ones(n, dtype = 'bool')
+        stop[1:] = ~(s[:-1] < s[1:])
+        obj.troughlower = numpy.maximum.accumulate(numpy.where(stop, i, 0))
+
+        stop = numpy.ones(n, dtype = 'bool')
+        stop[:-1] = ~(s[1:] < s[:-1])
+        obj.troughhigher = numpy.minimum.accumulate(numpy.where(stop, i, n - 1)[::-1])[::-1]
+
+        return obj
+
+def indexsignal(signal):
+
+    if isinstance(signal, IndexedSignal) and hasattr(signal, 'maxima'):
+        return signal
+
+    return IndexedSignal(signal)
+
+def windowextrema(extrema, if0, if1):
+
+    #
+    # End points and interior extrema of the window [if0, if1] in order
+    #
+    a = numpy.searchsorted(extrema, if0, 'right')
+    b = numpy.searchsorted(extrema, if1, 'left')
+
+    return numpy.concatenate(([if0], extrema[a:b], [if1]))
+
+def findpeak(f, signal, if0, if1):
+    if if0 < 0:
+        if0 = 0
+    if if1 >= f.size:
+        if1 = f.size - 1
+    if if0 >= if1:
+        return -1
+
+    if hasattr(signal, 'maxima'):
+        candidates = windowextrema(signal.maxima, if0, if1)
+        return candidates[numpy.argmax(signal.view(numpy.ndarray)[candidates])]
+
+    mi = numpy.argmax(signal[if0:if1 + 1])
+    mi = if0 + mi
+    
+    return mi
+
+def findzerocross(sign, f, signal, if0, if1):
+    if if0 < 0:
+        if0 = 0
+    if if1 >= f.size:
+        if1 = f.size - 1
+    if if0 >= if1:
+        return -1
+    
+    if hasattr(signal, 'crossings'):
+        a = numpy.searchsorted(signal.crossings, if0, 'left')
+        b = numpy.searchsorted(signal.crossings, if1, 'left')
+        indices = signal.crossings[a:b] - if0
+    else:
+        t = signal[if0:if1]
+        t2 = signal[if0 + 1: if1 + 1]
+        indices = numpy.where((t * t2) < 0.0)[0]
+    
+    if indices.size == 0:
+        # None found
+        return -1
+
+    elif indices.size == 1:
+        # One found
+        zci = indices[0] + if0
+        if (signal[zci] < 0.0 and signal[zci+1] > 0.0):
+            if sign < 0:
+                return zci
+            else:
+                return -1
+        elif (signal[zci] > 0.0 and signal[zci+1] < 0.0):
+            if sign > 0:
+                return zci
+            else:
+                return -1
+
+        else:
+            raise Exception('Invalid zero cross')
+
+    else:
+        # Assume if0, if1 represent extremal bounds and select nearest to centre
+        besti = -1
+        bestscore = 8192
+        target = (if1 - if0)//2
+        for i, ti in enumerate(indices):
+            score = numpy.abs(ti - target)
+            zci = ti + if0
+            if sign < 0:
+                if (signal[zci] < 0.0 and signal[zci+1] > 0.0):
+                    if score < bestscore:
+                        bestscore = score
+                        besti = i
+            elif sign > 0:
+                if (signal[zci] > 0.0 and signal[zci+1] < 0.0):
+                    if score < bestscore:
+                        bestscore = score
+                        besti = i
+
+        if besti < 0:
+            return -1
+        else:
+            zci = indices[besti] + if0
+            return zci
+
+def findtrough(f, signal, if0, if1):
+    if if0 < 0:
+        if0 = 0
+    if if1 >= f.size:
+        if1 = f.size - 1
+    if if0 >= if1:
+        return -1
+        
+    if hasattr(signal, 'minima'):
+        candidates = windowextrema(signal.minima, if0, if1)
+        return candidates[numpy.argmin(signal.view(numpy.ndarray)[candidates])]
+
+    mi = numpy.argmin(signal[if0:if1 + 1])
+    mi = if0 + mi
+    
+    return mi
+
+#
+# Follow the signal up from i (in direction -1/+1) to a peak or down to a trough
+#
+def climbpeak(signal, i, direction):
+
+    if hasattr(signal, 'peaklower'):
+        if direction < 0:
+            return signal.peaklower[i]
+        else:
+            return signal.peakhigher[i]
+
+    if direction < 0:
+        while (i > 0 and signal[i - 1] > signal[i]):
+            i = i - 1
+    else:
+        while (i < signal.size - 1 and signal[i + 1] > signal[i]):
+            i = i + 1
+
+    return i
+
+def climbtrough(signal, i, direction):
+
+    if hasattr(signal, 'troughlower'):
+        if direction < 0:
+            return signal.troughlower[i]
+        else:
+            return signal.troughhigher[i]
+
+    if direction < 0:
+        while (i > 0 and signal[i - 1] < signal[i]):
+            i = i - 1
+    else:
+        while (i < signal.size - 1 and signal[i + 1] < signal[i]):
+            i = i + 1
+
+    return i
+
+#
+# Search window outside the spectrum (or with descending bounds)
+#
+class WindowError(IndexError):
+    pass
+
+def mkwindow(freq, fmin, fmax):
+
+    if fmin > fmax:
+        raise WindowError('Window %f - %f is descending' % (fmin, fmax))
+
+    #
+    # First bins above fmin/fmax (freq is increasing) widened by one
+    #
+    if0 = numpy.searchsorted(freq, fmin, 'right')
+    if1 = numpy.searchsorted(freq, fmax, 'right')
+    if if0 >= freq.size or if1 >= freq.size:
+        raise WindowError('Window %f - %f beyond maximum frequency' % (fmin, fmax))
+
+    if freq[0] > 0.0 and fmin < freq[0]:
+        #
+        # Cropped spectrum (a full spectrum starts at 0 Hz)
+        #
+        raise WindowError('Window %f - %f below minimum frequency' % (fmin, fmax))
+
+    if0 = if0 - 1
+    if1 = if1 + 1
+
+    return if0, if1
+
+################################################################################
+#
+# Forward
+#
+################################################################################
+
+#
+# Recursively try to find next peak forward, followed by next trough if unable to
+# find peak, ignoring zero crossings.
+#
+def find_forward_peak(j0zeros, j1zeros, f, c, offset,
+                      freq, signal, distkm, maxamplitude, cref,
+                      fmin, fmax, threshold):
+
+    if offset % 2 != 1:
+        raise Exception('Look for peak with even offset')
+    
+    #
+    # Estimate next peak location
+    #
+    est_nextpf, est_nextpc = estimaterepair.predict_next(f, c, j1zeros[offset], distkm, cref)
+    if est_nextpf < 0.0:
+        return False, 0, 0.0, 0.0, -1
+    
+    #
+    # Estimate next zero cross to get window width (ie, peak should be in range est_f +- zero cross)
+    #
+    est_nextzf, est_nextzc = estimaterepair.predict_next(f, c, j0zeros[offset], distkm, cref)
+
+    if est_nextzf > est_nextpf:
+        print(f, c, offset)
+        print(est_nextpf, est_nextpc)
+        print(est_nextzf, est_nextzc)
+        raise Exception('Unexpected ordering of peak/zero')
+    
+    wfwidth = est_nextpf - est_nextzf 
+    wfmin = est_nextpf - wfwidth*WINDOW_HALF_WIDTH
+    wfmax = est_nextpf + wfwidth*WINDOW_HALF_WIDTH
+    if0, if1 = mkwindow(freq, wfmin, wfmax)
+    pci = findpeak(freq, signal, if0, if1)
+
+    if pci > 0 and (signal[pci] > maxamplitude*threshold):
+
+        if (pci == if0):
+            # At edge, check further
+            tpci = climbpeak(signal, pci, -1)
+
+            binthreshold = (if1 - if0)//2
+            if (True or pci - tpci < binthreshold):
+                #print 'Warning: peak slightly out of range lower', pci, tpci
+                pci = tpci
+
+        elif (pci == if1):
+            tpci = climbpeak(signal, pci, 1)
+
+            binthreshold = (if1 - if0)//2
+            if (True or tpci - pci < binthreshold):
+                #print 'Warning: peak slightly out of range higher', pci, tpci
+                pci = tpci
+
+        #
+        # Found
+        #
+        next_f = freq[pci]
+        next_c = 2.0*numpy.pi*next_f * distkm/j1zeros[offset]
+
+        if (next_f > fmax):
+            # Out of range
+            print(bcolors.WARNING + '  Ignoring peak: out of range' + bcolors.ENDC)
+            pickprofile.count('picks_rejected')
+            return False, 1, next_f, next_c, offset
+
+        delta_c = next_c - c
+        est_delta_c = cref(next_f) - cref(f)
+        rel_delta_c = numpy.abs(delta_c - est_delta_c)/numpy.abs(est_delta_c)
+        if (rel_delta_c > MAX_GRADIENT_DEVIATION):
+            # Gradient deviation
+            pickprofile.count('picks_rejected')
+            pci = -1
+
+        else:
+            return True, 1, next_f, next_c, offset
+
+    #
+    # Try for next trough
+    #
+    return find_forward_trough(j0zeros, j1zeros, f, c, offset + 1,
+                               freq, signal, distkm, maxamplitude, cref,
+                               fmin, fmax, threshold)
+
+#
+# Recursively try to find next peak forward, followed by next trough if unable to
+# find peak, ignoring zero crossings.
+#
+def find_forward_trough(j0zeros, j1zeros, f, c, offset,
+                        freq, signal, distkm, maxamplitude, cref,
+                        fmin, fmax, threshold):
+
+    if offset % 2 != 0:
+        raise Exception('Look for trough with odd offset')
+    
+    #
+    # Estimate next peak location
+    #
+    est_nexttf, est_nexttc = estimaterepair.predict_next(f, c, j1zeros[offset], distkm, cref)
+    if est_nexttf < 0.0:
+        return False, 0, 0.0, 0.0, -1
+    
+    #
+    # Estimate next zero cross to get window width (ie, peak should be in range est_f +- zero cross)
+    #
+    est_nextzf, est_nextzc = estimaterepair.predict_next(f, c, j0zeros[offset], distkm, cref)
+
+    if est_nextzf > est_nexttf:
+        raise Exception('Unexpected ordering of trough/zero')
+    
+    wfwidth = est_nexttf - est_nextzf 
+    wfmin = est_nexttf - wfwidth*WINDOW_HALF_WIDTH
+    wfmax = est_nexttf + wfwidth*WINDOW_HALF_WIDTH
+    if0, if1 = mkwindow(freq, wfmin, wfmax)
+    pci = findtrough(freq, signal, if0, if1)
+                
+    if pci > 0 and (signal[pci] < -maxamplitude*threshold):
+
+        if (pci == if0):
+            # At edge, check further
+            tpci = climbtrough(signal, pci, -1)
+
+            binthreshold = (if1 - if0)//2
+            if (True or pci - tpci < binthreshold):
+                print('Warning: trough slightly out of range lower', pci, tpci)
+                pci = tpci
+
+        elif (pci == if1):
+            tpci = climbtrough(signal, pci, 1)
+
+            binthreshold = (if1 - if0)//2
+            if (True or tpci - pci < binthreshold):
+                print('Warning: trough slightly out of range higher', pci, tpci)
+                pci = tpci
+                
+
+                
+        #
+        # Found
+        #
+        next_f = freq[pci]
+        next_c = 2.0*numpy.pi*next_f * distkm/j1zeros[offset]
+
+        if (next_f > fmax):
+            # Out of range
+            pickprofile.count('picks_rejected')
+            return False, -1, next_f, next_c, offset
+
+        delta_c = next_c - c
+        est_delta_c = cref(next_f) - cref(f)
+        rel_delta_c = numpy.abs(delta_c - est_delta_c)/numpy.abs(est_delta_c)
+        if (rel_delta_c > MAX_GRADIENT_DEVIATION):
+            # Gradient deviation
+            pickprofile.count('picks_rejected')
+            pci = -1
+
+        else:
+            return True, -1, next_f, next_c, offset
+
+    #
+    # Try for next peak
+    #
+    return find_forward_peak(j0zeros, j1zeros, f, c, offset + 1,
+                             freq, signal, distkm, maxamplitude, cref,
+                             fmin, fmax, threshold)
+
+def add_next_forward_from_peak(j0zeros, j1zeros, freq, signal, distkm, maxamplitude, cref,
+                               fmin, fmax,
+                               picks,
+                               threshold):
+    
+    #
+    # Starting from peak the algorithm is:
+    #
+    # 1. Attempt to find downward (+ve - -ve) zero cross, if ok use, otherwise
+    # 2. Attempt to find next trough, if ok use, otherwise
+    # 3. Attempt to find next peak
+    #
+    # Reasons for rejection:
+    #
+    # 1. Sharp decrease in phase velocity -> spurious peak/trough/cross
+    # 2. Sharp increase in phase velocity -> missing peak/trough/cross
+    # 3. Low magnitude peak/trough
+    #
+    
+    sign, f, c, offset = picks[-1]
+
+    next_offset = offset + 1 # Offset for next zero cross and trough
+    est_nextf, est_nextc = estimaterepair.predict_next(f, c, j0zeros[next_offset], distkm, cref)
+
+    if est_nextf < f:
+        #
+        # Can happen near end
+        return picks, True
+
+    if est_nextf > fmax:
+        return picks, True
+
+    # Window for crossing
+    wfwidth = est_nextf - f
+    wfmin = est_nextf - wfwidth*WINDOW_HALF_WIDTH
+    wfmax = est_nextf + wfwidth*WINDOW_HALF_WIDTH
+        
+    if0, if1 = mkwindow(freq, wfmin, wfmax)
+
+    zci = findzerocross(sign, freq, signal, if0, if1)
+    if (zci > 0):
+        t = -signal[zci]/(signal[zci + 1] - signal[zci])
+        next_f = freq[zci] + (freq[zci + 1] - freq[zci])*t
+        next_c = 2.0*numpy.pi*next_f * distkm/j0zeros[next_offset]
+
+        deltac = next_c - c
+        if f > 0.1 and numpy.abs(deltac) > 0.1:
+            # Strong positive/negative change in phase, invalidate and fall through
+            zci = -1
+        else:
+            picks.append((0, next_f, next_c, next_offset))
+            return picks, False
+
+    #
+    # Fall through: try to find next trough and recursively next peak etc
+    #
+    found, up, ff, fc, foffset = find_forward_trough(j0zeros, j1zeros, f, c, next_offset,
+                                                     freq, signal, distkm, maxamplitude, cref,
+                                                     fmin, fmax, threshold)
+    
+    if found:
+        picks.append((up, ff, fc, foffset))
+        return picks, False
+
+    return picks, True
+        
+def add_next_forward_from_trough(j0zeros, j1zeros, freq, signal, distkm, maxamplitude, cref,
+                                 fmin, fmax,
+                                 picks,
+                                 threshold):
+    
+    #
+    # Starting from trough the algorithm is:
+    #
+    # 1. Attempt to find upward (-ve - +ve) zero cross, if ok use, otherwise
+    # 2. Attempt to find next peak, if ok use, otherwise
+    # 3. Attempt to find next trough, if ok use, otherwise
+    # 4. Goto 2 util fmax
+    #
+    # Reasons for rejection:
+    #
+    # 1. Sharp decrease in phase velocity -> spurious peak/trough/cross
+    # 2. Sharp increase in phase velocity -> missing peak/trough/cross
+    # 3. Low magnitude peak/trough
+    #
+    
+    sign, f, c, offset = picks[-1]
+
+    next_offset = offset + 1 # Offset for next zero cross and trough
+    est_nextf, est_nextc = estimaterepair.predict_next(f, c, j0zeros[next_offset], distkm, cref)
+
+    if est_nextf < f:
+        #
+        # Can happen near end
+        return picks, True
+
+    if est_nextf > fmax:
+        return picks, True
+
+    # Window for crossing
+    wfwidth = est_nextf - f
+    wfmin = est_nextf - wfwidth*WINDOW_HALF_WIDTH
+    wfmax = est_nextf + wfwidth*WINDOW_HALF_WIDTH
+        
+    if0, if1 = mkwindow(freq, wfmin, wfmax)
+
+    zci = findzerocross(sign, freq, signal, if0, if1)
+    if (zci > 0):
+        t = -signal[zci]/(signal[zci + 1] - signal[zci])
+        next_f = freq[zci] + (freq[zci + 1] - freq[zci])*t
+        next_c = 2.0*numpy.pi*next_f * distkm/j0zeros[next_offset]
+
+        deltac = next_c - c
+        if f > 0.1 and numpy.abs(deltac) > 0.1:
+            # Strong positive/negative change in phase, invalidate and fall through
+            zci = -1
+        else:
+            picks.append((0, next_f, next_c, next_offset))
+            return picks, False
+
+    #
+    # Fall through: try to find next trough and recursively next peak etc
+    #
+    found, up, ff, fc, foffset = find_forward_peak(j0zeros, j1zeros, f, c, next_offset,
+                                                   freq, signal, distkm, maxamplitude, cref,
+                                                   fmin, fmax, threshold)
+    
+    if found:
+        picks.append((up, ff, fc, foffset))
+        return picks, False
+
+    # Not found
+    return picks, True
+    
+def add_next_forward(j0zeros, j1zeros, freq, signal, distkm, maxamplitude, cref, fmin, fmax, picks, threshold):
+
+    sign, f, c, offset = picks[-1]
+
+    if sign == 1: # Expect nve zero cross
+
+        return add_next_forward_from_peak(j0zeros, j1zeros,
+                                          freq, signal, distkm, maxamplitude, cref,
+                                          fmin, fmax,
+                                          picks,
+                                          threshold)
+        
+
+    elif sign == 0: # Expect trough if offset even, peak if odd
+
+        if offset % 2 == 1:
+
+            # Zero cross -> peak, offset is unchanged
+            found, up, ff, fc, foffset = find_forward_peak(j0zeros, j1zeros, f, c, offset,
+                                                           freq, signal, distkm, maxamplitude, cref,
+                                                           fmin, fmax, threshold)
+
+            if (found):
+                picks.append((up, ff, fc, foffset))
+                return picks, False
+                
+        else:
+            # Zero cross -> trough, offset is unchanged
+            found, up, ff, fc, foffset = find_forward_trough(j0zeros, j1zeros, f, c, offset,
+                                                             freq, signal, distkm, maxamplitude, cref,
+                                                             fmin, fmax, threshold)
+
+            if (found):
+                picks.append((up, ff, fc, foffset))
+                return picks, False
+    
+    else: # Trough -> Expect pve zero cross
+
+        return add_next_forward_from_trough(j0zeros, j1zeros,
+                                            freq, signal, distkm, maxamplitude, cref,
+                                            fmin, fmax,
+                                            picks,
+                                            threshold)
+    
+
+    return picks, True
+
+################################################################################
+#
+# Backward
+#
+################################################################################
+
+#
+# Recursively try to find previous peak backward, followed by previous trough if unable to
+# find peak, ignoring zero crossings.
+#
+def find_backward_peak(j0zeros, j1zeros, f, c, offset,
+                       freq, signal, distkm, maxamplitude, cref,
+                       fmin, fmax, threshold):
+    
+    if offset % 2 != 1:
+        raise Exception('Look for peak with even offset')
+    
+    #
+    # Estimate previous peak location
+    #
+    est_nextpf, est_nextpc = estimaterepair.predict_next(f, c, j1zeros[offset], distkm, cref)
+    if est_nextpf < 0.0:
+        return False, 0, 0.0, 0.0, -1
+    
+    #
+    # Estimate next zero cross to get window width (ie, peak should be in range est_f +- zero cross)
+    #
+    est_nextzf, est_nextzc = estimaterepair.predict_next(f, c, j0zeros[offset + 1], distkm, cref)
+
+    if est_nextpf > est_nextzf:
+        print(f, c, offset)
+        print(est_nextpf, est_nextpc)
+        print(est_nextzf, est_nextzc)
+        raise Exception('Unexpected ordering of peak/zero')
+    
+    wfwidth = est_nextzf - est_nextpf 
+    wfmin = est_nextpf - wfwidth*WINDOW_HALF_WIDTH
+    wfmax = est_nextpf + wfwidth*WINDOW_HALF_WIDTH
+    if0, if1 = mkwindow(freq, wfmin, wfmax)
+    pci = findpeak(freq, signal, if0, if1)
+
+    if pci > 0 and (signal[pci] > maxamplitude*threshold):
+
+        if (pci == if0):
+            # At edge, check further
+            tpci = climbpeak(signal, pci, -1)
+
+            binthreshold = (if1 - if0)//2
+            if (pci - tpci < binthreshold):
+                #print '  find_backward_peak: Warning: peak slightly out of range lower', pci, tpci
+                pci = tpci
+
+        elif (pci == if1):
+            tpci = climbpeak(signal, pci, 1)
+
+            binthreshold = (if1 - if0)//2
+            if (tpci - pci < binthreshold):
+                #print '  find_backward_peak: Warning: peak slightly out of range higher', pci, tpci
+                pci = tpci
+
+        #
+        # Found
+        #
+        next_f = freq[pci]
+        next_c = 2.0*numpy.pi*next_f * distkm/j1zeros[offset]
+
+        if (next_f < fmin):
+            # Out of range
+            #print bcolors.WARNING + '  find_backward_peak: Ignoring peak: out of range' + bcolors.ENDC
+            pickprofile.count('picks_rejected')
+            return False, 1, next_f, next_c, offset
+
+        delta_c = next_c - c
+        est_delta_c = cref(next_f) - cref(f)
+        rel_delta_c = numpy.abs(delta_c - est_delta_c)/numpy.abs(est_delta_c)
+        if (rel_delta_c > MAX_GRADIENT_DEVIATION):
+            # Gradient deviation
+            #print bcolors.WARNING + '  find_backward_peak: Ignoring peak: gradient deviation: ' + bcolors.ENDC, delta_c, est_delta_c, rel_delta_c
+            pickprofile.count('picks_rejected')
+            pci = -1
+
+        else:
+            #print '  find_backward_peak: Found peak: predicted %15.9f found %15.9f err %12.4e' % (est_nextpf, next_f,
+                                                                                                  #est_nextpf - next_f)
+            return True, 1, next_f, next_c, offset
+
+    #
+    # Try for next trough
+    #
+    return find_backward_trough(j0zeros, j1zeros, f, c, offset - 1,
+                               freq, signal, distkm, maxamplitude, cref,
+                               fmin, fmax, threshold)
+
+#
+# Recursively try to find previous peak backward, followed by previous trough if unable to
+# find peak, ignoring zero crossings.
+#
+def find_backward_trough(j0zeros, j1zeros, f, c, offset,
+                         freq, signal, distkm, maxamplitude, cref,
+                         fmin, fmax, threshold):
+
+    if offset % 2 != 0:
+        raise Exception('Look for trough with odd offset')
+    
+    #
+    # Estimate next peak location
+    #
+    est_nexttf, est_nexttc = estimaterepair.predict_next(f, c, j1zeros[offset], distkm, cref)
+    if est_nexttf < 0.0:
+        return False, 0, 0.0, 0.0, -1
+    
+    #
+    # Estimate next zero cross to get window width (ie, peak should be in range est_f +- zero cross)
+    #
+    est_nextzf, est_nextzc = estimaterepair.predict_next(f, c, j0zeros[offset + 1], distkm, cref)
+
+    if est_nexttf > est_nextzf:
+        raise Exception('Unexpected ordering of trough/zero')
+    
+    wfwidth = est_nextzf - est_nexttf 
+    wfmin = est_nexttf - wfwidth*WINDOW_HALF_WIDTH
+    wfmax = est_nexttf + wfwidth*WINDOW_HALF_WIDTH
+    if0, if1 = mkwindow(freq, wfmin, wfmax)
+    pci = findtrough(freq, signal, if0, if1)
+                
+    if pci > 0 and (signal[pci] < -maxamplitude*threshold):
+
+        if (pci == if0):
+            # At edge, check further
+            tpci = climbtrough(signal, pci, -1)
+
+            binthreshold = (if1 - if0)//2
+            if (True or pci - tpci < binthreshold):
+                #print '  find_backward_trough: Warning: trough slightly out of range lower', pci, tpci
+                pci = tpci
+
+        elif (pci == if1):
+            tpci = climbtrough(signal, pci, 1)
+
+            binthreshold = (if1 - if0)//2
+            if (True or tpci - pci < binthreshold):
+                #print '  find_backward_trough: Warning: trough slightly out of range higher', pci, tpci
+                pci = tpci
+                
+        #
+        # Found
+        #
+        next_f = freq[pci]
+        next_c = 2.0*numpy.pi*next_f * distkm/j1zeros[offset]
+
+        if (next_f < fmin):
+            # Out of range
+            #print '  find_backward_trough: Ignoring trough: out of range'
+            pickprofile.count('picks_rejected')
+            return False, -1, next_f, next_c, offset
+
+        delta_c = next_c - c
+        est_delta_c = cref(next_f) - cref(f)
+        rel_delta_c = numpy.abs(delta_c - est_delta_c)/numpy.abs(est_delta_c)
+        if (rel_delta_c > MAX_GRADIENT_DEVIATION):
+            # Gradient deviation
+            #print '  find_backward_trough: Ignoring trough: gradient deviation: ', delta_c, est_delta_c, rel_delta_c
+            pickprofile.count('picks_rejected')
+            pci = -1
+
+        else:
+            return True, -1, next_f, next_c, offset
+
+    #
+    # Try for next peak
+    #
+    if offset >= 2:
+        
+        return find_backward_peak(j0zeros, j1zeros, f, c, offset - 1,
+                                 freq, signal, distkm, maxamplitude, cref,
+                                 fmin, fmax, threshold)
+    else:
+
+        return False, -1, 0.0, 0.0, 0
+
+def add_next_backward_from_peak(j0zeros, j1zeros, freq, signal, distkm, maxamplitude, cref,
+                                fmin, fmax,
+                                picks,
+                                threshold):
+    
+    #
+    # Starting from peak the algorithm is:
+    #
+    # 1. Attempt to find upward (-ve - +ve) zero cross, if ok use, otherwise
+    # 2. Attempt to find previous trough, if ok use, otherwise
+    # 3. Attempt to find previous peak
+    #
+    # Reasons for rejection:
+    #
+    # 1. Sharp decrease in phase velocity -> spurious peak/trough/cross
+    # 2. Sharp increase in phase velocity -> missing peak/trough/cross
+    # 3. Low magnitude peak/trough
+    #
+    
+    sign, f, c, offset = picks[0]
+
+    next_offset = offset # Offset for previous zero
+    est_nextf, est_nextc = estimaterepair.predict_next(f, c, j0zeros[next_offset], distkm, cref)
+
+    if est_nextf > f:
+        #
+        # Can happen near end
+        return picks, True
+
+    if est_nextf < fmin:
+        return picks, True
+
+    # Window for crossing
+    wfwidth = f - est_nextf
+    wfmin = est_nextf - wfwidth*WINDOW_HALF_WIDTH
+    wfmax = est_nextf + wfwidth*WINDOW_HALF_WIDTH
+        
+    if0, if1 = mkwindow(freq, wfmin, wfmax)
+
+    zci = findzerocross(-sign, freq, signal, if0, if1)
+    if (zci > 0):
+        t = -signal[zci]/(signal[zci + 1] - signal[zci])
+        next_f = freq[zci] + (freq[zci + 1] - freq[zci])*t
+        next_c = 2.0*numpy.pi*next_f * distkm/j0zeros[next_offset]
+
+        delta_c = next_c - c
+        est_delta_c = cref(next_f) - cref(f)
+        rel_delta_c = numpy.abs(delta_c - est_delta_c)/numpy.abs(est_delta_c)
+        if (rel_delta_c < MAX_GRADIENT_DEVIATION):
+            picks.insert(0, (0, next_f, next_c, next_offset))
+            return picks, False
+
+        pickprofile.count('picks_rejected')
+
+    #
+    # Fall through: try to find next trough and recursively next peak etc
+    #
+    found, up, ff, fc, foffset = find_backward_trough(j0zeros, j1zeros, f, c, next_offset - 1,
+                                                      freq, signal, distkm, maxamplitude, cref,
+                                                      fmin, fmax, threshold)
+    if found:
+        picks.insert(0, (up, ff, fc, foffset))
+        return picks, False
+
+    return picks, True
+        
+def add_next_backward_from_trough(j0zeros, j1zeros, freq, signal, distkm, maxamplitude, cref,
+                                  fmin, fmax,
+                                  picks,
+                                  threshold):
+    
+    #
+    # Starting from trough the algorithm is:
+    #
+    # 1. Attempt to find downward (+ve - -ve) zero cross, if ok use, otherwise
+    # 2. Attempt to find previous peak, if ok use, otherwise
+    # 3. Attempt to find previous trough, if ok use, otherwise
+    # 4. Goto 2 util fmax
+    #
+    # Reasons for rejection:
+    #
+    # 1. Sharp decrease in phase velocity -> spurious peak/trough/cross
+    # 2. Sharp increase in phase velocity -> missing peak/trough/cross
+    # 3. Low magnitude peak/trough
+    #
+    
+    sign, f, c, offset = picks[0]
+
+    next_offset = offset # Offset for next zero cross 
+    est_nextf, est_nextc = estimaterepair.predict_next(f, c, j0zeros[next_offset], distkm, cref)
+
+    if est_nextf > f:
+        #
+        # Can happen near end
+        return picks, True
+
+    if est_nextf < fmin:
+        return picks, True
+
+    # Window for crossing
+    wfwidth = f - est_nextf 
+    wfmin = est_nextf - wfwidth*WINDOW_HALF_WIDTH
+    wfmax = est_nextf + wfwidth*WINDOW_HALF_WIDTH
+        
+    if0, if1 = mkwindow(freq, wfmin, wfmax)
+
+    zci = findzerocross(sign, freq, signal, if0, if1)
+    if (zci > 0):
+        t = -signal[zci]/(signal[zci + 1] - signal[zci])
+        next_f = freq[zci] + (freq[zci + 1] - freq[zci])*t
+        next_c = 2.0*numpy.pi*next_f * distkm/j0zeros[next_offset]
+
+        deltac = next_c - c
+        delta_c = next_c - c
+        est_delta_c = cref(next_f) - cref(f)
+        rel_delta_c = numpy.abs(delta_c - est_delta_c)/numpy.abs(est_delta_c)
+        if (rel_delta_c < MAX_GRADIENT_DEVIATION):
+            picks.insert(0, (0, next_f, next_c, next_offset))
+            return picks, False
+
+        pickprofile.count('picks_rejected')
+
+    #
+    # Fall through: try to find next trough and recursively next peak etc
+    #
+    if (next_offset >= 2) :
+        found, up, ff, fc, foffset = find_backward_peak(j0zeros, j1zeros, f, c, next_offset - 1,
+                                                        freq, signal, distkm, maxamplitude, cref,
+                                                        fmin, fmax, threshold)
+    
+        if found:
+            picks.insert(0, (up, ff, fc, foffset))
+            return picks, False
+
+    # Not found
+    return picks, True
+
+
+
+def add_next_backward(j0zeros, j1zeros, freq, signal, distkm, maxamplitude, cref, fmin, fmax, picks, threshold):
+
+    sign, f, c, offset = picks[0]
+
+    if sign == 1: # Expect pve zero cross
+
+        return add_next_backward_from_peak(j0zeros, j1zeros,
+                                           freq, signal, distkm, maxamplitude, cref,
+                                           fmin, fmax,
+                                           picks,
+                                           threshold)
+
+    elif sign == 0: # Expect trough if offset even, peak if odd
+
+        if offset == 0: # No more zeros
+            return picks, True
+        
+        if offset % 2 == 1:
+
+            found, up, ff, fc, foffset = find_backward_trough(j0zeros, j1zeros,
+                                                              f, c, offset - 1,
+                                                              freq, signal, distkm, maxamplitude, cref,
+                                                              fmin, fmax, threshold)
+
+            if (found):
+                picks.insert(0, (up, ff, fc, foffset))
+                return picks, False
+                
+        else:
+            found, up, ff, fc, foffset = find_backward_peak(j0zeros, j1zeros,
+                                                            f, c, offset - 1,
+                                                            freq, signal, distkm, maxamplitude, cref,
+                                                            fmin, fmax, threshold)
+
+            if (found):
+                picks.insert(0, (up, ff, fc, foffset))
+                return picks, False
+    
+    else: # Trough -> Expect nve zero cross
+
+        return add_next_backward_from_trough(j0zeros, j1zeros,
+                                             freq, signal, distkm, maxamplitude, cref,
+                                             fmin, fmax,
+                                             picks,
+                                             threshold)
+
+
+    return picks, True
+
+#
+# Offset independent part of pick: the first peak/trough from the maximum (ie most
+# likely to be a true peak) and the j1 zero offset best matching the reference there.
+#
+def pick_start(j1zeros, freq, signal, distkm, phaseref):
+
+    indices = numpy.where((freq >= START_FMIN) & (freq <= START_FMAX))[0]
+    
+    lp = numpy.argmax(signal[indices]) + indices[0]
+    lt = numpy.argmin(signal[indices]) + indices[0]
+
+    if (-signal[lt] > signal[lp]):
+
+        maxamplitude = -signal[lt]
+        # Trough first (troughs are even zeros of j1)
+        sign = -1.0
+        f = freq[lt]
+        offset = 0
+
+    else:
+        # Peak first (peaks are odd zeros of j1)
+        maxamplitude = signal[lp]
+        sign = 1.0
+        f = freq[lp]
+        offset = 1
+
+    bestoffset = -1
+    bestdist = 1.0e9
+    cref = phaseref(f)
+        
+    while offset < len(j1zeros):
+        c = 2.0*numpy.pi*f * distkm/j1zeros[offset]
+        dist = numpy.abs(c - cref)
+        if (dist < bestdist):
+            bestdist = dist
+            bestoffset = offset
+                
+        offset = offset + 2
+
+    return sign, f, maxamplitude, bestoffset
+
+#
+# Walk backward then forward from the start with the first extremum labelled with
+# offset bestoffset + suggestoffset. The predicted position of each next extremum
+# depends on the phase velocity and hence on the offset, so the walk is not simply
+# a relabelling of the walk at another offset.
+#
+def pick_walk(j0zeros, j1zeros, freq, signal, distkm, phaseref, fmin, fmax, start, suggestoffset = 0, threshold = 0.075):
+
+    sign, f, maxamplitude, bestoffset = start
+
+    offset = bestoffset + suggestoffset
+    c = 2.0*numpy.pi*f * distkm/j1zeros[offset]
+    picks = [(sign, f, c, offset)]
+
+    #
+    # A search running off the end of the spectrum (only possible beyond fmin/fmax)
+    # finishes the walk in that direction
+    #
+    while True:
+        try:
+            picks, finished = add_next_backward(j0zeros, j1zeros,
+                                                freq, signal, distkm,
+                                                maxamplitude, phaseref,
+                                                fmin, fmax, picks,
+                                                threshold)
+        except WindowError:
+            finished = True
+
+        if finished:
+            break
+
+    while True:
+
+        try:
+            picks, finished = add_next_forward(j0zeros, j1zeros,
+                                               freq, signal, distkm,
+                                               maxamplitude, phaseref,
+                                               fmin, fmax, picks,
+                                               threshold)
+        except WindowError:
+            finished = True
+
+        if finished:
+            break
+
+    pickprofile.count('walks')
+    pickprofile.count('picks_added', len(picks) - 1)
+        
+    return picks
+
+def pick(j0zeros, j1zeros, freq, signal, distkm, phaseref, fmin, fmax, suggestoffset = 0, threshold = 0.075):
+
+    signal = indexsignal(signal)
+    start = pick_start(j1zeros, freq, signal, distkm, phaseref)
+
+    return pick_walk(j0zeros, j1zeros, freq, signal, distkm, phaseref, fmin, fmax, start, suggestoffset, threshold)
+
+#
+# Picks of a single signal: the start is found once and the walk for each offset
+# kept so that retrying an offset (offset search, between troughs resolution) does
+# not pick again.
+#
+class PickCache:
+
+    def __init__(self, j0zeros, j1zeros, freq, signal, distkm, phaseref, fmin, fmax, threshold = 0.075):
+
+        self.j0zeros = j0zeros
+        self.j1zeros = j1zeros
+        self.freq = freq
+        self.signal = indexsignal(signal)
+        self.distkm = distkm
+        self.phaseref = phaseref
+        self.fmin = fmin
+        self.fmax = fmax
+        self.threshold = threshold
+
+        self.start = None
+        self.picks = {}
+        self.traces = {}
+
+    def pick(self, suggestoffset = 0):
+
+        if suggestoffset in self.traces:
+            sys.stdout.write(self.traces.pop(suggestoffset))
+
+        if not suggestoffset in self.picks:
+
+            if self.start is None:
+                self.start = pick_start(self.j1zeros, self.freq, self.signal, self.distkm, self.phaseref)
+
+            self.picks[suggestoffset] = pick_walk(self.j0zeros, self.j1zeros,
+                                                  self.freq, self.signal, self.distkm, self.phaseref,
+                                                  self.fmin, self.fmax,
+                                                  self.start, suggestoffset, self.threshold)
+
+        return list(self.picks[suggestoffset])
+
+    #
+    # The suggested offsets that label the first extremum with a zero in the
+    # table, ie bestoffset + offset in [0, len(j1zeros))
+    #
+    def valid_offsets(self, offsets):
+
+        if self.start is None:
+            self.start = pick_start(self.j1zeros, self.freq, self.signal, self.distkm, self.phaseref)
+
+        bestoffset = self.start[3]
+        return [o for o in offsets if bestoffset + o >= 0 and bestoffset + o < len(self.j1zeros)]
+
+    #
+    # Walk every valid offset not already picked in a pool of processes. The
+    # trace of each walk is held until the offset is picked so that the output
+    # is as if picked one at a time.
+    #
+    def prefetch(self, offsets, pool):
+
+        offsets = [o for o in self.valid_offsets(offsets) if not o in self.picks]
+        if len(offsets) == 0:
+            return
+
+        tasks = [(self.j0zeros, self.j1zeros, self.freq, numpy.asarray(self.signal), self.distkm, self.phaseref,
+                  self.fmin, self.fmax, self.threshold, self.start, o) for o in offsets]
+
+        for o, (picks, trace, profile) in zip(offsets, pool.map(pick_walk_worker, tasks)):
+            pickprofile.merge(profile)
+            self.picks[o] = picks
+            self.traces[o] = trace
+
+def pick_walk_worker(task):
+
+    j0zeros, j1zeros, freq, signal, distkm, phaseref, fmin, fmax, threshold, start, suggestoffset = task
+
+    pickprofile.reset_worker()
+
+    stdout = sys.stdout
+    sys.stdout = trace = StringIO()
+    try:
+        picks = pick_walk(j0zeros, j1zeros, freq, indexsignal(signal), distkm, phaseref, fmin, fmax,
+                          start, suggestoffset, threshold)
+    finally:
+        sys.stdout = stdout
+
+    return picks, trace.getvalue(), pickprofile.snapshot()
+
+################################################################################
+#
+# Station pair
+#
+################################################################################
+
+def load_reference(fname):
+
+    ref = numpy.loadtxt(fname, skiprows = 1)
+    indices = numpy.where(ref[:,1] > 0.0)[0]
+
+    return uniforminterp.UniformInterp1d(ref[indices,0], ref[indices,1]/1.0e3)
+
+def ncf_signal(ncf, width):
+
+    signal = numpy.real(ncf)
+
+    if width > 0.0:
+        signal = scipy.ndimage.gaussian_filter1d(signal, width)
+
+    return signal
+
+#
+# Filter widths from a comma separated list, eg "1,2,3,4"
+#
+def filter_widths(text):
+
+    return [float(w) for w in str(text).split(',')]
+
+#
+# Gaussian kernel as used by scipy.ndimage.gaussian_filter1d (truncated at 4
+# standard deviations and normalised)
+#
+GAUSSIAN_TRUNCATE = 4.0
+
+def gaussian_kernel(width):
+
+    radius = int(GAUSSIAN_TRUNCATE*width + 0.5)
+    x = numpy.arange(-radius, radius + 1, dtype = 'float')
+    kernel = numpy.exp(-0.5/(width*width) * x*x)
+
+    return kernel/numpy.sum(kernel)
+
+#
+# Smoothed signals for a list of filter widths, one row per width. The signal is
+# extended by reflection as gaussian_filter1d does (mode 'reflect'), transformed
+# once and convolved with each kernel in the frequency domain, rows agree with
+# ncf_signal(ncf, width) to rounding. A width of 0 is the unsmoothed signal.
+#
+def ncf_signals(ncf, widths):
+
+    signal = numpy.real(ncf)
+    n = signal.size
+
+    kernels = []
+    radius = 0
+    for width in widths:
+        if width > 0.0:
+            kernel = gaussian_kernel(width)
+            radius = max(radius, kernel.size//2)
+        else:
+            kernel = None
+        kernels.append(kernel)
+
+    padded = numpy.pad(signal, radius, mode = 'symmetric')
+    m = padded.size
+    spectrum = numpy.fft.rfft(padded)
+
+    signals = numpy.zeros((len(widths), n))
+    for i, kernel in enumerate(kernels):
+
+        if kernel is None:
+            signals[i,:] = signal
+            continue
+
+        #
+        # Kernel centred on sample 0 of the circular convolution, the wrapped
+        # ends lie in the padding
+        #
+        r = kernel.size//2
+        circular = numpy.zeros((m,))
+        circular[:r + 1] = kernel[r:]
+        if r > 0:
+            circular[m - r:] = kernel[:r]
+
+        signals[i,:] = numpy.fft.irfft(spectrum * numpy.fft.rfft(circular), m)[radius:radius + n]
+
+    return signals
+
+#
+# Smoothed signal stacks are cached per station pair in a <data file>.filters.npz
+# sidecar, one row per width, keyed on the data file (as dispersionfile keys its
+# text cache) and the frequencies of the (possibly cropped) signal, so that a
+# later sweep of the same pair only smooths the widths not already cached.
+#
+def signal_cachename(fname):
+
+    return fname + '.filters.npz'
+
+def signal_cachekey(fname, freq):
+
+    return numpy.concatenate((dispersionfile.cachekey(fname), [freq[0], freq[-1], float(freq.size)]))
+
+def load_signal_cache(fname, key):
+
+    cname = signal_cachename(fname)
+    if not os.path.exists(cname):
+        return {}
+
+    try:
+        cache = numpy.load(cname)
+        try:
+            if not numpy.array_equal(cache['key'], key):
+                return {}
+
+            return dict(zip(map(float, cache['widths']), cache['signals']))
+        finally:
+            cache.close()
+
+    except (IOError, OSError, KeyError, ValueError):
+        #
+        # Corrupt or old cache, will be rebuilt
+        #
+        return {}
+
+def save_signal_cache(fname, key, stack):
+
+    cname = signal_cachename(fname)
+    tmpname = '%s.tmp%d' % (cname, os.getpid())
+    widths = sorted(stack.keys())
+    try:
+        fp = open(tmpname, 'wb')
+        numpy.savez(fp,
+                    key = key,
+                    widths = numpy.array(widths),
+                    signals = numpy.array([stack[w] for w in widths]))
+        fp.close()
+        os.rename(tmpname, cname)
+
+    except (IOError, OSError):
+        #
+        # Read only data directories are fine, just no caching
+        #
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+
+#
+# As ncf_signals, with the stack cached for the data file fname (no caching if
+# fname is None)
+#
+def cached_ncf_signals(fname, freq, ncf, widths):
+
+    if fname is None:
+        return ncf_signals(ncf, widths)
+
+    key = signal_cachekey(fname, freq)
+    stack = load_signal_cache(fname, key)
+
+    missing = [float(w) for w in widths if not float(w) in stack]
+    if len(missing) > 0:
+        for width, signal in zip(missing, ncf_signals(ncf, missing)):
+            stack[width] = signal
+        save_signal_cache(fname, key, stack)
+
+    return numpy.array([stack[float(w)] for w in widths])
+
+#
+# Pick, re-picking with the offset suggested by estimate_first_trough_offset until
+# it is satisfied or the suggestions loop, in which case the best scoring pick is used.
+#
+def pick_offset(j0zeros, j1zeros, freq, signal, distkm, phaseref, fmin, fmax, name, cache = None):
+
+    if cache is None:
+        cache = PickCache(j0zeros, j1zeros, freq, signal, distkm, phaseref, fmin, fmax)
+
+    doffset = 0
+    alreadytried = {}
+
+    while True:
+        print('%s Begin pick: %d' % (name, doffset))
+        pickprofile.count('offsets_tried')
+        points = cache.pick(doffset)
+
+        offset, score, bounds = estimate_first_trough_offset(j1zeros,
+                                                             points,
+                                                             distkm,
+                                                             freq,
+                                                             signal,
+                                                             phaseref)
+        alreadytried[doffset] = (points, score)
+
+        if offset == 0:
+            break
+
+        print('Retrying', offset)
+        pickprofile.count('offsets_retried')
+        doffset = doffset + offset
+        if doffset in alreadytried:
+            print('Looped back on self, using best score')
+            pickprofile.count('offset_loops')
+            minv = 1e30
+            minpts = None
+            for k, (pts, v) in alreadytried.items():
+                if (v < minv):
+                    minpts = pts
+                    minv = v
+            points = minpts
+            break
+
+    return points, doffset, bounds
+
+#
+# Trial offsets -width, -width + 2, ..., width (the parity of the offset is that of
+# the first extremum so offsets are always tried in steps of 2)
+#
+def offset_window(width):
+
+    width = 2*(width//2)
+    return list(range(-width, width + 1, 2))
+
+#
+# Pick every offset of the window and score each as pick_offset does. Picks whose
+# first trough is nearest the reference trough at their own offset (ie pick_offset
+# would stop there) are preferred, the best scoring of these (or of all offsets
+# if there are none) is used. With a pool the walks are run concurrently. Offsets
+# outside the zero table, or whose first trough cannot be scored, are skipped.
+#
+def pick_offset_window(j0zeros, j1zeros, freq, signal, distkm, phaseref, fmin, fmax, name, window, cache = None, pool = None):
+
+    if cache is None:
+        cache = PickCache(j0zeros, j1zeros, freq, signal, distkm, phaseref, fmin, fmax)
+
+    #
+    # Offsets labelling the first extremum below the first zero (short station
+    # pairs) or beyond the table are not walked
+    #
+    window = cache.valid_offsets(window)
+
+    if not pool is None:
+        cache.prefetch(window, pool)
+
+    best = None
+    bestaccepted = None
+    error = None
+    for doffset in window:
+        print('%s Begin pick: %d' % (name, doffset))
+        pickprofile.count('offsets_tried')
+        points = cache.pick(doffset)
+
+        #
+        # An offset far from the right one may have no predicted next trough,
+        # it is skipped (pick_offset would never reach it)
+        #
+        try:
+            offset, score, bounds = estimate_first_trough_offset(j1zeros,
+                                                                 points,
+                                                                 distkm,
+                                                                 freq,
+                                                                 signal,
+                                                                 phaseref)
+        except Exception as e:
+            print('%s offset %d not scored: %s' % (name, doffset, e))
+            if error is None:
+                error = e
+            continue
+
+        trial = (score, doffset, points, bounds)
+        if best is None or score < best[0]:
+            best = trial
+        if offset == 0 and (bestaccepted is None or score < bestaccepted[0]):
+            bestaccepted = trial
+
+    if best is None:
+        raise error
+
+    if not bestaccepted is None:
+        best = bestaccepted
+        
+    score, doffset, points, bounds = best
+    print('%s offset window, using %d score %f' % (name, doffset, score))
+
+    return points, doffset, bounds
+
+#
+# pick_offset in a worker process: the picking trace is captured and returned with
+# the picks and the cache contents so that the parent can replay it in order and
+# reuse the picks when resolving offsets.
+#
+def pick_offset_worker(task):
+
+    j0zeros, j1zeros, freq, signal, distkm, phaseref, fmin, fmax, name = task
+
+    pickprofile.reset_worker()
+
+    stdout = sys.stdout
+    sys.stdout = trace = StringIO()
+    try:
+        cache = PickCache(j0zeros, j1zeros, freq, signal, distkm, phaseref, fmin, fmax)
+        points, doffset, bounds = pick_offset(j0zeros, j1zeros, freq, signal, distkm, phaseref,
+                                              fmin, fmax, name, cache)
+    finally:
+        sys.stdout = stdout
+
+    return points, doffset, bounds, cache.start, cache.picks, trace.getvalue(), pickprofile.snapshot()
+
+#
+# Pick Love and Rayleigh, using the ratio of Rayleigh to Love phase velocity to
+# choose between the two candidate offsets when a first trough lies almost halfway
+# between reference troughs.
+#
+def pick_joint(j0zeros, j1zeros, freq, lovesignal, rayleighsignal, distkm, lovephaseref, rayleighphaseref, fmin, fmax, concurrent = False, window = None):
+
+    lovecache = PickCache(j0zeros, j1zeros, freq, lovesignal, distkm, lovephaseref, fmin, fmax)
+    rayleighcache = PickCache(j0zeros, j1zeros, freq, rayleighsignal, distkm, rayleighphaseref, fmin, fmax)
+
+    if not window is None:
+        #
+        # Every offset of the window is walked, concurrently across offsets rather
+        # than between Love and Rayleigh
+        #
+        pool = None
+        if concurrent:
+            pool = multiprocessing.Pool()
+
+        print('Picking Love')
+        lovepoints, lovedoffset, lovebounds = pick_offset_window(j0zeros, j1zeros, freq, lovesignal, distkm, lovephaseref,
+                                                                 fmin, fmax, 'Love', window, lovecache, pool)
+
+        print('Picking Rayleigh')
+        rayleighpoints, rayleighdoffset, rayleighbounds = pick_offset_window(j0zeros, j1zeros, freq, rayleighsignal, distkm, rayleighphaseref,
+                                                                             fmin, fmax, 'Rayleigh', window, rayleighcache, pool)
+
+        if not pool is None:
+            pool.close()
+            pool.join()
+
+    elif concurrent:
+        #
+        # Love and Rayleigh are independent until the offsets are resolved below,
+        # pick them in two processes (the picking is mostly Python so threads
+        # would not run concurrently).
+        #
+        pool = multiprocessing.Pool(2)
+        love = pool.apply_async(pick_offset_worker,
+                                ((j0zeros, j1zeros, freq, lovesignal, distkm, lovephaseref, fmin, fmax, 'Love'),))
+        rayleigh = pool.apply_async(pick_offset_worker,
+                                    ((j0zeros, j1zeros, freq, rayleighsignal, distkm, rayleighphaseref, fmin, fmax, 'Rayleigh'),))
+        pool.close()
+
+        lovepoints, lovedoffset, lovebounds, lovecache.start, lovecache.picks, lovetrace, loveprofile = love.get()
+        rayleighpoints, rayleighdoffset, rayleighbounds, rayleighcache.start, rayleighcache.picks, rayleightrace, rayleighprofile = rayleigh.get()
+        pool.join()
+
+        pickprofile.merge(loveprofile)
+        pickprofile.merge(rayleighprofile)
+
+        print('Picking Love')
+        sys.stdout.write(lovetrace)
+        print('Picking Rayleigh')
+        sys.stdout.write(rayleightrace)
+
+    else:
+
+        print('Picking Love')
+        lovepoints, lovedoffset, lovebounds = pick_offset(j0zeros, j1zeros, freq, lovesignal, distkm, lovephaseref,
+                                                          fmin, fmax, 'Love', lovecache)
+
+        print('Picking Rayleigh')
+        rayleighpoints, rayleighdoffset, rayleighbounds = pick_offset(j0zeros, j1zeros, freq, rayleighsignal, distkm, rayleighphaseref,
+                                                                      fmin, fmax, 'Rayleigh', rayleighcache)
+
+    if lovebounds is None:
+        if not rayleighbounds is None:
+            #
+            # Special case where trough is almost halfway between reference troughs
+            #
+            offset1, score1, offset2, score2 = rayleighbounds
+            print('Rayleigh between troughs:', rayleighdoffset, offset1, score1, offset2, score2)
+            pickprofile.count('between_troughs')
+            
+            if offset1 == 0:
+                points1 = list(rayleighpoints)
+            else:
+                points1 = rayleighcache.pick(rayleighdoffset + offset1)
+            
+            if offset2 == 0:
+                points2 = list(rayleighpoints)
+            else:
+                points2 = rayleighcache.pick(rayleighdoffset + offset2)
+
+            _, lf, lc, _ = zip(*lovepoints)
+            lcurve = scipy.interpolate.interp1d(lf, lc)
+            l10 = lcurve(0.10)
+
+            _, rf1, rc1, _ = zip(*points1)
+            rcurve = scipy.interpolate.interp1d(rf1, rc1)
+            r110 = rcurve(0.10)
+
+            _, rf2, rc2, _ = zip(*points2)
+            rcurve = scipy.interpolate.interp1d(rf2, rc2)
+            r210 = rcurve(0.10)
+
+            score1 = numpy.abs(r110/l10 - 0.90)
+            score2 = numpy.abs(r210/l10 - 0.90)
+
+            print('Resolving Rayleigh: %d %f - %d %f' % (offset1, score1,
+                                                         offset2, score2))
+            if score1 < score2:
+                rayleighpoints = list(points1)
+            else:
+                rayleighpoints = list(points2)
+        
+    elif rayleighbounds is None:
+        if not lovebounds is None:
+            #
+            # Special case where trough is almost halfway between reference troughs
+            #
+            offset1, score1, offset2, score2 = lovebounds
+            print('Love between troughs:', lovedoffset, offset1, score1, offset2, score2)
+            pickprofile.count('between_troughs')
+
+            if offset1 == 0:
+                points1 = list(lovepoints)
+            else:
+                points1 = lovecache.pick(lovedoffset + offset1)
+
+            if offset2 == 0:
+                points2 = list(lovepoints)
+            else:
+                points2 = lovecache.pick(lovedoffset + offset2)
+
+            _, rf, rc, _ = zip(*rayleighpoints)
+            rcurve = scipy.interpolate.interp1d(rf, rc)
+            r10 = rcurve(0.10)
+
+            _, lf1, lc1, _ = zip(*points1)
+            lcurve = scipy.interpolate.interp1d(lf1, lc1)
+            l110 = lcurve(0.10)
+
+            _, lf2, lc2, _ = zip(*points2)
+            lcurve = scipy.interpolate.interp1d(lf2, lc2)
+            l210 = lcurve(0.10)
+
+            score1 = numpy.abs(r10/l110 - 0.90)
+            score2 = numpy.abs(r10/l210 - 0.90)
+
+            print('Resolving Love: %d %f - %d %f' % (offset1, score1,
+                                                     offset2, score2))
+            if score1 < score2:
+                lovepoints = list(points1)
+            else:
+                lovepoints = list(points2)
+
+    else:
+        print('Ambiguous/undecided')
+
+
+        #
+        # Special case where trough is almost halfway between reference troughs
+        #
+        offset1, score1, offset2, score2 = lovebounds
+        print('Love between troughs:', lovedoffset, offset1, score1, offset2, score2)
+        pickprofile.count('between_troughs')
+        
+        if offset1 == 0:
+            points1 = list(lovepoints)
+        else:
+            points1 = lovecache.pick(lovedoffset + offset1)
+
+        if offset2 == 0:
+            points2 = list(lovepoints)
+        else:
+            points2 = lovecache.pick(lovedoffset + offset2)
+
+        r10 = 1.0e9
+        rok = False
+        if len(rayleighpoints) >= 3 and rayleighpoints[0][1] <= 0.10:
+            _, rf, rc, _ = zip(*rayleighpoints)
+            rcurve = scipy.interpolate.interp1d(rf, rc)
+            r10 = rcurve(0.10)
+            rok = True
+        
+        l110 = 1.0e-3
+        l1ok = False
+        if len(points1) >= 3 and points1[0][1] <= 0.10:
+            _, lf1, lc1, _ = zip(*points1)
+            lcurve = scipy.interpolate.interp1d(lf1, lc1)
+            l110 = lcurve(0.10)
+            l1ok = True
+
+        l210 = 1.0e-3
+        l2ok = False
+        if len(points2) >= 3 and points2[0][1] <= 0.10:
+            _, lf2, lc2, _ = zip(*points2)
+            lcurve = scipy.interpolate.interp1d(lf2, lc2)
+            l210 = lcurve(0.10)
+            l2ok = True
+        
+        score1 = numpy.abs(r10/l110 - 0.80)
+        score2 = numpy.abs(r10/l210 - 0.80)
+
+        if rok and l1ok and l2ok:
+            print('Resolving Love: %d %f - %d %f' % (offset1, score1,
+                                                     offset2, score2))
+            
+            if score1 < score2:
+                lovepoints = list(points1)
+            else:
+                lovepoints = list(points2)
+
+
+        offset1, score1, offset2, score2 = rayleighbounds
+        print('Rayleigh between troughs:', rayleighdoffset, offset1, score1, offset2, score2)
+        pickprofile.count('between_troughs')
+            
+        if offset1 == 0:
+            points1 = list(rayleighpoints)
+        else:
+            points1 = rayleighcache.pick(rayleighdoffset + offset1)
+            
+        if offset2 == 0:
+            points2 = list(rayleighpoints)
+        else:
+            points2 = rayleighcache.pick(rayleighdoffset + offset2)
+
+        l10 = 1.0e-3
+        lok = False
+        if len(lovepoints) >= 3 and lovepoints[0][1] <= 0.10:
+            _, lf, lc, _ = zip(*lovepoints)
+            lcurve = scipy.interpolate.interp1d(lf, lc)
+            l10 = lcurve(0.10)
+            lok = True
+
+        r110 = 1.0e9
+        r1ok = False
+        if len(points1) >= 3 and points1[0][1] <= 0.10:
+            _, rf1, rc1, _ = zip(*points1)
+            rcurve = scipy.interpolate.interp1d(rf1, rc1)
+            r110 = rcurve(0.10)
+            r1ok = True
+
+        r210 = 1.0e9
+        r2ok = False
+        if len(points2) >= 3 and points2[0][1] <= 0.10:
+            _, rf2, rc2, _ = zip(*points2)
+            rcurve = scipy.interpolate.interp1d(rf2, rc2)
+            r210 = rcurve(0.10)
+            r2ok = True
+
+        score1 = numpy.abs(r110/l10 - 0.90)
+        score2 = numpy.abs(r210/l10 - 0.90)
+
+        if r1ok and r2ok and lok:
+            print('A: Resolving Rayleigh: %d %f - %d %f' % (offset1, score1,
+                                                            offset2, score2))
+            if score1 < score2:
+                rayleighpoints = list(points1)
+            else:
+                rayleighpoints = list(points2)
+
+    return lovepoints, rayleighpoints
+
+################################################################################
+#
+# Library interface
+#
+################################################################################
+
+#
+# Picks are returned as numpy record arrays with one row per extremum/zero
+# crossing, err is the half spacing to the phase velocity two offsets away
+#
+PICK_DTYPE = [('sign', 'i4'), ('f', 'f8'), ('c', 'f8'), ('offset', 'i4'), ('err', 'f8')]
+
+#
+# Picking options, the defaults are those of the estimate_*_phase_amplitude.py
+# scripts (attributes match their argument names).
+#
+class PickOptions:
+
+    def __init__(self, freq_min = 1.0/40.0, freq_max = 0.35, filter = 3.0, concurrent = False, offset_window = 0, crop = False):
+
+        self.freq_min = freq_min
+        self.freq_max = freq_max
+        self.filter = filter
+        self.concurrent = concurrent
+        self.offset_window = offset_window
+        self.crop = crop
+
+    #
+    # Trial offsets for pick_offset_window, None for the sequential search
+    #
+    def window(self):
+
+        if self.offset_window > 0:
+            return offset_window(self.offset_window)
+
+        return None
+
+def estimate_errors(j0zeros, j1zeros, sign, f, offset, distkm):
+
+    zeros = numpy.where(sign == 0, j0zeros[offset], j1zeros[offset])
+
+    neighbour = numpy.where(offset >= 2, offset - 2, offset + 2)
+    neighbourzeros = numpy.where(sign == 0, j0zeros[neighbour], j1zeros[neighbour])
+    
+    c0 = 2.0*numpy.pi*f * distkm/zeros
+    cplus = 2.0*numpy.pi*f * distkm/neighbourzeros
+
+    return (cplus - c0)/2.0
+
+def picks_array(points, j0zeros, j1zeros, distkm):
+
+    picks = numpy.zeros((len(points),), dtype = PICK_DTYPE)
+
+    if len(points) > 0:
+        s, f, c, o = zip(*points)
+        picks['sign'] = s
+        picks['f'] = f
+        picks['c'] = c
+        picks['offset'] = o
+        picks['err'] = estimate_errors(j0zeros, j1zeros, picks['sign'], picks['f'], picks['offset'], distkm)
+
+    return picks
+
+#
+# Relabel picks with their zero offsets shifted by delta
+#
+def relabel(picks, delta, j0zeros, j1zeros, distkm):
+
+    relabelled = picks.copy()
+    relabelled['offset'] = picks['offset'] + delta
+
+    zeros = numpy.where(picks['sign'] == 0, j0zeros[relabelled['offset']], j1zeros[relabelled['offset']])
+    relabelled['c'] = 2.0*numpy.pi*picks['f'] * distkm/zeros
+    relabelled['err'] = estimate_errors(j0zeros, j1zeros, relabelled['sign'], relabelled['f'], relabelled['offset'], distkm)
+
+    return relabelled
+
+#
+# Band of interest cropping: picking only looks at the signal within the picking
+# range (and the range searched for the start), the search windows and hill climbs
+# beyond the outermost picks and, through smoothing, the kernel radius around these.
+# The margin allows BAND_SPACINGS spacings between extrema at the fastest reference
+# phase velocity plus the widest kernel, so that the smoothed signal is unchanged
+# where it is used. The one difference is that the amplitude threshold used when
+# finding the first trough (estimate_first_trough_offset) is relative to the
+# largest amplitude within the band rather than in the whole spectrum.
+#
+def band_margin(freq, distkm, refs, widths):
+
+    cmax = max([numpy.max(ref.y) for ref in refs])
+    spacing = cmax/(2.0*distkm)
+
+    radius = max([int(GAUSSIAN_TRUNCATE*w + 0.5) for w in widths] + [0]) + 1
+
+    return BAND_SPACINGS*spacing + radius*(freq[1] - freq[0])
+
+def crop_band(freq, ncf, fmin, fmax, margin):
+
+    fmin = min(fmin, START_FMIN) - margin
+    fmax = max(fmax, START_FMAX) + margin
+
+    i0 = max(numpy.searchsorted(freq, fmin, 'right') - 1, 0)
+    i1 = min(numpy.searchsorted(freq, fmax, 'left') + 1, freq.size)
+
+    return freq[i0:i1], ncf[i0:i1]
+
+#
+# Spectra cropped to the band of interest if requested in options
+#
+def band_spectra(specs, distkm, refs, widths, options):
+
+    if not options.crop:
+        return specs
+
+    freq = specs[0][0]
+    margin = band_margin(freq, distkm, refs, widths)
+
+    return [crop_band(f, ncf, options.freq_min, options.freq_max, margin) for f, ncf in specs]
+
+#
+# RMS relative difference between the picked and reference phase velocities
+#
+def reference_misfit(picks, phaseref):
+
+    if picks.size == 0:
+        return numpy.inf
+
+    cref = phaseref(picks['f'])
+    return numpy.sqrt(numpy.mean(((picks['c'] - cref)/cref)**2))
+
+#
+# Pick Love and Rayleigh phase for a station pair from in memory spectra. The
+# spectra are (freq, ncf) tuples (as returned by dispersionfile.loaddispersion),
+# refs the (Love, Rayleigh) reference phase curves (see load_reference) and the
+# Love and Rayleigh picks are returned as PICK_DTYPE arrays.
+#
+def pick_station_pair(love_spec, rayleigh_spec, distkm, refs, options = None):
+
+    if options is None:
+        options = PickOptions()
+
+    (freq, lovencf), (_, rayleighncf) = band_spectra((love_spec, rayleigh_spec), distkm, refs, [options.filter], options)
+
+    return pick_signals(freq, ncf_signal(lovencf, options.filter), ncf_signal(rayleighncf, options.filter),
+                        distkm, refs, options)
+
+def pick_signals(freq, lovesignal, rayleighsignal, distkm, refs, options):
+
+    lovephaseref, rayleighphaseref = refs
+
+    j0zeros = besselzeros.j0zeros()
+    j1zeros = besselzeros.j1zeros()
+
+    lovepoints, rayleighpoints = pick_joint(j0zeros, j1zeros, freq,
+                                            lovesignal, rayleighsignal,
+                                            distkm, lovephaseref, rayleighphaseref,
+                                            options.freq_min, options.freq_max,
+                                            options.concurrent, options.window())
+
+    return (picks_array(lovepoints, j0zeros, j1zeros, distkm),
+            picks_array(rayleighpoints, j0zeros, j1zeros, distkm))
+
+#
+# Pick a station pair for each of a list of filter widths, the smoothed signals
+# for all widths are computed together (see ncf_signals) and, if the Love and
+# Rayleigh data files are given, cached (see cached_ncf_signals). Returns a list
+# of (width, Love picks, Rayleigh picks, Love misfit, Rayleigh misfit) in the
+# order of widths where the misfits are reference_misfit of the picks. The
+# misfits are for comparison only, no width is preferred.
+#
+def sweep_station_pair(love_spec, rayleigh_spec, distkm, refs, widths, options = None, cachefiles = (None, None)):
+
+    if options is None:
+        options = PickOptions()
+
+    (freq, lovencf), (_, rayleighncf) = band_spectra((love_spec, rayleigh_spec), distkm, refs, widths, options)
+    lovephaseref, rayleighphaseref = refs
+    lovefile, rayleighfile = cachefiles
+
+    lovesignals = cached_ncf_signals(lovefile, freq, lovencf, widths)
+    rayleighsignals = cached_ncf_signals(rayleighfile, freq, rayleighncf, widths)
+
+    results = []
+    for i, width in enumerate(widths):
+        print('Filter width: %g' % width)
+        lovepicks, rayleighpicks = pick_signals(freq, lovesignals[i], rayleighsignals[i], distkm, refs, options)
+
+        results.append((width, lovepicks, rayleighpicks,
+                        reference_misfit(lovepicks, lovephaseref),
+                        reference_misfit(rayleighpicks, rayleighphaseref)))
+
+    return results
+
+#
+# Pick Rayleigh phase only, as pick_station_pair with a single spectrum and
+# reference.
+#
+def pick_rayleigh(rayleigh_spec, distkm, ref, options = None):
+
+    if options is None:
+        options = PickOptions()
+
+    (freq, rayleighncf), = band_spectra((rayleigh_spec,), distkm, (ref,), [options.filter], options)
+
+    return pick_rayleigh_signal(freq, ncf_signal(rayleighncf, options.filter), distkm, ref, options)
+
+def pick_rayleigh_signal(freq, rayleighsignal, distkm, ref, options):
+
+    j0zeros = besselzeros.j0zeros()
+    j1zeros = besselzeros.j1zeros()
+
+    window = options.window()
+
+    print('Picking Rayleigh')
+    if window is None:
+        rayleighpoints, _, _ = pick_offset(j0zeros, j1zeros, freq, rayleighsignal, distkm, ref,
+                                           options.freq_min, options.freq_max, 'Rayleigh')
+
+    else:
+        pool = None
+        if options.concurrent:
+            pool = multiprocessing.Pool()
+
+        rayleighpoints, _, _ = pick_offset_window(j0zeros, j1zeros, freq, rayleighsignal, distkm, ref,
+                                                  options.freq_min, options.freq_max, 'Rayleigh', window,
+                                                  pool = pool)
+
+        if not pool is None:
+            pool.close()
+            pool.join()
+
+    return picks_array(rayleighpoints, j0zeros, j1zeros, distkm)
+
+#
+# As sweep_station_pair for Rayleigh only, returns a list of (width, picks, misfit)
+#
+def sweep_rayleigh(rayleigh_spec, distkm, ref, widths, options = None, cachefile = None):
+
+    if options is None:
+        options = PickOptions()
+
+    (freq, rayleighncf), = band_spectra((rayleigh_spec,), distkm, (ref,), widths, options)
+
+    rayleighsignals = cached_ncf_signals(cachefile, freq, rayleighncf, widths)
+
+    results = []
+    for i, width in enumerate(widths):
+        print('Filter width: %g' % width)
+        rayleighpicks = pick_rayleigh_signal(freq, rayleighsignals[i], distkm, ref, options)
+
+        results.append((width, rayleighpicks, reference_misfit(rayleighpicks, ref)))
+
+    return results
+
+#
+# Written to a temporary and renamed so that readers (eg the optimizers started
+# on the output of watch_pick.py) never see a partial file
+#
+def save_picks(fname, picks):
+
+    tmpname = '%s.tmp%d' % (fname, os.getpid())
+    f = open(tmpname, 'w')
+    for s, fr, c, o, e in picks:
+        f.write('%15.9f %15.9f %d %4d %15.9f\n' % (fr, c, s, o, e))
+
+    f.close()
+    os.rename(tmpname, fname)
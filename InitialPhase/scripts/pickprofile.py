@@ -0,0 +1,226 @@
+import json
+import time
+
+#
+# Opt-in profile of the picking scripts (--profile). When enabled the stage
+# functions below are replaced in their modules by wrappers recording the number
+# of calls and the wall time spent in them, and count() records events (offsets
+# retried, picks added/rejected etc). Times are inclusive (eg pick_walk includes
+# its add_next_forward/add_next_backward calls) and the times of worker processes
+# are merged into the parent, so stage times can sum to more than the run time.
+#
+# The profile is saved as JSON:
+#
+#   {"seconds": <wall time>, "runs": 1,
+#    "stages": {<stage>: {"calls": <n>, "seconds": <t>}, ...},
+#    "counts": {<event>: <n>, ...}, ...}
+#
+# and profiles from many runs can be summed with aggregate(), eg
+#
+#   python pickprofile.py phase_*.profile.json
+#
+STAGES = [
+    ('dispersionfile', ['loaddispersion']),
+    ('phasepick', ['band_spectra',
+                   'ncf_signal',
+                   'ncf_signals',
+                   'pick_start',
+                   'pick_walk',
+                   'add_next_forward',
+                   'add_next_backward',
+                   'estimate_first_trough_offset',
+                   'pick_offset',
+                   'pick_offset_window',
+                   'pick_joint',
+                   'pick_rayleigh_signal']),
+    ('estimaterepair', ['predict_next',
+                        'predict_next_batch'])
+]
+
+if hasattr(time, 'perf_counter'):
+    timer = time.perf_counter
+else:
+    timer = time.time
+
+#
+# Stage name -> [calls, seconds] and event name -> count, None when disabled
+#
+stages = None
+counters = None
+started = None
+
+wrapped = False
+
+def timed(name, function):
+
+    def wrapper(*args, **kwargs):
+        t0 = timer()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            if not stages is None:
+                stage = stages.setdefault(name, [0, 0.0])
+                stage[0] = stage[0] + 1
+                stage[1] = stage[1] + (timer() - t0)
+
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+def enable():
+
+    global wrapped
+
+    if not wrapped:
+        for modulename, names in STAGES:
+            module = __import__(modulename)
+            for name in names:
+                setattr(module, name, timed(name, getattr(module, name)))
+        wrapped = True
+
+    reset()
+
+def enabled():
+
+    return not stages is None
+
+def reset():
+
+    global stages, counters, started
+
+    stages = {}
+    counters = {}
+    started = timer()
+
+#
+# Restart the profile of a worker process forked from a profiling parent so that
+# its snapshot() only has the worker's own work (nothing if not profiling)
+#
+def reset_worker():
+
+    if not stages is None:
+        reset()
+
+def count(name, n = 1):
+
+    if not counters is None:
+        counters[name] = counters.get(name, 0) + n
+
+#
+# The profile so far as a dictionary (None if profiling is not enabled)
+#
+def snapshot():
+
+    if stages is None:
+        return None
+
+    profile = {
+        'seconds' : timer() - started,
+        'runs' : 1,
+        'stages' : dict([(name, {'calls' : c, 'seconds' : t}) for name, (c, t) in stages.items()]),
+        'counts' : dict(counters)
+    }
+
+    return profile
+
+#
+# Add the stages and counts of a worker's snapshot to this process
+#
+def merge(profile):
+
+    if stages is None or profile is None:
+        return
+
+    for name, stage in profile['stages'].items():
+        s = stages.setdefault(name, [0, 0.0])
+        s[0] = s[0] + stage['calls']
+        s[1] = s[1] + stage['seconds']
+
+    for name, n in profile['counts'].items():
+        count(name, n)
+
+def write(fname, profile):
+
+    f = open(fname, 'w')
+    json.dump(profile, f, indent = 2, separators = (',', ': '), sort_keys = True)
+    f.write('\n')
+    f.close()
+
+#
+# Write this process's profile with extra information (eg the station pair)
+#
+def save(fname, info = None):
+
+    profile = snapshot()
+    if not info is None:
+        profile.update(info)
+
+    write(fname, profile)
+
+    return profile
+
+def load(fname):
+
+    f = open(fname, 'r')
+    profile = json.load(f)
+    f.close()
+
+    return profile
+
+#
+# Sum of several profiles (the wall time and number of runs are summed as well)
+#
+def aggregate(profiles):
+
+    total = {'seconds' : 0.0, 'runs' : 0, 'stages' : {}, 'counts' : {}}
+
+    for profile in profiles:
+
+        total['seconds'] = total['seconds'] + profile['seconds']
+        total['runs'] = total['runs'] + profile.get('runs', 1)
+
+        for name, stage in profile['stages'].items():
+            s = total['stages'].setdefault(name, {'calls' : 0, 'seconds' : 0.0})
+            s['calls'] = s['calls'] + stage['calls']
+            s['seconds'] = s['seconds'] + stage['seconds']
+
+        for name, n in profile['counts'].items():
+            total['counts'][name] = total['counts'].get(name, 0) + n
+
+    return total
+
+def report(profile):
+
+    lines = ['Profile: %d run(s), %.3f s' % (profile['runs'], profile['seconds'])]
+
+    lines.append('  %-30s %10s %12s %12s' % ('stage', 'calls', 'seconds', 'ms/call'))
+    for name, stage in sorted(profile['stages'].items(), key = lambda s: -s[1]['seconds']):
+        lines.append('  %-30s %10d %12.3f %12.3f' % (name,
+                                                     stage['calls'],
+                                                     stage['seconds'],
+                                                     1.0e3*stage['seconds']/max(stage['calls'], 1)))
+
+    lines.append('  %-30s %10s' % ('event', 'count'))
+    for name, n in sorted(profile['counts'].items()):
+        lines.append('  %-30s %10d' % (name, n))
+
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('profiles', type = str, nargs = '+', help = 'Profile JSON files to aggregate')
+
+    parser.add_argument('-o', '--output', type = str, default = None, help = 'Output aggregated profile')
+
+    args = parser.parse_args()
+
+    total = aggregate([load(fname) for fname in args.profiles])
+
+    print(report(total))
+
+    if not args.output is None:
+        write(args.output, total)
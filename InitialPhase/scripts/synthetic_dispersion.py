@@ -0,0 +1,177 @@
+import sys
+import os
+import argparse
+
+import numpy
+import scipy.special
+
+import dispersionfile
+import phasepick
+import uniforminterp
+
+#
+# Synthetic dispersion_<pair> files for benchmarking the picking at scale. The
+# real part of the noise correlation function of a pair at distance r is
+#
+#   ncf(f) = envelope(f) J0(2 pi f r/c(f)) + noise
+#
+# where c(f) is a reference phase velocity curve (as written by
+# Reference/mkreference*) scaled by a random factor per pair (the truth), the
+# envelope is flat between flow and fhigh with cosine tapers and the noise is
+# Gaussian with standard deviation noise times the envelope maximum. The
+# spectrum is set equal to the ncf.
+#
+# The pairs and their truth are listed in <output-path>/synthetic.txt, one line
+# per pair
+#
+#   pair distkm noise love_scale rayleigh_scale
+#
+# ie the true phase velocity is scale times the reference (see load_truth).
+#
+
+MANIFEST = 'synthetic.txt'
+
+def envelope(freq, flow, fhigh, taper):
+
+    e = numpy.ones(freq.size)
+
+    lower = freq < flow
+    e[lower] = 0.5 - 0.5*numpy.cos(numpy.pi*numpy.clip((freq[lower] - (flow - taper))/taper, 0.0, 1.0))
+
+    upper = freq > fhigh
+    e[upper] = 0.5 + 0.5*numpy.cos(numpy.pi*numpy.clip((freq[upper] - fhigh)/taper, 0.0, 1.0))
+
+    return e
+
+def synthetic_ncf(freq, distkm, phaseref, scale, noise, rng, flow = 0.02, fhigh = 0.4, taper = 0.02):
+
+    #
+    # Outside the reference the phase velocity is held at its end values
+    #
+    c = scale * numpy.interp(freq, phaseref.x, phaseref.y)
+    k = 2.0*numpy.pi*freq/c
+
+    e = envelope(freq, flow, fhigh, taper)
+    signal = e * scipy.special.j0(k * distkm)
+
+    if noise > 0.0:
+        signal = signal + rng.normal(0.0, noise * numpy.max(e), freq.size)
+
+    return signal + 0.0j
+
+def pair_name(i):
+
+    return 'SYN%05dA_SYN%05dB' % (i, i)
+
+def dispersion_name(path, response, station_pair, binary):
+
+    if binary:
+        ext = '.bin'
+    else:
+        ext = '.txt'
+
+    return os.path.join(path, response, 'dispersion_%s%s' % (station_pair, ext))
+
+def load_manifest(path):
+
+    pairs = []
+
+    f = open(os.path.join(path, MANIFEST), 'r')
+    for line in f.readlines():
+        line = line.split('#')[0].strip()
+        if len(line) > 0:
+            pair, distkm, noise, lovescale, rayleighscale = line.split()
+            pairs.append((pair, float(distkm), float(noise), float(lovescale), float(rayleighscale)))
+    f.close()
+
+    return pairs
+
+#
+# The true phase velocity curve of a pair from the reference it was generated from
+#
+def load_truth(phaseref, scale):
+
+    return uniforminterp.UniformInterp1d(phaseref.x, scale * phaseref.y)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-o', '--output-path', type = str, required = True, help = 'Output directory (LoveResponse/RayleighResponse are created in it)')
+
+    parser.add_argument('-r', '--love-reference', type = str, default = os.path.join(sys.path[0], '../../tutorial/reference/reference_love_fine.txt'), help = 'Reference Love phase')
+    parser.add_argument('-R', '--rayleigh-reference', type = str, default = os.path.join(sys.path[0], '../../tutorial/reference/reference_rayleigh_fine.txt'), help = 'Reference Rayleigh phase')
+
+    parser.add_argument('-d', '--distances', type = str, default = '50,100,200,300', help = 'Comma separated list of distances (km)')
+    parser.add_argument('-n', '--pairs', type = int, default = 250, help = 'Number of pairs per distance')
+
+    parser.add_argument('-N', '--noise', type = float, default = 0.1, help = 'Noise standard deviation relative to the envelope maximum')
+    parser.add_argument('-P', '--perturb', type = float, default = 0.02, help = 'Maximum relative perturbation of the true phase velocity from the reference')
+
+    parser.add_argument('--flow', type = float, default = 0.02, help = 'Lower frequency of the flat part of the envelope (Hz)')
+    parser.add_argument('--fhigh', type = float, default = 0.4, help = 'Upper frequency of the flat part of the envelope (Hz)')
+    parser.add_argument('--taper', type = float, default = 0.02, help = 'Width of the envelope cosine tapers (Hz)')
+
+    parser.add_argument('--samples', type = int, default = 4097, help = 'Number of frequency samples')
+    parser.add_argument('--samplerate', type = float, default = 2.0, help = 'Sample rate (Hz), the spectrum extends to half this')
+
+    parser.add_argument('--seed', type = int, default = 0, help = 'Random seed')
+
+    parser.add_argument('--binary', action = 'store_true', default = False, help = 'Write binary .bin files rather than text')
+    parser.add_argument('--rayleigh-only', action = 'store_true', default = False, help = 'Only write Rayleigh responses')
+
+    args = parser.parse_args()
+
+    distances = [float(d) for d in args.distances.split(',')]
+
+    lovephaseref = phasepick.load_reference(args.love_reference)
+    rayleighphaseref = phasepick.load_reference(args.rayleigh_reference)
+
+    responses = [('RayleighResponse', rayleighphaseref)]
+    if not args.rayleigh_only:
+        responses.append(('LoveResponse', lovephaseref))
+
+    for response, _ in responses:
+        if not os.path.isdir(os.path.join(args.output_path, response)):
+            os.makedirs(os.path.join(args.output_path, response))
+
+    #
+    # Rounded to the precision of the text format so that the truth holds at the
+    # frequencies read back
+    #
+    freq = numpy.round(numpy.linspace(0.0, args.samplerate/2.0, args.samples), 6)
+
+    manifest = open(os.path.join(args.output_path, MANIFEST), 'w')
+    manifest.write('# love reference %s\n' % os.path.abspath(args.love_reference))
+    manifest.write('# rayleigh reference %s\n' % os.path.abspath(args.rayleigh_reference))
+    manifest.write('# pair distkm noise love_scale rayleigh_scale\n')
+
+    total = len(distances) * args.pairs
+    for i in range(total):
+
+        distkm = distances[i % len(distances)]
+        station_pair = pair_name(i)
+
+        rng = numpy.random.RandomState(args.seed + i)
+        scales = {'LoveResponse' : 1.0 + rng.uniform(-args.perturb, args.perturb),
+                  'RayleighResponse' : 1.0 + rng.uniform(-args.perturb, args.perturb)}
+
+        header = (0.0, 0.0, 0.0, 0.0, distkm, 1)
+        for response, phaseref in responses:
+
+            ncf = synthetic_ncf(freq, distkm, phaseref, scales[response], args.noise, rng,
+                                args.flow, args.fhigh, args.taper)
+
+            fname = dispersion_name(args.output_path, response, station_pair, args.binary)
+            if args.binary:
+                dispersionfile.savedispersion_binary(fname, header, freq, args.samplerate, 1.0, 1.0, ncf, ncf)
+            else:
+                dispersionfile.savedispersion_text(fname, header, freq, args.samplerate, 1.0, 1.0, ncf, ncf)
+
+        manifest.write('%s %15.9f %15.9f %15.9f %15.9f\n' % (station_pair, distkm, args.noise,
+                                                              scales['LoveResponse'], scales['RayleighResponse']))
+
+        if (i + 1) % 100 == 0 or i + 1 == total:
+            sys.stderr.write('%6d/%6d\n' % (i + 1, total))
+
+    manifest.close()
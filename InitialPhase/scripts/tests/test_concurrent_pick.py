@@ -0,0 +1,171 @@
+#
+# Picking with worker processes (pick_joint concurrent, the offset window walks
+# prefetched in a pool) against picking one at a time: the picks and the printed
+# trace must be the same. Synthetic J0 spectra with phase velocities scaled from
+# smooth Love and Rayleigh references are used. Run with
+#
+#   python -m pytest InitialPhase/scripts/tests
+#
+import os
+import sys
+import multiprocessing
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import numpy
+import scipy.special
+
+SCRIPTS = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, SCRIPTS)
+
+import phasepick
+import uniforminterp
+
+J0ZEROS = scipy.special.jn_zeros(0, 1024)
+J1ZEROS = scipy.special.jn_zeros(1, 1024)
+
+FREQ = numpy.arange(4097)/8192.0
+
+FMIN = 0.025
+FMAX = 0.35
+
+def reference(c0, c1):
+
+    return uniforminterp.UniformInterp1d(FREQ, c0 + c1*numpy.exp(-FREQ/0.06))
+
+LOVEREF = reference(3.1, 1.3)
+RAYLEIGHREF = reference(2.8, 1.2)
+
+def synthetic(cref, distkm, scale):
+
+    c = cref(FREQ) * scale
+
+    return scipy.special.j0(2.0*numpy.pi*FREQ*distkm/c) * numpy.exp(-2.0*FREQ)
+
+#
+# (distance, Love scale, Rayleigh scale)
+#
+CASES = [(30.0, 1.0, 1.0),
+         (40.0, 1.02, 0.98),
+         (60.0, 1.0, 1.0),
+         (120.0, 1.04, 0.97),
+         (250.0, 0.95, 1.05)]
+
+def traced(function, *args):
+
+    stdout = sys.stdout
+    sys.stdout = trace = StringIO()
+    try:
+        result = function(*args)
+    finally:
+        sys.stdout = stdout
+
+    return result, trace.getvalue()
+
+class ConcurrentPickTest(unittest.TestCase):
+
+    def test_pick_joint(self):
+
+        for distkm, lovescale, rayleighscale in CASES:
+
+            lovesignal = synthetic(LOVEREF, distkm, lovescale)
+            rayleighsignal = synthetic(RAYLEIGHREF, distkm, rayleighscale)
+
+            for window in [None, phasepick.offset_window(4), phasepick.offset_window(6)]:
+
+                results = []
+                for concurrent in [False, True]:
+                    results.append(traced(phasepick.pick_joint, J0ZEROS, J1ZEROS, FREQ,
+                                          lovesignal, rayleighsignal, distkm, LOVEREF, RAYLEIGHREF,
+                                          FMIN, FMAX, concurrent, window))
+
+                (serial, serialtrace), (concurrent, concurrenttrace) = results
+
+                message = 'distance %g window %s' % (distkm, window)
+                self.assertGreater(len(serial[0]), 0, message)
+                self.assertGreater(len(serial[1]), 0, message)
+                self.assertEqual(serial, concurrent, message)
+                self.assertEqual(serialtrace, concurrenttrace, message)
+
+    def test_prefetch(self):
+
+        distkm, scale, _ = CASES[1]
+        signal = synthetic(RAYLEIGHREF, distkm, scale)
+        window = phasepick.offset_window(6)
+
+        pool = multiprocessing.Pool(2)
+        try:
+            serial, serialtrace = traced(phasepick.pick_offset_window, J0ZEROS, J1ZEROS, FREQ, signal, distkm,
+                                         RAYLEIGHREF, FMIN, FMAX, 'Rayleigh', window)
+            pooled, pooledtrace = traced(phasepick.pick_offset_window, J0ZEROS, J1ZEROS, FREQ, signal, distkm,
+                                         RAYLEIGHREF, FMIN, FMAX, 'Rayleigh', window, None, pool)
+
+            self.assertEqual(serial, pooled)
+            self.assertEqual(serialtrace, pooledtrace)
+
+            #
+            # Each prefetched walk as picked alone, and offsets already picked
+            # are not walked again
+            #
+            cache = phasepick.PickCache(J0ZEROS, J1ZEROS, FREQ, signal, distkm, RAYLEIGHREF, FMIN, FMAX)
+            first = traced(cache.pick, 0)
+            cache.prefetch(window, pool)
+            self.assertEqual(traced(cache.pick, 0), (first[0], ''))
+
+            for o in window:
+                expected = traced(phasepick.pick, J0ZEROS, J1ZEROS, FREQ, signal, distkm, RAYLEIGHREF,
+                                  FMIN, FMAX, o)
+                if o == 0:
+                    self.assertEqual(traced(cache.pick, o)[0], expected[0])
+                else:
+                    self.assertEqual(traced(cache.pick, o), expected)
+
+        finally:
+            pool.close()
+            pool.join()
+
+    def test_short_pair(self):
+
+        #
+        # The first extremum is labelled with offset 0 or 1, the window offsets
+        # below the first zero are not walked and the offsets too far off to be
+        # scored are skipped, the window agrees with the serial offset search
+        #
+        pool = multiprocessing.Pool(2)
+        try:
+            for distkm in [30.0, 40.0]:
+                signal = synthetic(LOVEREF, distkm, 1.0)
+
+                cache = phasepick.PickCache(J0ZEROS, J1ZEROS, FREQ, signal, distkm, LOVEREF, FMIN, FMAX)
+                window = phasepick.offset_window(6)
+                valid = cache.valid_offsets(window)
+                self.assertLess(cache.start[3], 2)
+                self.assertEqual(valid, [o for o in window if o >= -cache.start[3]])
+
+                expected, _ = traced(phasepick.pick_offset, J0ZEROS, J1ZEROS, FREQ, signal, distkm, LOVEREF,
+                                     FMIN, FMAX, 'Love')
+
+                serial, serialtrace = traced(phasepick.pick_offset_window, J0ZEROS, J1ZEROS, FREQ, signal, distkm,
+                                             LOVEREF, FMIN, FMAX, 'Love', window)
+                pooled, pooledtrace = traced(phasepick.pick_offset_window, J0ZEROS, J1ZEROS, FREQ, signal, distkm,
+                                             LOVEREF, FMIN, FMAX, 'Love', window, None, pool)
+
+                message = 'distance %g' % distkm
+                self.assertEqual(serial, pooled, message)
+                self.assertEqual(serialtrace, pooledtrace, message)
+                self.assertEqual(serial[:2], expected[:2], message)
+
+                for o in window:
+                    if not o in valid:
+                        self.assertFalse('Begin pick: %d\n' % o in serialtrace, message)
+
+        finally:
+            pool.close()
+            pool.join()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+#
+# Startup time budget for headless (--noshow) batch picking. Importing the
+# picking scripts must not pull in matplotlib or scipy.signal and must fit
+# within a fixed time. Run with
+#
+#   python -m pytest InitialPhase/scripts/tests
+#
+# The budget (seconds) can be overridden with AKI_IMPORT_BUDGET for slow
+# machines.
+#
+import os
+import sys
+import subprocess
+import unittest
+
+SCRIPTS = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+IMPORT_BUDGET = float(os.environ.get('AKI_IMPORT_BUDGET', '1.5'))
+
+CHILD = '''
+import sys
+import time
+sys.path.insert(0, %r)
+t0 = time.time()
+import %s
+t1 = time.time()
+print('%%f %%d %%d' %% (t1 - t0, 'matplotlib' in sys.modules, 'scipy.signal' in sys.modules))
+'''
+
+def import_time(module):
+
+    #
+    # Import in a fresh interpreter so that nothing is already cached
+    #
+    output = subprocess.check_output([sys.executable, '-c', CHILD % (SCRIPTS, module)])
+    t, matplotlib, signal = output.decode().split()
+    return float(t), bool(int(matplotlib)), bool(int(signal))
+
+class HeadlessImportTest(unittest.TestCase):
+
+    def check(self, module):
+
+        t, matplotlib, signal = import_time(module)
+
+        self.assertFalse(matplotlib, '%s imports matplotlib at startup' % module)
+        self.assertFalse(signal, '%s imports scipy.signal at startup' % module)
+        self.assertLess(t, IMPORT_BUDGET, '%s took %.3fs to import (budget %.3fs)' % (module, t, IMPORT_BUDGET))
+
+    def test_joint(self):
+        self.check('estimate_joint_phase_amplitude')
+
+    def test_rayleigh(self):
+        self.check('estimate_rayleigh_phase_amplitude')
+
+if __name__ == '__main__':
+    unittest.main()
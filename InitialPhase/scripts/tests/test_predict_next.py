@@ -0,0 +1,123 @@
+#
+# estimaterepair.predict_next_batch against the scalar predict_next for forward
+# and backward predictions, predictions from the current zero (the linear case),
+# points near and outside the ends of the reference and broadcast arguments. Run
+# with
+#
+#   python -m pytest InitialPhase/scripts/tests
+#
+import os
+import sys
+import unittest
+
+import numpy
+import scipy.special
+
+SCRIPTS = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, SCRIPTS)
+
+import estimaterepair
+import uniforminterp
+
+J1ZEROS = scipy.special.jn_zeros(1, 128)
+
+DISTKM = 150.0
+
+TOLERANCE = 1.0e-12
+
+def reference():
+
+    f = numpy.arange(1, 2049)/4096.0
+    return uniforminterp.UniformInterp1d(f, 2.9 + 1.4*numpy.exp(-f/0.07) - 0.8*f*f)
+
+#
+# (f, c, zero) with the extremum at f labelled with offset o and the prediction
+# made for offset o + step, c scaled from the labelled velocity
+#
+def cases(cref, step):
+
+    f = []
+    c = []
+    zero = []
+    for fi in numpy.linspace(0.0, 0.52, 61):
+        for o in range(4, 40, 5):
+            for scale in [0.97, 1.0, 1.03]:
+                f.append(fi)
+                c.append(scale * 2.0*numpy.pi*fi*DISTKM/J1ZEROS[o])
+                zero.append(J1ZEROS[o + step])
+
+    return numpy.array(f), numpy.array(c), numpy.array(zero)
+
+class PredictNextTest(unittest.TestCase):
+
+    def compare(self, cref, f, c, zero):
+
+        expected = []
+        valid = []
+        for fi, ci, zi in zip(f, c, zero):
+            try:
+                expected.append(estimaterepair.predict_next(fi, ci, zi, DISTKM, cref))
+                valid.append(True)
+            except Exception:
+                #
+                # No or an unhandled root, the batch fails in the same way
+                #
+                self.assertRaises(Exception, estimaterepair.predict_next_batch, fi, ci, zi, DISTKM, cref)
+                valid.append(False)
+
+        valid = numpy.array(valid)
+        self.assertGreater(numpy.count_nonzero(valid), 0)
+
+        fnext, cnext = estimaterepair.predict_next_batch(f[valid], c[valid], zero[valid], DISTKM, cref)
+        expected = numpy.array(expected)
+
+        self.assertTrue(numpy.allclose(fnext, expected[:,0], rtol = TOLERANCE, atol = 0.0))
+        self.assertTrue(numpy.allclose(cnext, expected[:,1], rtol = TOLERANCE, atol = 0.0))
+
+        return expected
+
+    def test_forward(self):
+
+        cref = reference()
+        expected = self.compare(cref, *cases(cref, 2))
+
+        #
+        # Some outside the reference (-1, 0) and some predicted
+        #
+        self.assertTrue(numpy.any(expected[:,0] < 0.0))
+        self.assertTrue(numpy.any(expected[:,0] > 0.0))
+
+    def test_backward(self):
+
+        cref = reference()
+        self.compare(cref, *cases(cref, -2))
+
+    def test_linear(self):
+
+        #
+        # Predicting the current zero returns f
+        #
+        cref = reference()
+        f, c, zero = cases(cref, 0)
+        keep = numpy.abs(c - 2.0*numpy.pi*f*DISTKM/zero) < 1.0e-12
+        self.compare(cref, f[keep], c[keep], zero[keep])
+
+    def test_broadcast(self):
+
+        cref = reference()
+        f = 0.1
+        c = cref(f) * numpy.array([[0.98], [1.0], [1.02]])
+        zero = J1ZEROS[10:14]
+
+        fnext, cnext = estimaterepair.predict_next_batch(f, c, zero, DISTKM, cref)
+        self.assertEqual(fnext.shape, (3, 4))
+        self.assertEqual(cnext.shape, (3, 4))
+
+        for i in range(3):
+            for j in range(4):
+                ef, ec = estimaterepair.predict_next(f, c[i,0], zero[j], DISTKM, cref)
+                self.assertAlmostEqual(fnext[i,j], ef, delta = TOLERANCE*abs(ef))
+                self.assertAlmostEqual(cnext[i,j], ec, delta = TOLERANCE*abs(ec))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,246 @@
+#
+# The block evaluated reference trough search (phasepick.find_reference_troughs,
+# reference_offset_block and estimate_first_trough_offset) against the per zero
+# loops it replaced, on synthetic J0 signals with offsets labelled too low, right
+# and too high. Run with
+#
+#   python -m pytest InitialPhase/scripts/tests
+#
+import os
+import sys
+import unittest
+
+import numpy
+import scipy.special
+
+SCRIPTS = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, SCRIPTS)
+
+import estimaterepair
+import phasepick
+import uniforminterp
+
+#
+# The loop implementation as it was in estimate_joint_phase_amplitude.py (the
+# diagnostic printing removed)
+#
+def loop_find_reference_trough(zero, distkm, freq, cref):
+
+    f0 = numpy.min(cref.x)
+    fl = numpy.max(cref.x)
+
+    i = numpy.where(freq >= f0)[0][0]
+
+    A = zero/(2.0 * numpy.pi * distkm)
+
+    res = freq[i] - cref(freq[i]) * A
+    f = freq[i]
+    fi = i
+    i = i + 1
+
+    while (freq[i] <= fl):
+
+        tres = freq[i] - cref(freq[i]) * A
+
+        if (numpy.abs(tres) < numpy.abs(res)):
+            res = tres
+            f = freq[i]
+            fi = i
+
+        i = i + 1
+
+    return fi, f, res
+
+def loop_estimate_first_trough_offset(j1zeros, points, distkm, freq, signal, cref):
+
+    maxamplitude = numpy.max(numpy.abs(signal))
+    ampthreshold = maxamplitude * 0.25
+
+    for i, (s, f, c, o) in enumerate(points):
+        if s == -1:
+
+            ai = numpy.abs(f - freq).argmin()
+            if signal[ai] < -ampthreshold:
+                break
+
+    if (f > 0.10):
+        ampthreshold = maxamplitude * 0.10
+        for i, (s, f, c, o) in enumerate(points):
+            if s == -1:
+
+                ai = numpy.abs(f - freq).argmin()
+                if signal[ai] < -ampthreshold:
+                    break
+
+    est_nextzf, est_nextzc = estimaterepair.predict_next(f, c, j1zeros[o + 2], distkm, cref)
+
+    refc = cref(f)
+    refest_nextzf, refest_nextzc = estimaterepair.predict_next(f, refc, j1zeros[o + 2], distkm, cref)
+
+    best_offset = o
+    fi, fref, res = loop_find_reference_trough(j1zeros[best_offset], distkm, freq, cref)
+    best_dist = numpy.abs(f - fref)
+
+    score = best_dist
+    delta_offset = 0
+
+    if (f > fref):
+
+        trial_offset = best_offset + 2
+        trial_dist = 1e9
+        while True:
+            fi, fref, res = loop_find_reference_trough(j1zeros[trial_offset], distkm, freq, cref)
+            trial_dist = numpy.abs(f - fref)
+
+            if (trial_dist < best_dist):
+                best_offset = trial_offset
+                best_dist = trial_dist
+                trial_offset = trial_offset + 2
+                delta_offset = delta_offset + 2
+
+            else:
+                break
+
+        return delta_offset, score, (delta_offset, best_dist, delta_offset + 2, trial_dist)
+
+    else:
+
+        trial_offset = best_offset - 2
+        trial_dist = 1e9
+        while trial_offset >= 0:
+            fi, fref, res = loop_find_reference_trough(j1zeros[trial_offset], distkm, freq, cref)
+            trial_dist = numpy.abs(f - fref)
+
+            if (trial_dist < best_dist):
+                best_offset = trial_offset
+                best_dist = trial_dist
+                trial_offset = trial_offset - 2
+                delta_offset = delta_offset - 2
+
+            else:
+                break
+
+        return delta_offset, score, (delta_offset, best_dist, delta_offset - 2, trial_dist)
+
+J1ZEROS = scipy.special.jn_zeros(1, 256)
+
+#
+# Uniform 0 - 1 Hz spectrum grid with a reference defined over part of it as
+# the mkreference curves are
+#
+FREQ = numpy.arange(4097)/4096.0
+
+def reference():
+
+    f = FREQ[5:2130]
+    return uniforminterp.UniformInterp1d(f, 3.0 + 1.5*numpy.exp(-f/0.05))
+
+#
+# J0 signal for a phase velocity scaled from the reference and its extrema
+# (sign, frequency, phase velocity, offset) between 0.02 and 0.4 Hz, offsets
+# labelled shift higher than the true ones
+#
+def synthetic(cref, distkm, scale, shift):
+
+    c = numpy.zeros(FREQ.shape)
+    i0 = 5
+    i1 = 2130
+    c[i0:i1] = cref(FREQ[i0:i1]) * scale
+    c[:i0] = c[i0]
+    c[i1:] = c[i1 - 1]
+
+    x = 2.0*numpy.pi*FREQ*distkm/c
+    signal = scipy.special.j0(x)
+
+    points = []
+    for i in range(1, FREQ.size - 1):
+        if FREQ[i] < 0.02 or FREQ[i] > 0.4:
+            continue
+
+        if signal[i] < signal[i - 1] and signal[i] <= signal[i + 1]:
+            s = -1
+        elif signal[i] > signal[i - 1] and signal[i] >= signal[i + 1]:
+            s = 1
+        else:
+            continue
+
+        o = int(numpy.abs(J1ZEROS - x[i]).argmin()) + shift
+        points.append((s, FREQ[i], 2.0*numpy.pi*FREQ[i]*distkm/J1ZEROS[o], o))
+
+    return signal, points
+
+class ReferenceTroughTest(unittest.TestCase):
+
+    def test_find_reference_troughs(self):
+
+        cref = reference()
+        for distkm in [20.0, 80.0, 250.0, 900.0]:
+
+            zeros = J1ZEROS[:64]
+            fi, f, res = phasepick.find_reference_troughs(zeros, distkm, FREQ, cref)
+
+            for k, zero in enumerate(zeros):
+                efi, ef, eres = loop_find_reference_trough(zero, distkm, FREQ, cref)
+
+                self.assertEqual(fi[k], efi)
+                self.assertEqual(f[k], ef)
+                self.assertAlmostEqual(res[k], eres, delta = 1.0e-12)
+
+                self.assertEqual(phasepick.find_reference_trough(zero, distkm, FREQ, cref)[0], efi)
+
+    def test_reference_offset_block(self):
+
+        cref = reference()
+        offsets, fref, dists = phasepick.reference_offset_block(J1ZEROS, -6, 10, 120.0, FREQ, 0.1, cref)
+
+        self.assertEqual(list(offsets), [0, 2, 4, 6, 8, 10])
+        for o, fr, d in zip(offsets, fref, dists):
+            _, ef, _ = loop_find_reference_trough(J1ZEROS[o], 120.0, FREQ, cref)
+            self.assertEqual(fr, ef)
+            self.assertAlmostEqual(d, abs(0.1 - ef), delta = 1.0e-12)
+
+    def test_estimate_first_trough_offset(self):
+
+        cref = reference()
+        cases = 0
+        deltas = set()
+        for distkm in [60.0, 150.0, 300.0]:
+            for scale in [0.9, 1.0, 1.1]:
+                for shift in [-20, -4, -2, 0, 2, 4, 20]:
+
+                    signal, points = synthetic(cref, distkm, scale, shift)
+                    if len(points) == 0 or min([o for _, _, _, o in points]) < 0:
+                        continue
+
+                    message = 'distance %g scale %g shift %d' % (distkm, scale, shift)
+
+                    #
+                    # Labels far enough off have no predicted next trough, both fail
+                    #
+                    try:
+                        edelta, escore, edetail = loop_estimate_first_trough_offset(J1ZEROS, points, distkm,
+                                                                                    FREQ, signal, cref)
+                    except Exception:
+                        with self.assertRaises(Exception, msg = message):
+                            phasepick.estimate_first_trough_offset(J1ZEROS, points, distkm, FREQ, signal, cref)
+                        continue
+
+                    delta, score, detail = phasepick.estimate_first_trough_offset(J1ZEROS, points, distkm,
+                                                                                  FREQ, signal, cref)
+
+                    self.assertEqual(delta, edelta, message)
+                    self.assertAlmostEqual(score, escore, delta = 1.0e-12, msg = message)
+                    self.assertEqual(detail[0], edetail[0], message)
+                    self.assertEqual(detail[2], edetail[2], message)
+                    self.assertTrue(numpy.allclose(detail[1::2], edetail[1::2], rtol = 0.0, atol = 1.0e-12), message)
+                    cases = cases + 1
+                    deltas.add(delta)
+
+        #
+        # Enough cases with corrections in both directions
+        #
+        self.assertGreater(cases, 20)
+        self.assertTrue(min(deltas) < 0 and max(deltas) > 0, sorted(deltas))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#
+# Edge cases of the search windows: mkwindow for empty windows, windows at the
+# ends of the spectrum and descending bounds, and the windowed searches on an
+# IndexedSignal against the scanning searches on the plain array. Run with
+#
+#   python -m pytest InitialPhase/scripts/tests
+#
+import os
+import sys
+import unittest
+
+import numpy
+
+SCRIPTS = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, SCRIPTS)
+
+import phasepick
+
+#
+# Full (from 0 Hz) and cropped spectrum grids
+#
+FREQ = numpy.arange(257)/512.0
+CROPPED = FREQ[32:160]
+
+def signal(freq):
+
+    #
+    # Decaying oscillation with flat runs (ties) and zeros in it
+    #
+    s = numpy.cos(2.0*numpy.pi*freq*40.0) * numpy.exp(-freq*4.0)
+    s[100:104] = s[100]
+    s[180] = 0.0
+    return numpy.round(s, 3)
+
+class MkWindowTest(unittest.TestCase):
+
+    def test_empty_window(self):
+
+        #
+        # On a bin and between two bins, the window still brackets fmin
+        #
+        i = 40
+        self.assertEqual(phasepick.mkwindow(FREQ, FREQ[i], FREQ[i]), (i, i + 2))
+
+        f = 0.5*(FREQ[i] + FREQ[i + 1])
+        self.assertEqual(phasepick.mkwindow(FREQ, f, f), (i, i + 2))
+
+    def test_window_at_end(self):
+
+        n = FREQ.size
+
+        #
+        # The last bin below fmax, the window runs one past the end and the
+        # searches are clamped to the spectrum
+        #
+        if0, if1 = phasepick.mkwindow(FREQ, FREQ[n - 10], FREQ[n - 2])
+        self.assertEqual((if0, if1), (n - 10, n))
+
+        self.assertRaises(phasepick.WindowError, phasepick.mkwindow, FREQ, FREQ[n - 10], FREQ[n - 1])
+        self.assertRaises(phasepick.WindowError, phasepick.mkwindow, FREQ, FREQ[n - 10], 1.0)
+
+        #
+        # Still an IndexError for callers catching that
+        #
+        self.assertRaises(IndexError, phasepick.mkwindow, FREQ, 1.0, 2.0)
+
+    def test_window_at_start(self):
+
+        self.assertEqual(phasepick.mkwindow(FREQ, 0.0, FREQ[3]), (0, 5))
+
+        #
+        # Below the first bin of a cropped spectrum
+        #
+        self.assertEqual(phasepick.mkwindow(CROPPED, CROPPED[0], CROPPED[3]), (0, 5))
+        self.assertRaises(phasepick.WindowError, phasepick.mkwindow, CROPPED, CROPPED[0] - 0.001, CROPPED[3])
+
+    def test_descending_window(self):
+
+        self.assertRaises(phasepick.WindowError, phasepick.mkwindow, FREQ, FREQ[50], FREQ[40])
+        self.assertRaises(phasepick.WindowError, phasepick.mkwindow, FREQ, FREQ[50], FREQ[50] - 1.0e-6)
+
+class WindowSearchTest(unittest.TestCase):
+
+    def check(self, freq, s, if0, if1):
+
+        indexed = phasepick.indexsignal(s)
+        window = (if0, if1)
+
+        self.assertEqual(phasepick.findpeak(freq, indexed, if0, if1),
+                         phasepick.findpeak(freq, s, if0, if1), window)
+        self.assertEqual(phasepick.findtrough(freq, indexed, if0, if1),
+                         phasepick.findtrough(freq, s, if0, if1), window)
+        for sign in [-1, 1]:
+            self.assertEqual(phasepick.findzerocross(sign, freq, indexed, if0, if1),
+                             phasepick.findzerocross(sign, freq, s, if0, if1), window)
+
+    def test_edge_windows(self):
+
+        s = signal(FREQ)
+        n = FREQ.size
+
+        windows = [phasepick.mkwindow(FREQ, FREQ[i], FREQ[i]) for i in [0, 1, 99, 100, 179, n - 2]]
+        windows.extend([phasepick.mkwindow(FREQ, FREQ[n - 20], FREQ[n - 2]),
+                        phasepick.mkwindow(FREQ, 0.0, FREQ[30]),
+                        (-3, 10), (n - 5, n + 3), (50, 50), (60, 51)])
+
+        for if0, if1 in windows:
+            self.check(FREQ, s, if0, if1)
+
+    def test_all_windows(self):
+
+        s = signal(FREQ)
+        for if0 in range(-1, FREQ.size + 1, 3):
+            for if1 in range(if0, min(if0 + 40, FREQ.size + 2)):
+                self.check(FREQ, s, if0, if1)
+
+    def test_empty_window_search(self):
+
+        s = phasepick.indexsignal(signal(FREQ))
+
+        self.assertEqual(phasepick.findpeak(FREQ, s, 50, 50), -1)
+        self.assertEqual(phasepick.findtrough(FREQ, s, 50, 50), -1)
+        self.assertEqual(phasepick.findzerocross(1, FREQ, s, 50, 50), -1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#
+# Linear interpolation of reference phase curves sampled on a uniform frequency
+# grid (as written by Reference/mkreference*).
+#
+# This is a drop in replacement for scipy.interpolate.interp1d(x, y) (linear,
+# out of range values raise ValueError) for the scalar calls made repeatedly
+# while picking: the interval containing f is indexed directly from the grid
+# spacing rather than found by a binary search. The values are identical to
+# interp1d/numpy.interp. Array arguments are passed to numpy.interp.
+#
+# dcdf() gives the central difference (c(f + h) - c(f - h))/(2h) used for dc/df
+# when predicting the next zero.
+#
+import numpy
+
+DCDF_STEP = 0.001
+
+class UniformInterp1d:
+
+    def __init__(self, x, y):
+
+        self.x = numpy.array(x, dtype = 'float')
+        self.y = numpy.array(y, dtype = 'float')
+
+        n = self.x.size
+        if n < 2 or self.y.shape != self.x.shape:
+            raise ValueError('x and y must be 1-D arrays of the same length (>= 2)')
+
+        self.dx = (self.x[-1] - self.x[0])/float(n - 1)
+        if self.dx <= 0.0:
+            raise ValueError('x must be increasing')
+
+        #
+        # The grid is only written to limited precision, the index computed from
+        # the spacing is corrected by at most one interval
+        #
+        grid = self.x[0] + numpy.arange(n)*self.dx
+        if numpy.max(numpy.abs(self.x - grid)) > 0.25*self.dx:
+            raise ValueError('x is not uniformly sampled')
+
+        self.slope = (self.y[1:] - self.y[:-1])/(self.x[1:] - self.x[:-1])
+
+        #
+        # Python lists for the scalar path, indexing these is much cheaper than
+        # indexing numpy arrays
+        #
+        self._x = self.x.tolist()
+        self._y = self.y.tolist()
+        self._slope = self.slope.tolist()
+        self._x0 = self._x[0]
+        self._xn = self._x[-1]
+        self._idx = 1.0/self.dx
+        self._last = n - 2
+
+    def _interval(self, f):
+
+        if not (f >= self._x0 and f <= self._xn):
+            if f < self._x0:
+                raise ValueError('A value in x_new is below the interpolation range.')
+            raise ValueError('A value in x_new is above the interpolation range.')
+
+        i = int((f - self._x0)*self._idx)
+        if i > self._last:
+            i = self._last
+
+        if f < self._x[i]:
+            i = i - 1
+        elif f >= self._x[i + 1] and i < self._last:
+            i = i + 1
+
+        return i
+
+    def __call__(self, f):
+
+        if numpy.ndim(f) > 0:
+            f = numpy.asarray(f, dtype = 'float')
+            if f.size > 0:
+                self._interval(numpy.min(f))
+                self._interval(numpy.max(f))
+            return numpy.interp(f, self.x, self.y)
+
+        f = float(f)
+        if f == self._xn:
+            return numpy.float64(self._y[-1])
+
+        i = self._interval(f)
+        return numpy.float64(self._slope[i]*(f - self._x[i]) + self._y[i])
+
+    def dcdf(self, f, h = DCDF_STEP):
+
+        #
+        # Same expression (and value) as the inline central differences it
+        # replaces, each side is an O(1) lookup into the precomputed slopes
+        #
+        return (self(f + h) - self(f - h))/(2.0*h)
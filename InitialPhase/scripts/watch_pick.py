@@ -0,0 +1,256 @@
+import sys
+import os
+import time
+import signal
+import argparse
+import multiprocessing
+import collections
+
+import dispersionfile
+import besselzeros
+import batch_pick
+
+#
+# Long running picking service. The LoveResponse/RayleighResponse directories of
+# the data path are watched for new (or rewritten) dispersion_<pair> files and
+# each complete pair is picked by a pool of worker processes (see batch_pick.py)
+# that keep the reference curves, Bessel zeros and modules loaded between pairs.
+# Outputs are the same phase_<pair>.love/.rayleigh files, written atomically.
+#
+# Directories are rescanned every --interval seconds, or as soon as a file is
+# written if the optional inotify_simple module is installed. A file is only
+# picked once its size and modification time are unchanged over --settle
+# seconds so that files still being written are skipped. Pairs whose outputs are
+# newer than their inputs are not picked again (eg after a restart).
+#
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+#
+# The parent process handles Ctrl-C and SIGTERM, which are often sent to the
+# whole process group (eg by a terminal or timeout), and stops the pool itself
+#
+def initworker(args):
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    batch_pick.initworker(args)
+
+class Watcher:
+
+    def __init__(self, args):
+
+        self.args = args
+
+        if args.rayleigh_only:
+            self.responses = ['RayleighResponse']
+        else:
+            self.responses = ['RayleighResponse', 'LoveResponse']
+
+        #
+        # Pair -> (signature, time first seen) of files waiting to settle and
+        # pair -> signature of those queued or picked
+        #
+        self.pending = {}
+        self.done = {}
+
+        self.inotify = None
+        if inotify_simple is not None and not args.poll:
+            self.inotify = inotify_simple.INotify()
+            flags = inotify_simple.flags.CLOSE_WRITE | inotify_simple.flags.MOVED_TO | inotify_simple.flags.CREATE
+            for response in self.responses:
+                self.inotify.add_watch(os.path.join(args.path, response), flags)
+
+    def outputs(self, station_pair):
+
+        output = os.path.join(self.args.output_path, 'phase_%s' % station_pair)
+        if self.args.rayleigh_only:
+            return ['%s.rayleigh' % output]
+
+        return ['%s.love' % output, '%s.rayleigh' % output]
+
+    #
+    # Size and modification time of the files of a pair (None if incomplete)
+    #
+    def signature(self, station_pair):
+
+        signature = []
+        for response in self.responses:
+            fname = dispersionfile.dispersionpath(self.args.path, response, station_pair)
+            try:
+                st = os.stat(fname)
+            except OSError:
+                return None
+            signature.append((fname, st.st_size, st.st_mtime))
+
+        return tuple(signature)
+
+    def uptodate(self, station_pair, signature):
+
+        newest = max([mtime for _, _, mtime in signature])
+        for fname in self.outputs(station_pair):
+            if not os.path.exists(fname) or os.path.getmtime(fname) < newest:
+                return False
+
+        return True
+
+    #
+    # Pairs whose files have settled since the last scan
+    #
+    def scan(self):
+
+        now = time.time()
+        ready = []
+
+        for station_pair in batch_pick.glob_pairs(self.args.path, 'RayleighResponse', 'dispersion_*'):
+
+            signature = self.signature(station_pair)
+            if signature is None or self.done.get(station_pair) == signature:
+                continue
+
+            if not station_pair in self.done and self.uptodate(station_pair, signature):
+                self.done[station_pair] = signature
+                continue
+
+            seen = self.pending.get(station_pair)
+            if seen is None or seen[0] != signature:
+                self.pending[station_pair] = (signature, now)
+            elif now - seen[1] >= self.args.settle:
+                del self.pending[station_pair]
+                self.done[station_pair] = signature
+                ready.append(station_pair)
+
+        return ready
+
+    def wait(self, timeout):
+
+        if self.inotify is None:
+            time.sleep(timeout)
+        else:
+            #
+            # Still time out to let pending files settle
+            #
+            if len(self.pending) > 0:
+                timeout = min(timeout, self.args.settle)
+            self.inotify.read(timeout = int(1000*timeout))
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-p', '--path', type = str, required = True, help = 'Data base path to watch (LoveResponse/RayleighResponse)')
+    parser.add_argument('-o', '--output-path', type = str, required = True, help = 'Output directory')
+
+    parser.add_argument('-j', '--jobs', type = int, default = multiprocessing.cpu_count(), help = 'Number of worker processes')
+
+    parser.add_argument('-r', '--love-reference', type = str, default = os.path.join(sys.path[0], '../../tutorial/reference/reference_love_fine.txt'), help = 'Reference Love phase')
+    parser.add_argument('-R', '--rayleigh-reference', type = str, default = os.path.join(sys.path[0], '../../tutorial/reference/reference_rayleigh_fine.txt'), help = 'Reference Rayleigh phase')
+
+    parser.add_argument('-f', '--freq-min', type = float, default = 1.0/40.0, help = 'Min frequency')
+    parser.add_argument('-F', '--freq-max', type = float, default = 0.35, help = 'Max frequency')
+
+    parser.add_argument('--filter', type = float, default = 3, help = 'Filter width')
+
+    parser.add_argument('--crop', action = 'store_true', default = False, help = 'Crop spectra to the band of interest before smoothing and picking')
+
+    parser.add_argument('--offset-window', type = int, default = 0, help = 'Pick all offsets -N..N (step 2) and use the best rather than searching offsets one at a time')
+
+    parser.add_argument('--rayleigh-only', action = 'store_true', default = False, help = 'Pick Rayleigh only (as estimate_rayleigh_phase_amplitude.py)')
+
+    parser.add_argument('--profile', action = 'store_true', default = False, help = 'Record time and calls per picking stage for each pair')
+
+    parser.add_argument('-i', '--interval', type = float, default = 10.0, help = 'Seconds between scans of the data directories')
+    parser.add_argument('-s', '--settle', type = float, default = 5.0, help = 'Seconds a file must be unchanged before it is picked')
+    parser.add_argument('--poll', action = 'store_true', default = False, help = 'Always poll rather than use inotify')
+    parser.add_argument('--once', action = 'store_true', default = False, help = 'Pick what is there (ignoring --settle) and exit')
+
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = 'Show picking output of workers')
+
+    args = parser.parse_args()
+
+    if args.once:
+        args.settle = 0.0
+
+    if not os.path.isdir(args.output_path):
+        os.makedirs(args.output_path)
+
+    watcher = Watcher(args)
+
+    #
+    # Build the Bessel zero table before forking so workers just map it
+    #
+    besselzeros.table()
+
+    jobs = max(1, args.jobs)
+    pool = multiprocessing.Pool(jobs, initworker, (args,))
+
+    #
+    # Stopping the service (SIGTERM) stops as Ctrl-C does
+    #
+    def terminate(signum, frame):
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, terminate)
+
+    #
+    # Ready pairs wait here rather than in the pool so that at most two pairs per
+    # worker are in flight and stopping only waits for those. Results are
+    # collected by the pool's result thread.
+    #
+    backlog = collections.deque()
+    results = []
+    inflight = 0
+    picked = 0
+
+    def finished(result):
+        results.append(result)
+
+    def collect():
+
+        global inflight, picked
+
+        while len(results) > 0:
+            station_pair, error = results.pop(0)
+            inflight = inflight - 1
+            picked = picked + 1
+            if error is None:
+                sys.stderr.write('%s %s\n' % (time.strftime('%Y-%m-%d %H:%M:%S'), station_pair))
+            else:
+                sys.stderr.write('%s %s failed: %s\n' % (time.strftime('%Y-%m-%d %H:%M:%S'), station_pair, error))
+
+    try:
+        while True:
+
+            ready = watcher.scan()
+            if args.once and len(ready) == 0 and len(watcher.pending) > 0:
+                ready = watcher.scan()
+            backlog.extend(ready)
+
+            collect()
+
+            while len(backlog) > 0 and inflight < 2*jobs:
+                pool.apply_async(batch_pick.runworker, (backlog.popleft(),), callback = finished)
+                inflight = inflight + 1
+
+            if args.once:
+                if inflight == 0 and len(backlog) == 0 and len(watcher.pending) == 0:
+                    break
+                time.sleep(0.1)
+            elif inflight > 0:
+                watcher.wait(1.0)
+            else:
+                watcher.wait(args.interval)
+
+    except KeyboardInterrupt:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        sys.stderr.write('Stopping, finishing %d pairs in progress (%d waiting pairs not picked)\n' % (inflight, len(backlog)))
+
+    pool.close()
+    pool.join()
+    collect()
+
+    sys.stderr.write('%d pairs picked\n' % picked)
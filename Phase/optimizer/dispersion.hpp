@@ -26,9 +26,15 @@
 #ifndef dispersion_hpp
 #define dispersion_hpp
 
+#include <thread>
+
 #include <fftw3.h>
 #include <gsl/gsl_sf_bessel.h>
 
+#include "spec1d/dispersionfile.hpp"
+#include "spec1d/textfile.hpp"
+#include "spec1d/fftplans.hpp"
+
 class DispersionData {
 public:
 
@@ -38,42 +44,72 @@ public:
     MAP_TYPE_PRODUCT
   } te_map_t;
   
-  DispersionData(double _fmin, double _fmax) :
+  DispersionData(double _fmin, double _fmax, double _band_margin = -1.0) :
     fmin(_fmin),
     fmax(_fmax),
+    band_margin(_band_margin),
+    band_first(0),
     fullspec(NULL),
     fullenv(NULL),
+    ftan_threads(1),
     env_signal(NULL),
     env_spectrum(NULL),
+    map_itmin(0),
+    map_width(0),
     noise_sigma(1.0)
   {
   }
 
-  bool load(const char *filename)
+  //
+  // Plans are owned by FFTPlans, only the buffers are freed
+  //
+  ~DispersionData()
   {
-    FILE *fp = fopen(filename, "r");
-    if (fp == NULL) {
-      fprintf(stderr, "error: failed to open %s for reading\n", filename);
-      return false;
+    fftw_free(fullspec);
+    fftw_free(fullenv);
+    for (auto &b : ftan_buffers) {
+      fftw_free(b.spec);
+      fftw_free(b.env);
     }
+    fftw_free(env_signal);
+    fftw_free(env_spectrum);
+  }
 
-    if (fscanf(fp, "%lf %lf %lf %lf %lf\n",
-	       &lon1, &lat1, &lon2, &lat2, &distkm) != 5) {
-      fprintf(stderr, "error: failed to parse line 1\n");
-      return false;
-    }
+  DispersionData(const DispersionData &) = delete;
+  DispersionData &operator=(const DispersionData &) = delete;
 
-    if (fscanf(fp, "%lf %d %lf %lf %d\n",
-	       &samplerate, &daycount, &asnr, &csnr, &samples) != 5) {
-      fprintf(stderr, "error: failed to parse line 2\n");
-      return false;
+  bool load(const char *_filename)
+  {
+    //
+    // Either version of a station pair may be given, the current one is loaded
+    //
+    std::string path = DispersionBinaryFile::preferred_path(_filename);
+    const char *filename = path.c_str();
+
+    if (DispersionBinaryFile::is_binary(filename)) {
+      if (!load_binary(filename)) {
+	return false;
+      }
+    } else {
+      if (!load_text(filename)) {
+	return false;
+      }
     }
 
-    freq.resize(samples);
-    sreal.resize(samples);
-    simag.resize(samples);
-    ncfreal.resize(samples);
-    ncfimag.resize(samples);
+    //
+    // Only the band of interest is kept if a margin is set
+    //
+    spectrum_samples = samples;
+    if (band_margin >= 0.0) {
+      //
+      // The Hilbert transform is not local so the envelope (before smoothing)
+      // is computed from the full spectrum and cropped with it
+      //
+      if (!compute_hilbert_envelope(band_envelope)) {
+	return false;
+      }
+      crop_band(fmin - band_margin, fmax + band_margin);
+    }
 
     predicted_k.resize(samples);
     predicted_group.resize(samples);
@@ -86,16 +122,6 @@ public:
     flast = 0;
     for (int i = 0; i < samples; i ++) {
 
-      
-      if (fscanf(fp,
-		 "%lf %lf %lf %lf %lf\n",
-		 &freq[i],
-		 &sreal[i], &simag[i],
-		 &ncfreal[i], &ncfimag[i]) != 5) {
-	fprintf(stderr, "error: failed to read spectrum\n");
-	return false;
-      }
-
       if (freq[i] >= fmin && i < ffirst) {
 	ffirst = i;
       }
@@ -106,8 +132,118 @@ public:
 
     }
 
-    fclose(fp);
-    
+    return true;
+  }
+
+  //
+  // Only keep the samples from the last at or below fbandmin to the first at or
+  // above fbandmax. Sample i of the cropped spectrum is sample band_first + i of
+  // the spectrum in the file.
+  //
+  void crop_band(double fbandmin, double fbandmax)
+  {
+    int first = 0;
+    while (first < samples - 1 && freq[first + 1] <= fbandmin) {
+      first ++;
+    }
+
+    int last = samples - 1;
+    while (last > first && freq[last - 1] >= fbandmax) {
+      last --;
+    }
+
+    crop(freq, first, last);
+    crop(sreal, first, last);
+    crop(simag, first, last);
+    crop(ncfreal, first, last);
+    crop(ncfimag, first, last);
+    if (!band_envelope.empty()) {
+      crop(band_envelope, first, last);
+    }
+
+    band_first += first;
+    samples = last - first + 1;
+  }
+
+  static void crop(std::vector<double> &v, int first, int last)
+  {
+    std::vector<double>(v.begin() + first, v.begin() + last + 1).swap(v);
+  }
+
+  bool load_binary(const char *filename)
+  {
+    DispersionBinaryFile file;
+    if (!file.open(filename)) {
+      return false;
+    }
+
+    lon1 = file.header->lon1;
+    lat1 = file.header->lat1;
+    lon2 = file.header->lon2;
+    lat2 = file.header->lat2;
+    distkm = file.header->distkm;
+
+    samplerate = file.header->samplerate;
+    daycount = file.header->daycount;
+    asnr = file.header->asnr;
+    csnr = file.header->csnr;
+    samples = file.header->samples;
+
+    freq.assign(file.freq, file.freq + samples);
+    sreal.resize(samples);
+    simag.resize(samples);
+    ncfreal.resize(samples);
+    ncfimag.resize(samples);
+
+    for (int i = 0; i < samples; i ++) {
+      sreal[i] = file.spec[2*i];
+      simag[i] = file.spec[2*i + 1];
+      ncfreal[i] = file.ncf[2*i];
+      ncfimag[i] = file.ncf[2*i + 1];
+    }
+
+    return true;
+  }
+
+  bool load_text(const char *filename)
+  {
+    TextFile file;
+    if (!file.open(filename)) {
+      fprintf(stderr, "error: failed to open %s for reading\n", filename);
+      return false;
+    }
+
+    if (!(file.read(lon1) && file.read(lat1) &&
+	  file.read(lon2) && file.read(lat2) &&
+	  file.read(distkm))) {
+      fprintf(stderr, "error: failed to parse line 1\n");
+      return false;
+    }
+
+    if (!(file.read(samplerate) && file.read(daycount) &&
+	  file.read(asnr) && file.read(csnr) &&
+	  file.read(samples))) {
+      fprintf(stderr, "error: failed to parse line 2\n");
+      return false;
+    }
+
+    freq.resize(samples);
+    sreal.resize(samples);
+    simag.resize(samples);
+    ncfreal.resize(samples);
+    ncfimag.resize(samples);
+
+    for (int i = 0; i < samples; i ++) {
+
+      if (!(file.read(freq[i]) &&
+	    file.read(sreal[i]) && file.read(simag[i]) &&
+	    file.read(ncfreal[i]) && file.read(ncfimag[i]))) {
+	fprintf(stderr, "error: failed to read spectrum\n");
+	return false;
+      }
+
+    }
+
     return true;
   }
 
@@ -133,54 +269,217 @@ public:
     return true;
   }
 
+  //
+  // Effectively computes | H ( F^-1( G(cfreq, sigma) * (sreal + j*simag)) ) | where H is the
+  // Hilbert transform, F^-1 the inverse Fourier transform, G a Gaussian filter.
+  // The transform is always of the full spectrum, samples outside a cropped
+  // band are zero.
+  //
   bool compute_ftan_envelope(double cfreq, double sigma, double *acausal, double *causal)
   {
-    //
-    // Effectively computes | H ( F^-1( G(cfreq, sigma) * (sreal + j*simag)) ) | where H is the
-    // Hilbert transform, F^-1 the inverse Fourier transform, G a Gaussian filter.
-    //
-    int N2 = samples - 1;
+    int N2 = spectrum_samples - 1;
     int N = N2 * 2;
     if (fullspec == NULL) {
 
+      plan = FFTPlans::instance().plan(N, 1, FFTW_BACKWARD);
+      if (plan == NULL) {
+	return false;
+      }
+
       fullspec = (fftw_complex*)fftw_malloc(sizeof(fftw_complex) * N);
       fullenv = (fftw_complex*)fftw_malloc(sizeof(fftw_complex) * N);
-
-      plan = fftw_plan_dft_1d(N, fullspec, fullenv, FFTW_BACKWARD, FFTW_ESTIMATE);
     }
 
+    ftan_filter(cfreq, sigma, fullspec);
+
     //
-    // Set -ve frequencies to zero and positive to twice the filtered signal
+    // Inverse FFT
     //
-    for (int i = 0; i < samples; i ++) {
+    fftw_execute_dft(plan, fullspec, fullenv);
 
-      if (i > 0) {
-	fullspec[i][0] = 0.0;
-	fullspec[i][1] = 0.0;
-      }
+    ftan_envelope(fullenv, acausal, causal);
 
-      double df = freq[i] - cfreq;
-      double g = 2.0*exp(-(df*df)/(2.0 * sigma*sigma));
-      fullspec[i + samples][0] = g * sreal[i];
-      fullspec[i + samples][1] = g * simag[i];
+    return true;
+  }
+
+  //
+  // Number of threads computing the envelopes in build_time_energy_map, 0 for
+  // one per core
+  //
+  void set_ftan_threads(int threads)
+  {
+    ftan_threads = threads;
+  }
+
+  //
+  // Buffers for threads 0 .. threads - 1 and the batched plans they share, one
+  // for full blocks and one for the last block of rows bins if shorter
+  //
+  bool prepare_ftan(int threads, int rows)
+  {
+    int N = (spectrum_samples - 1) * 2;
+
+    ftan_plan = FFTPlans::instance().plan(N, FTAN_BLOCK, FFTW_BACKWARD);
+    if (ftan_plan == NULL) {
+      return false;
     }
 
-    //
-    // Inverse FFT
-    //
-    fftw_execute(plan);
+    if (rows % FTAN_BLOCK > 0 &&
+	FFTPlans::instance().plan(N, rows % FTAN_BLOCK, FFTW_BACKWARD) == NULL) {
+      return false;
+    }
+
+    while ((int)ftan_buffers.size() < threads) {
+
+      FtanBuffers b;
+      b.spec = (fftw_complex*)fftw_malloc(sizeof(fftw_complex) * N * FTAN_BLOCK);
+      b.env = (fftw_complex*)fftw_malloc(sizeof(fftw_complex) * N * FTAN_BLOCK);
+
+      ftan_buffers.push_back(b);
+    }
+
+    return true;
+  }
+
+  //
+  // As compute_ftan_envelope for the count (at most FTAN_BLOCK) centre
+  // frequencies from freq[first] with one batched transform in the buffers of
+  // the thread (see prepare_ftan). The envelopes are then read with
+  // ftan_envelope from ftan_buffers[thread].env + r*N for r = 0 .. count - 1.
+  //
+  bool compute_ftan_envelopes(int first, int count, double sigma, int thread = 0)
+  {
+    int N2 = spectrum_samples - 1;
+    int N = N2 * 2;
+
+    if (count > FTAN_BLOCK) {
+      fprintf(stderr, "error: FTAN block too large\n");
+      return false;
+    }
+
+    if (thread >= (int)ftan_buffers.size()) {
+      fprintf(stderr, "error: no FTAN buffers for thread %d\n", thread);
+      return false;
+    }
+
+    FtanBuffers &b = ftan_buffers[thread];
 
     //
-    // Absolute value gives envelope
+    // Only the count rows filled are transformed, a short block with its own
+    // plan
     //
-    for (int i = 0; i < N2; i ++) {
-      acausal[i] = env(fullenv[N - 1 - i][0], fullenv[N - 1 - i][1]);
-      causal[i] = env(fullenv[i][0], fullenv[i][1]);
+    fftw_plan p = ftan_plan;
+    if (count < FTAN_BLOCK) {
+      p = FFTPlans::instance().plan(N, count, FFTW_BACKWARD);
+      if (p == NULL) {
+	return false;
+      }
+    }
+
+    for (int r = 0; r < count; r ++) {
+      ftan_filter(freq[first + r], sigma, b.spec + r * N);
     }
 
+    fftw_execute_dft(p, b.spec, b.env);
+
     return true;
   }
 
+  //
+  // Map window rows of the blocks of FTAN_BLOCK bins thread, thread + threads,
+  // ... from ffirst, row i at energy + (i - ffirst)*map_width
+  //
+  void compute_ftan_rows(int thread, int threads, double sigma, te_map_t map_type, double *energy)
+  {
+    int N2 = spectrum_samples - 1;
+    int N = N2 * 2;
+
+    int itmin = map_itmin;
+    int itmax = map_itmin + map_width - 1;
+
+    std::vector<double> causal(N2);
+    std::vector<double> acausal(N2);
+
+    for (int first = ffirst + thread * FTAN_BLOCK; first <= flast; first += threads * FTAN_BLOCK) {
+
+      int count = flast - first + 1;
+      if (count > FTAN_BLOCK) {
+	count = FTAN_BLOCK;
+      }
+      compute_ftan_envelopes(first, count, sigma, thread);
+
+      for (int r = 0; r < count; r ++) {
+
+	ftan_envelope(ftan_buffers[thread].env + r * N, acausal.data(), causal.data());
+
+	//
+	// e[j - itmin] is the map at time[j]
+	//
+	double *e = energy + (size_t)(first + r - ffirst) * map_width;
+	switch (map_type) {
+	case MAP_TYPE_CAUSAL:
+	  for (int j = itmin; j <= itmax; j ++) {
+	    e[j - itmin] = causal[j];
+	  }
+	  break;
+
+	case MAP_TYPE_ACAUSAL:
+	  for (int j = itmin; j <= itmax; j ++) {
+	    e[j - itmin] = acausal[j];
+	  }
+	  break;
+
+	case MAP_TYPE_PRODUCT:
+	  for (int j = itmin; j <= itmax; j ++) {
+	    e[j - itmin] = causal[j] * acausal[j];
+	  }
+	  break;
+	}
+      }
+    }
+  }
+
+  //
+  // Set -ve frequencies to zero and positive to twice the filtered signal
+  //
+  void ftan_filter(double cfreq, double sigma, fftw_complex *spec)
+  {
+    int N = (spectrum_samples - 1) * 2;
+
+    for (int i = 0; i < N; i ++) {
+      spec[i][0] = 0.0;
+      spec[i][1] = 0.0;
+    }
+
+    for (int i = band_first; i < band_first + samples; i ++) {
+
+      //
+      // The last two samples wrap around (previously written past the end of
+      // fullspec), the shift only changes the phase not the envelope.
+      //
+      int k = (i + spectrum_samples) % N;
+
+      double df = freq[i - band_first] - cfreq;
+      double g = 2.0*exp(-(df*df)/(2.0 * sigma*sigma));
+      spec[k][0] = g * sreal[i - band_first];
+      spec[k][1] = g * simag[i - band_first];
+    }
+  }
+
+  //
+  // Absolute value gives envelope
+  //
+  void ftan_envelope(const fftw_complex *envelope, double *acausal, double *causal)
+  {
+    int N2 = spectrum_samples - 1;
+    int N = N2 * 2;
+
+    for (int i = 0; i < N2; i ++) {
+      acausal[i] = env(envelope[N - 1 - i][0], envelope[N - 1 - i][1]);
+      causal[i] = env(envelope[i][0], envelope[i][1]);
+    }
+  }
+
   double env(double r, double i)
   {
     return sqrt(r*r + i*i);
@@ -213,19 +512,27 @@ public:
     noise_sigma = maxA * 0.05;
   }
   
+  //
+  // FTAN map (see compute_ftan_envelope) of the bins ffirst .. flast and the
+  // time of its maximum between distkm/vmax and distkm/vmin (within max_deltav of
+  // the previous bin's if max_deltav > 0). Only the map in that time window is
+  // kept (see time_energy), and not at all if store_map is false. The
+  // optimizers do not build the map, it is for tools reading the response
+  // (see tests/test_ftanmap.cpp).
+  //
   bool build_time_energy_map(double sigma,
 			     te_map_t map_type,
 			     double vmin,
 			     double vmax,
-			     double max_deltav)
+			     double max_deltav,
+			     bool store_map = true)
   {
-    int N2 = samples - 1;
+    int N2 = spectrum_samples - 1;
     int N = N2 * 2;
 
     //
     // Create
     //
-    time_energy_map.resize(freq.size());
     amplitude_max.resize(freq.size());
     time_max.resize(freq.size());
     time.resize(N);
@@ -239,12 +546,12 @@ public:
     //
     // Initialize
     //
-    for (auto &t : time_energy_map) {
-      t = nullptr;
-    }
     for (auto &t : time_max) {
       t = -1.0;
     }
+    for (auto &a : amplitude_max) {
+      a = 0.0;
+    }
 
     double tmin = distkm/vmax;
     double tmax = distkm/vmin;
@@ -263,47 +570,81 @@ public:
       }
     }
 
-    double *causal = new double[N];
-    double *acausal = new double[N];
+    //
+    // The envelopes have N2 samples (the map used to be read past them if
+    // vmin was low enough)
+    //
+    if (itmax > N2 - 1) {
+      itmax = N2 - 1;
+    }
 
-    double df = freq[1] - freq[0];
-    double dt = 1.0/samplerate;
+    map_itmin = itmin;
+    map_width = itmax - itmin + 1;
+    if (map_width < 0) {
+      map_width = 0;
+    }
 
-    int last_maxj = -1;
+    std::vector<double>().swap(time_energy_map);
 
-    max_amplitude = 0.0;
+    if (map_type != MAP_TYPE_CAUSAL &&
+	map_type != MAP_TYPE_ACAUSAL &&
+	map_type != MAP_TYPE_PRODUCT) {
+      fprintf(stderr, "error: invalid map type\n");
+      return false;
+    }
 
-    for (int i = ffirst; i <= flast; i ++) {
+    //
+    // The envelopes of each bin are independent and computed in parallel in
+    // blocks of FTAN_BLOCK bins, the ridge then tracked from bin to bin
+    //
+    int rows = flast - ffirst + 1;
+    if (rows < 0) {
+      rows = 0;
+    }
+    int blocks = (rows + FTAN_BLOCK - 1)/FTAN_BLOCK;
 
-      time_energy_map[i] = new double[N];
+    int threads = ftan_threads;
+    if (threads <= 0) {
+      threads = (int)std::thread::hardware_concurrency();
+    }
+    if (threads > blocks) {
+      threads = blocks;
+    }
+    if (threads < 1) {
+      threads = 1;
+    }
 
-      if (!compute_ftan_envelope(freq[i], sigma, acausal, causal)) {
-	return false;
+    if (!prepare_ftan(threads, rows)) {
+      return false;
+    }
+
+    std::vector<double> map((size_t)rows * map_width);
+    if (threads == 1) {
+      compute_ftan_rows(0, 1, sigma, map_type, map.data());
+    } else {
+      std::vector<std::thread> workers;
+      for (int t = 0; t < threads; t ++) {
+	workers.push_back(std::thread(&DispersionData::compute_ftan_rows, this,
+				      t, threads, sigma, map_type, map.data()));
       }
+      for (auto &w : workers) {
+	w.join();
+      }
+    }
 
-      switch (map_type) {
-      case MAP_TYPE_CAUSAL:
-	for (int j = 0; j < N; j ++) {
-	  time_energy_map[i][j] = causal[j];
-	}
-	break;
+    double df = freq[1] - freq[0];
+    double dt = 1.0/samplerate;
 
-      case MAP_TYPE_ACAUSAL:
-	for (int j = 0; j < N; j ++) {
-	  time_energy_map[i][j] = acausal[j];
-	}
-	break;
+    int last_maxj = -1;
 
-      case MAP_TYPE_PRODUCT:
-	for (int j = 0; j < N; j ++) {
-	  time_energy_map[i][j] = causal[j] * acausal[j];
-	}
-	break;
-	
-      default:
-	fprintf(stderr, "error: invalid map type\n");
-	return false;
-      }
+    max_amplitude = 0.0;
+
+    for (int i = ffirst; i <= flast; i ++) {
+
+      //
+      // energy[j - itmin] is the map at time[j]
+      //
+      const double *energy = map.data() + (size_t)(i - ffirst) * map_width;
 
       int maxj = -1;
       if (last_maxj > 0 && max_deltav > 0.0) {
@@ -320,8 +661,8 @@ public:
 
 	double maxe = 0.0;
 	for (int j = mvitmin; j <= itmax; j ++) {
-	  if (time_energy_map[i][j] > maxe) {
-	    maxe = time_energy_map[i][j];
+	  if (energy[j - itmin] > maxe) {
+	    maxe = energy[j - itmin];
 	    maxj = j;
 	  }
 	}
@@ -329,28 +670,45 @@ public:
       } else {
 	double maxe = 0.0;
 	for (int j = itmin; j <= itmax; j ++) {
-	  if (time_energy_map[i][j] > maxe) {
-	    maxe = time_energy_map[i][j];
+	  if (energy[j - itmin] > maxe) {
+	    maxe = energy[j - itmin];
 	    maxj = j;
 	  }
 	}
       }
 
       last_maxj = maxj;
-	
-      time_max[i] = time[maxj];
-      amplitude_max[i] = time_energy_map[i][maxj];
-      if (amplitude_max[i] > max_amplitude) {
-	max_amplitude = amplitude_max[i];
+
+      if (maxj >= 0) {
+	time_max[i] = time[maxj];
+	amplitude_max[i] = energy[maxj - itmin];
+	if (amplitude_max[i] > max_amplitude) {
+	  max_amplitude = amplitude_max[i];
+	}
       }
     }
 
-    delete causal;
-    delete acausal;
+    if (store_map) {
+      time_energy_map.swap(map);
+    }
 
     return true;
   }
 
+  //
+  // The stored map at bin i and time[j], zero outside the window (or if the
+  // map was not stored)
+  //
+  double time_energy(int i, int j) const
+  {
+    int k = j - map_itmin;
+    if (i < ffirst || i > flast || k < 0 || k >= map_width || time_energy_map.empty()) {
+      return 0.0;
+    }
+
+    return time_energy_map[(size_t)(i - ffirst) * map_width + k];
+  }
+
   bool save_max_time(const char *filename)
   {
     FILE *fp = fopen(filename, "w");
@@ -377,29 +735,34 @@ public:
 
   bool save_time_energy(const char *filename)
   {
-    int N2 = samples - 1;
+    int N2 = spectrum_samples - 1;
     int N = N2 * 2;
 
+    if (time_energy_map.empty()) {
+      fprintf(stderr, "error: no time energy map stored\n");
+      return false;
+    }
+
     FILE *fp = fopen(filename, "w");
     if (fp == NULL) {
       fprintf(stderr, "error: failed to create %s\n", filename);
       return false;
     }
 
-    for (auto &p : time_energy_map) {
+    for (int i = 0; i < (int)freq.size(); i ++) {
 
-      if (p == nullptr) {
+      if (i < ffirst || i > flast) {
 	//
 	// Output zero row
 	//
-	for (int i = 0; i < N; i ++) {
+	for (int j = 0; j < N; j ++) {
 	  fprintf(fp, "0.0 ");
 	}
 	
       } else {
 
-	for (int i = 0; i < N; i ++) {
-	  fprintf(fp, "%16.9e ", p[i]);
+	for (int j = 0; j < N; j ++) {
+	  fprintf(fp, "%16.9e ", time_energy(i, j));
 	}
       }
 
@@ -432,14 +795,8 @@ public:
     }
   }
   
-  void compute_envelope(double gaussian_smooth_sigma)
+  bool compute_hilbert_envelope(std::vector<double> &envelope)
   {
-    //
-    // The envelope is computed taking the envelope of the real part of
-    // the spectrum.  
-    //
-
-
     //
     // Compute the envelope of the real part of the spectrum. Once off
     // at start. Little trick here, spectrum is saved as power 2 + 1, eg 4097
@@ -447,13 +804,14 @@ public:
     //
     if (env_signal == NULL) {
       
+      env_fplan = FFTPlans::instance().plan(samples - 1, 1, FFTW_FORWARD);
+      env_bplan = FFTPlans::instance().plan(samples - 1, 1, FFTW_BACKWARD);
+      if (env_fplan == NULL || env_bplan == NULL) {
+	return false;
+      }
+
       env_signal = (fftw_complex*)fftw_malloc(sizeof(fftw_complex) * (samples - 1));
       env_spectrum = (fftw_complex*)fftw_malloc(sizeof(fftw_complex) * (samples - 1));
-
-      env_fplan =
-	fftw_plan_dft_1d(samples - 1, env_signal, env_spectrum, FFTW_FORWARD, FFTW_ESTIMATE);
-      env_bplan =
-	fftw_plan_dft_1d(samples - 1, env_spectrum, env_signal, FFTW_BACKWARD, FFTW_ESTIMATE);
       
     }
 
@@ -464,7 +822,7 @@ public:
     }
 
     // Execute
-    fftw_execute(env_fplan);
+    fftw_execute_dft(env_fplan, env_signal, env_spectrum);
     
     // Zero negative frequencies and double positive
     int half = (samples - 1)/2;
@@ -476,13 +834,31 @@ public:
     }
       
     // Inverse transform
-    fftw_execute(env_bplan);
+    fftw_execute_dft(env_bplan, env_spectrum, env_signal);
 
     // Absolute value is envelope
+    envelope.resize(samples);
     for (int i = 1; i < samples; i ++) {
-      predicted_envelope[i] = env(env_signal[i - 1][0]/(double)(samples - 1), env_signal[i - 1][1]/(double)(samples - 1));
+      envelope[i] = env(env_signal[i - 1][0]/(double)(samples - 1), env_signal[i - 1][1]/(double)(samples - 1));
+    }
+    envelope[0] = 0.0;
+
+    return true;
+  }
+  
+  bool compute_envelope(double gaussian_smooth_sigma)
+  {
+    //
+    // The envelope is computed taking the envelope of the real part of
+    // the spectrum.  
+    //
+    if (band_envelope.empty()) {
+      if (!compute_hilbert_envelope(predicted_envelope)) {
+	return false;
+      }
+    } else {
+      predicted_envelope = band_envelope;
     }
-    predicted_envelope[0] = 0.0;
 
     // Smoothing filter
     if (gaussian_smooth_sigma > 0.0) {
@@ -547,6 +923,7 @@ public:
 	
     }
 
+    return true;
   }
   
   double lon1, lat1;
@@ -562,17 +939,39 @@ public:
   double fmin;
   double fmax;
 
+  double band_margin;
+  int band_first;
+  int spectrum_samples;
+
   int ffirst, flast;
   
   fftw_plan plan;
   fftw_complex *fullspec;
   fftw_complex *fullenv;
 
+  //
+  // Batched FTAN transforms of build_time_energy_map, buffers per thread
+  //
+  static constexpr int FTAN_BLOCK = 8;
+  int ftan_threads;
+  fftw_plan ftan_plan;
+
+  struct FtanBuffers {
+    fftw_complex *spec;
+    fftw_complex *env;
+  };
+  std::vector<FtanBuffers> ftan_buffers;
+
   fftw_plan env_fplan, env_bplan;
   fftw_complex *env_signal;
   fftw_complex *env_spectrum;
 
-  std::vector<double *> time_energy_map;
+  //
+  // Rows ffirst .. flast of the FTAN map from time[map_itmin] for map_width
+  // samples, row i from time_energy_map[(i - ffirst)*map_width]
+  //
+  std::vector<double> time_energy_map;
+  int map_itmin, map_width;
   std::vector<double> amplitude_max;
   std::vector<double> time_max;
   std::vector<double> time;
@@ -585,6 +984,8 @@ public:
   std::vector<double> predicted_envelope;
   std::vector<double> predicted_realspec;
 
+  std::vector<double> band_envelope;
+
   double noise_sigma;
 };
 
@@ -32,7 +32,7 @@
 #include "simple.hpp"
 #include "quasinewton.hpp"
 
-static char short_options[] = "i:I:r:Jf:F:R:V:X:S:o:s:p:b:t:P:e:N:QG:M:W:T:h";
+static char short_options[] = "i:I:r:Jf:F:R:V:X:S:o:s:p:b:t:P:e:N:QG:M:W:T:B:h";
 static struct option long_options[] = {
   {"input-love", required_argument, 0, 'i'},
   {"input-rayleigh", required_argument, 0, 'I'},
@@ -68,6 +68,8 @@ static struct option long_options[] = {
 
   {"skip", required_argument, 0, 'T'},
   
+  {"band-margin", required_argument, 0, 'B'},
+
   {"help", no_argument, 0, 'h'},
   
   {0, 0, 0, 0}
@@ -119,6 +121,7 @@ int main(int argc, char *argv[])
 
   double fmin;
   double fmax;
+  double band_margin;
 
   bool nodata;
 
@@ -148,6 +151,7 @@ int main(int argc, char *argv[])
   
   fmin = 1.0/40.0;
   fmax = 1.0/2.0;
+  band_margin = -1.0;
   
   maxiterations = 5;
   epsilon = 1.0;
@@ -329,6 +333,14 @@ int main(int argc, char *argv[])
       }
       break;
 
+    case 'B':
+      band_margin = atof(optarg);
+      if (band_margin < 0.0) {
+	fprintf(stderr, "error: band margin must be 0 or greater\n");
+	return -1;
+      }
+      break;
+
     default:
       fprintf(stderr, "unknown option %c\n", c);
     case 'h':
@@ -357,8 +369,8 @@ int main(int argc, char *argv[])
     return -1;
   }
 
-  DispersionData data_love(fmin, fmax);
-  DispersionData data_rayleigh(fmin, fmax);
+  DispersionData data_love(fmin, fmax, band_margin);
+  DispersionData data_rayleigh(fmin, fmax, band_margin);
   
   if (!data_love.load(input_love)) {
     return -1;
@@ -462,6 +474,8 @@ void usage(const char *pname)
           " -f|--frequency <float>          Frequency\n"
           " -s|--scale <float>              Laguerre scaling (initial)\n"
           "\n"
+          " -B|--band-margin <float>        Only keep the spectrum within fmin - margin .. fmax + margin (Hz)\n"
+          "\n"
           " -h|--help                       Show usage information\n"
           "\n",
           pname);
@@ -537,8 +551,11 @@ static bool invert(DispersionData &data_love,
   //
   // Build envelopes
   //
-  data_love.compute_envelope(gaussian_smooth);
-  data_rayleigh.compute_envelope(gaussian_smooth);
+  if (!data_love.compute_envelope(gaussian_smooth) ||
+      !data_rayleigh.compute_envelope(gaussian_smooth)) {
+    fprintf(stderr, "error: failed to compute envelopes\n");
+    return false;
+  }
 
   double like_love;
   double like_rayleigh;
@@ -32,7 +32,7 @@
 #include "simple.hpp"
 #include "quasinewton.hpp"
 
-static char short_options[] = "i:r:f:F:JR:V:X:S:o:s:p:b:t:P:e:N:QG:M:h";
+static char short_options[] = "i:r:f:F:JR:V:X:S:o:s:p:b:t:P:e:N:QG:M:B:h";
 static struct option long_options[] = {
   {"input", required_argument, 0, 'i'},
   {"reference", required_argument, 0, 'r'},
@@ -63,6 +63,8 @@ static struct option long_options[] = {
   {"gaussian-smooth", required_argument, 0, 'G'},
   {"mode", required_argument, 0, 'M'},
   
+  {"band-margin", required_argument, 0, 'B'},
+
   {"help", no_argument, 0, 'h'},
   
   {0, 0, 0, 0}
@@ -101,6 +103,7 @@ int main(int argc, char *argv[])
 
   double fmin;
   double fmax;
+  double band_margin;
   
   double threshold;
   int order;
@@ -135,6 +138,7 @@ int main(int argc, char *argv[])
 
   fmin = 1.0/40.0;
   fmax = 1.0/2.0;
+  band_margin = -1.0;
 
   scale = 1.0e-4;
   order = 5;
@@ -293,6 +297,14 @@ int main(int argc, char *argv[])
       }
       break;
 
+    case 'B':
+      band_margin = atof(optarg);
+      if (band_margin < 0.0) {
+	fprintf(stderr, "error: band margin must be 0 or greater\n");
+	return -1;
+      }
+      break;
+
     default:
       fprintf(stderr, "unknown option %c\n", c);
     case 'h':
@@ -316,7 +328,7 @@ int main(int argc, char *argv[])
     return -1;
   }
 
-  DispersionData data(fmin, fmax);
+  DispersionData data(fmin, fmax, band_margin);
 
   if (!data.load(input_file)) {
     return -1;
@@ -400,6 +412,8 @@ void usage(const char *pname)
           " -f|--frequency <float>          Frequency\n"
           " -s|--scale <float>              Laguerre scaling (initial)\n"
           "\n"
+          " -B|--band-margin <float>        Only keep the spectrum within fmin - margin .. fmax + margin (Hz)\n"
+          "\n"
           " -h|--help                       Show usage information\n"
           "\n",
           pname);
@@ -474,7 +488,10 @@ static bool invert(DispersionData &data,
   //
   // Build envelope
   //
-  data.compute_envelope(gaussian_smooth);
+  if (!data.compute_envelope(gaussian_smooth)) {
+    fprintf(stderr, "error: failed to compute envelope\n");
+    return false;
+  }
 
   //
   // For a smooth bessel function we can't frequency thin
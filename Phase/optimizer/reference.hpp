@@ -28,6 +28,8 @@
 
 #include "common.hpp"
 
+#include "spec1d/textfile.hpp"
+
 class ReferenceModel
 {
 public:
@@ -38,15 +40,15 @@ public:
 
   bool load_model(const char *filename)
   {
-    FILE *fp = fopen(filename, "r");
-    if (fp == NULL) {
+    TextFile file;
+    if (!file.open(filename)) {
       return false;
     }
 
     char cell[1024];
     char hs[1024];
 
-    if (fscanf(fp, "%s\n%s\n", cell, hs) != 2) {
+    if (!(file.read(cell, sizeof(cell)) && file.read(hs, sizeof(hs)))) {
       fprintf(stderr, "error: failed to read cell and halfspace types\n");
       return false;
     }
@@ -60,19 +62,16 @@ public:
     }
     
     int maxorder;
-    if (fscanf(fp, "%d", &maxorder) != 1) {
+    if (!file.read(maxorder)) {
       fprintf(stderr, "error: failed to read max order\n");
       return false;
     }
 
-    if (!model.read(fp)) {
+    if (!model.read(file)) {
       fprintf(stderr, "error: failed to parse model\n");
       return false;
     }
 
-    fclose(fp);
-    
-    
     reference = model;
 
     return true;
@@ -81,14 +80,14 @@ public:
   bool load(const char *filename)
   {
 
-    FILE *fp = fopen(filename, "r");
-    if (fp == NULL) {
+    TextFile file;
+    if (!file.open(filename)) {
       fprintf(stderr, "error: failed to open %s for reading\n", filename);
       return -1;
     }
     
     int nlayers;
-    if (fscanf(fp, "%d\n", &nlayers) != 1) {
+    if (!file.read(nlayers)) {
       fprintf(stderr, "error: failed to read no. layers\n");
       return false;
     }
@@ -99,7 +98,7 @@ public:
       int corder;
       double vs;
       double vsstd;
-      if (fscanf(fp, "%lf %d", &thicknesskm, &corder) != 2) {
+      if (!(file.read(thicknesskm) && file.read(corder))) {
 	fprintf(stderr, "error: failed to read line\n");
 	return false;
       }
@@ -123,7 +122,7 @@ public:
 	
 	for (int j = 0; j <= corder; j ++) {
 	  
-	  if (fscanf(fp, "%lf", &vs) != 1) {
+	  if (!file.read(vs)) {
 	    fprintf(stderr, "error: failed to read vs\n");
 	    return -1;
 	  }
@@ -137,13 +136,13 @@ public:
 	  model.cells[i].nodes[j] = cell_parameter_t(rho, vs, 1.0, vpvs);
 	}
 	
-	if (fscanf(fp, "%lf", &vsstd) != 1) {
+	if (!file.read(vsstd)) {
 	  fprintf(stderr, "error: failed to read vs error\n");
 	    return -1;
 	}
       
       } else {
-	if (fscanf(fp, "%lf %lf", &vs, &vsstd) != 2) {
+	if (!(file.read(vs) && file.read(vsstd))) {
 	  fprintf(stderr, "error: failed to read vs\n");
 	  return -1;
 	}
@@ -167,7 +166,6 @@ public:
       }
     }
       
-    fclose(fp);
 
     reference = model;
     return true;
@@ -0,0 +1,455 @@
+//
+// Regression test of DispersionData::build_time_energy_map. The batched FTAN map
+// and its ridge (time_max, amplitude_max) are compared with a map built one bin
+// at a time with compute_ftan_envelope, as build_time_energy_map did before the
+// transforms were batched, as are the ridge only mode, the window clamped to the
+// envelope length, the save_time_energy output, maps built with several
+// threads (twice each) and blocks shorter than FTAN_BLOCK (only the rows filled
+// transformed). Exits with status 0 if all match.
+//
+//   ./test_ftanmap ../../../example_data/RayleighResponse/dispersion_*.txt
+//
+
+#include <vector>
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+#include <unistd.h>
+
+#include "dispersion.hpp"
+
+static bool same(double a, double b)
+{
+  return memcmp(&a, &b, sizeof(double)) == 0;
+}
+
+//
+// Map rows (rows[i - ffirst][j - itmin]) and ridge computed one bin at a time
+//
+struct ReferenceMap {
+  int itmin, itmax;
+  std::vector<std::vector<double>> rows;
+  std::vector<double> time_max;
+  std::vector<double> amplitude_max;
+};
+
+static bool reference_map(DispersionData &data,
+			  double sigma,
+			  DispersionData::te_map_t map_type,
+			  double vmin,
+			  double vmax,
+			  double max_deltav,
+			  ReferenceMap &ref)
+{
+  int N2 = data.spectrum_samples - 1;
+  int N = N2 * 2;
+
+  double tmin = data.distkm/vmax;
+  double tmax = data.distkm/vmin;
+
+  std::vector<double> time(N);
+  ref.itmin = N;
+  ref.itmax = 0;
+  for (int j = 0; j < N; j ++) {
+    time[j] = ((double)j + 0.5)/data.samplerate;
+
+    if (time[j] >= tmin && j < ref.itmin) {
+      ref.itmin = j;
+    }
+    if (time[j] <= tmax && j > ref.itmax) {
+      ref.itmax = j;
+    }
+  }
+
+  //
+  // Only the N2 envelope samples are valid
+  //
+  if (ref.itmax > N2 - 1) {
+    ref.itmax = N2 - 1;
+  }
+
+  ref.rows.clear();
+  ref.time_max.assign(data.freq.size(), -1.0);
+  ref.amplitude_max.assign(data.freq.size(), 0.0);
+
+  std::vector<double> causal(N2);
+  std::vector<double> acausal(N2);
+
+  double df = data.freq[1] - data.freq[0];
+  double dt = 1.0/data.samplerate;
+
+  int last_maxj = -1;
+
+  for (int i = data.ffirst; i <= data.flast; i ++) {
+
+    if (!data.compute_ftan_envelope(data.freq[i], sigma, acausal.data(), causal.data())) {
+      return false;
+    }
+
+    std::vector<double> row;
+    for (int j = ref.itmin; j <= ref.itmax; j ++) {
+      switch (map_type) {
+      case DispersionData::MAP_TYPE_CAUSAL:
+	row.push_back(causal[j]);
+	break;
+
+      case DispersionData::MAP_TYPE_ACAUSAL:
+	row.push_back(acausal[j]);
+	break;
+
+      case DispersionData::MAP_TYPE_PRODUCT:
+	row.push_back(causal[j] * acausal[j]);
+	break;
+      }
+    }
+
+    int maxj = -1;
+    int jmin = ref.itmin;
+    if (last_maxj > 0 && max_deltav > 0.0) {
+
+      double deltaU = max_deltav * df;
+      double lastt = time[last_maxj];
+      double lastU = data.distkm/lastt;
+      double deltat = lastt - data.distkm/(lastU + deltaU);
+
+      jmin = last_maxj - (int)ceil(deltat/dt);
+      if (jmin < ref.itmin) {
+	jmin = ref.itmin;
+      }
+    }
+
+    double maxe = 0.0;
+    for (int j = jmin; j <= ref.itmax; j ++) {
+      if (row[j - ref.itmin] > maxe) {
+	maxe = row[j - ref.itmin];
+	maxj = j;
+      }
+    }
+
+    last_maxj = maxj;
+
+    if (maxj >= 0) {
+      ref.time_max[i] = time[maxj];
+      ref.amplitude_max[i] = row[maxj - ref.itmin];
+    }
+
+    ref.rows.push_back(row);
+  }
+
+  return true;
+}
+
+//
+// Ridge and stored map bit identical to the reference
+//
+static int compare_map(const DispersionData &data, const ReferenceMap &ref)
+{
+  int bad = 0;
+
+  for (int i = data.ffirst; i <= data.flast; i ++) {
+    if (!same(data.time_max[i], ref.time_max[i]) ||
+	!same(data.amplitude_max[i], ref.amplitude_max[i])) {
+      if (bad < 10) {
+	fprintf(stderr, "ridge mismatch %d: %.17g %.17g %.17g %.17g\n", i,
+		data.time_max[i], ref.time_max[i], data.amplitude_max[i], ref.amplitude_max[i]);
+      }
+      bad ++;
+    }
+  }
+
+  int N = (data.spectrum_samples - 1) * 2;
+  for (int i = data.ffirst; i <= data.flast; i ++) {
+    const std::vector<double> &row = ref.rows[i - data.ffirst];
+    for (int j = 0; j < N; j ++) {
+      double expected = 0.0;
+      if (j >= ref.itmin && j <= ref.itmax) {
+	expected = row[j - ref.itmin];
+      }
+      if (!same(data.time_energy(i, j), expected)) {
+	if (bad < 10) {
+	  fprintf(stderr, "map mismatch %d %d: %.17g %.17g\n", i, j, data.time_energy(i, j), expected);
+	}
+	bad ++;
+      }
+    }
+  }
+
+  return bad;
+}
+
+//
+// save_time_energy writes freq.size() rows of N values: zero outside ffirst ..
+// flast and the time window, the map within (as printed with %16.9e)
+//
+static int compare_saved(DispersionData &data, const ReferenceMap &ref)
+{
+  char filename[] = "/tmp/test_ftanmapXXXXXX";
+  int fd = mkstemp(filename);
+  if (fd < 0) {
+    fprintf(stderr, "error: failed to create temporary file\n");
+    return 1;
+  }
+  close(fd);
+
+  if (!data.save_time_energy(filename)) {
+    unlink(filename);
+    return 1;
+  }
+
+  TextFile file;
+  bool opened = file.open(filename);
+  unlink(filename);
+  if (!opened) {
+    fprintf(stderr, "error: failed to read %s\n", filename);
+    return 1;
+  }
+
+  int N = (data.spectrum_samples - 1) * 2;
+  int bad = 0;
+  for (int i = 0; i < (int)data.freq.size(); i ++) {
+    for (int j = 0; j < N; j ++) {
+
+      double v;
+      if (!file.read(v)) {
+	fprintf(stderr, "error: short time energy file at %d %d\n", i, j);
+	return 1;
+      }
+
+      double expected = 0.0;
+      if (i >= data.ffirst && i <= data.flast && j >= ref.itmin && j <= ref.itmax) {
+	char text[64];
+	snprintf(text, sizeof(text), "%16.9e", ref.rows[i - data.ffirst][j - ref.itmin]);
+	expected = strtod(text, NULL);
+      }
+
+      if (!same(v, expected)) {
+	if (bad < 10) {
+	  fprintf(stderr, "saved mismatch %d %d: %.17g %.17g\n", i, j, v, expected);
+	}
+	bad ++;
+      }
+    }
+  }
+
+  if (!file.eof()) {
+    fprintf(stderr, "error: trailing values in time energy file\n");
+    bad ++;
+  }
+
+  return bad;
+}
+
+static int test_map(const char *filename,
+		    DispersionData::te_map_t map_type,
+		    double vmin,
+		    double vmax,
+		    double max_deltav,
+		    bool save = false)
+{
+  double sigma = 0.01;
+
+  DispersionData data(0.025, 0.35, save ? 0.01 : -1.0);
+  if (!data.load(filename)) {
+    fprintf(stderr, "error: failed to load %s\n", filename);
+    return 1;
+  }
+
+  //
+  // vmin <= 0 for a window past the N2 envelope samples
+  //
+  if (vmin <= 0.0) {
+    vmin = data.distkm * data.samplerate/(double)(4 * data.spectrum_samples);
+  }
+
+  ReferenceMap ref;
+  if (!reference_map(data, sigma, map_type, vmin, vmax, max_deltav, ref)) {
+    fprintf(stderr, "error: failed to compute reference map\n");
+    return 1;
+  }
+
+  if (!data.build_time_energy_map(sigma, map_type, vmin, vmax, max_deltav)) {
+    fprintf(stderr, "error: failed to build map\n");
+    return 1;
+  }
+
+  int bad = compare_map(data, ref);
+
+  if (save) {
+    bad += compare_saved(data, ref);
+  }
+
+  //
+  // Ridge only: the same ridge and no map
+  //
+  if (!data.build_time_energy_map(sigma, map_type, vmin, vmax, max_deltav, false)) {
+    fprintf(stderr, "error: failed to track ridge\n");
+    return 1;
+  }
+
+  if (!data.time_energy_map.empty()) {
+    fprintf(stderr, "error: map stored when tracking the ridge only\n");
+    bad ++;
+  }
+
+  ReferenceMap ridge = ref;
+  for (auto &row : ridge.rows) {
+    for (auto &e : row) {
+      e = 0.0;
+    }
+  }
+  bad += compare_map(data, ridge);
+
+  printf("%s: type %d velocity %g - %g delta %g%s: %d mismatches\n",
+	 filename, (int)map_type, vmin, vmax, max_deltav, save ? " saved" : "", bad);
+  return bad > 0;
+}
+
+//
+// The threaded map at several thread counts (0 for one per core), built twice
+// with each on the same DispersionData
+//
+static int test_threads(const char *filename)
+{
+  static const int threads[] = {1, 2, 3, 8, 0};
+  double sigma = 0.01;
+
+  DispersionData data(0.025, 0.35);
+  if (!data.load(filename)) {
+    fprintf(stderr, "error: failed to load %s\n", filename);
+    return 1;
+  }
+
+  ReferenceMap ref;
+  if (!reference_map(data, sigma, DispersionData::MAP_TYPE_PRODUCT, 1.5, 4.5, 0.5, ref)) {
+    fprintf(stderr, "error: failed to compute reference map\n");
+    return 1;
+  }
+
+  int failed = 0;
+  for (auto t : threads) {
+    data.set_ftan_threads(t);
+
+    int bad = 0;
+    for (int repeat = 0; repeat < 2; repeat ++) {
+      if (!data.build_time_energy_map(sigma, DispersionData::MAP_TYPE_PRODUCT, 1.5, 4.5, 0.5)) {
+	fprintf(stderr, "error: failed to build map\n");
+	return 1;
+      }
+
+      bad += compare_map(data, ref);
+    }
+
+    printf("%s: %d threads: %d mismatches\n", filename, t, bad);
+    failed += (bad > 0);
+  }
+
+  return failed;
+}
+
+//
+// Blocks of 1 .. FTAN_BLOCK bins: each envelope as computed alone and the
+// buffer rows past the block not written
+//
+static int test_short_blocks(const char *filename)
+{
+  double sigma = 0.01;
+
+  DispersionData data(0.025, 0.35);
+  if (!data.load(filename)) {
+    fprintf(stderr, "error: failed to load %s\n", filename);
+    return 1;
+  }
+
+  int N2 = data.spectrum_samples - 1;
+  int N = N2 * 2;
+
+  std::vector<double> causal(N2);
+  std::vector<double> acausal(N2);
+  std::vector<double> expected_causal(N2);
+  std::vector<double> expected_acausal(N2);
+
+  int bad = 0;
+  for (int count = 1; count <= DispersionData::FTAN_BLOCK; count ++) {
+
+    if (!data.prepare_ftan(1, count)) {
+      fprintf(stderr, "error: failed to prepare FTAN\n");
+      return 1;
+    }
+
+    fftw_complex *env = data.ftan_buffers[0].env;
+    for (int k = 0; k < N * DispersionData::FTAN_BLOCK; k ++) {
+      env[k][0] = -1.0;
+      env[k][1] = -1.0;
+    }
+
+    if (!data.compute_ftan_envelopes(data.ffirst, count, sigma)) {
+      fprintf(stderr, "error: failed to compute envelopes\n");
+      return 1;
+    }
+
+    for (int r = 0; r < count; r ++) {
+      if (!data.compute_ftan_envelope(data.freq[data.ffirst + r], sigma,
+				      expected_acausal.data(), expected_causal.data())) {
+	fprintf(stderr, "error: failed to compute envelope\n");
+	return 1;
+      }
+
+      data.ftan_envelope(env + r * N, acausal.data(), causal.data());
+      for (int j = 0; j < N2; j ++) {
+	if (!same(causal[j], expected_causal[j]) || !same(acausal[j], expected_acausal[j])) {
+	  if (bad < 10) {
+	    fprintf(stderr, "envelope mismatch %d %d %d\n", count, r, j);
+	  }
+	  bad ++;
+	}
+      }
+    }
+
+    for (int k = count * N; k < N * DispersionData::FTAN_BLOCK; k ++) {
+      if (env[k][0] != -1.0 || env[k][1] != -1.0) {
+	if (bad < 10) {
+	  fprintf(stderr, "row past block of %d written at %d\n", count, k);
+	}
+	bad ++;
+      }
+    }
+  }
+
+  printf("%s: short blocks: %d mismatches\n", filename, bad);
+  return bad > 0;
+}
+
+int main(int argc, char *argv[])
+{
+  //
+  // Batched and single transforms are only bit identical with the same
+  // planning
+  //
+  FFTPlans::instance().configure(FFTW_ESTIMATE, NULL);
+
+  int failed = 0;
+
+  for (int i = 1; i < argc; i ++) {
+    failed += test_map(argv[i], DispersionData::MAP_TYPE_PRODUCT, 1.0, 5.0, 0.0);
+    failed += test_map(argv[i], DispersionData::MAP_TYPE_PRODUCT, 1.5, 4.5, 0.5);
+    failed += test_map(argv[i], DispersionData::MAP_TYPE_CAUSAL, 1.0, 5.0, 0.0);
+    failed += test_map(argv[i], DispersionData::MAP_TYPE_ACAUSAL, 1.0, 5.0, 0.0);
+    failed += test_map(argv[i], DispersionData::MAP_TYPE_PRODUCT, 0.0, 5.0, 0.0);
+  }
+
+  if (argc > 1) {
+    failed += test_map(argv[1], DispersionData::MAP_TYPE_PRODUCT, 1.0, 5.0, 0.5, true);
+    failed += test_threads(argv[1]);
+    failed += test_short_blocks(argv[1]);
+  }
+
+  if (failed > 0) {
+    printf("FAILED\n");
+    return -1;
+  }
+
+  printf("OK\n");
+  return 0;
+}
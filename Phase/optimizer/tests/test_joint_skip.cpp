@@ -392,8 +392,11 @@ static bool invert(DispersionData &data_love,
   //
   // Build envelopes
   //
-  data_love.compute_envelope(gaussian_smooth);
-  data_rayleigh.compute_envelope(gaussian_smooth);
+  if (!data_love.compute_envelope(gaussian_smooth) ||
+      !data_rayleigh.compute_envelope(gaussian_smooth)) {
+    fprintf(stderr, "error: failed to compute envelopes\n");
+    return false;
+  }
 
   double like_love;
   double like_rayleigh;
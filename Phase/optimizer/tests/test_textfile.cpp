@@ -0,0 +1,169 @@
+//
+// Regression test of the bulk text parser (spec1d/textfile.hpp) against fscanf:
+// values written in the formats used by the scripts and optimizers must parse to
+// bit identical doubles/ints, as must dispersion files given on the command line
+// when loaded with DispersionData::load. Exits with status 0 if all match.
+//
+//   ./test_textfile ../../../example_data/RayleighResponse/dispersion_*.txt
+//
+
+#include <vector>
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+#include <unistd.h>
+
+#include "dispersion.hpp"
+
+static bool same(double a, double b)
+{
+  return memcmp(&a, &b, sizeof(double)) == 0;
+}
+
+//
+// Random values written in each format, read back as %lf/%d and with TextFile
+//
+static int test_formats()
+{
+  static const char *formats[] = {
+    "%15.9f", "%.17g", "%g", "%e", "%.3f", "%10.6f", "%.20e", "%a"
+  };
+  int nformats = sizeof(formats)/sizeof(formats[0]);
+
+  char filename[] = "/tmp/test_textfileXXXXXX";
+  int fd = mkstemp(filename);
+  if (fd < 0) {
+    fprintf(stderr, "error: failed to create temporary file\n");
+    return 1;
+  }
+
+  FILE *fp = fdopen(fd, "w");
+  srand48(983);
+  int N = 100000;
+  for (int i = 0; i < N; i ++) {
+    double v = (drand48() - 0.5) * pow(10.0, (int)(drand48() * 40.0) - 20);
+    fprintf(fp, formats[i % nformats], v);
+    fprintf(fp, (i % 7 == 0) ? "\n%d\n" : " %d ", (int)(mrand48() % 100000));
+  }
+  fclose(fp);
+
+  std::vector<double> a, b;
+  std::vector<int> ia, ib;
+
+  fp = fopen(filename, "r");
+  double v;
+  int n;
+  while (fscanf(fp, "%lf %d", &v, &n) == 2) {
+    a.push_back(v);
+    ia.push_back(n);
+  }
+  fclose(fp);
+
+  TextFile file;
+  if (!file.open(filename)) {
+    fprintf(stderr, "error: failed to open %s\n", filename);
+    return 1;
+  }
+  while (!file.eof()) {
+    if (!(file.read(v) && file.read(n))) {
+      break;
+    }
+    b.push_back(v);
+    ib.push_back(n);
+  }
+
+  unlink(filename);
+
+  int bad = 0;
+  if (a.size() != (size_t)N || b.size() != a.size()) {
+    fprintf(stderr, "error: read %d and %d values of %d\n", (int)a.size(), (int)b.size(), N);
+    return 1;
+  }
+
+  for (size_t i = 0; i < a.size(); i ++) {
+    if (!same(a[i], b[i]) || ia[i] != ib[i]) {
+      if (bad < 10) {
+	fprintf(stderr, "mismatch %d: %.17g %.17g %d %d\n", (int)i, a[i], b[i], ia[i], ib[i]);
+      }
+      bad ++;
+    }
+  }
+
+  printf("formats: %d values, %d mismatches\n", N, bad);
+  return bad > 0;
+}
+
+//
+// DispersionData::load against the fscanf loop it replaced
+//
+static int test_dispersion(const char *filename)
+{
+  FILE *fp = fopen(filename, "r");
+  if (fp == NULL) {
+    fprintf(stderr, "error: failed to open %s\n", filename);
+    return 1;
+  }
+
+  double header[8];
+  int daycount, samples;
+  if (fscanf(fp, "%lf %lf %lf %lf %lf\n", &header[0], &header[1], &header[2], &header[3], &header[4]) != 5 ||
+      fscanf(fp, "%lf %d %lf %lf %d\n", &header[5], &daycount, &header[6], &header[7], &samples) != 5) {
+    fprintf(stderr, "error: failed to parse header of %s\n", filename);
+    return 1;
+  }
+
+  std::vector<double> values(5*samples);
+  for (int i = 0; i < samples; i ++) {
+    if (fscanf(fp, "%lf %lf %lf %lf %lf\n",
+	       &values[5*i], &values[5*i + 1], &values[5*i + 2], &values[5*i + 3], &values[5*i + 4]) != 5) {
+      fprintf(stderr, "error: failed to read spectrum of %s\n", filename);
+      return 1;
+    }
+  }
+  fclose(fp);
+
+  DispersionData data(0.0, 1.0e9);
+  if (!data.load(filename)) {
+    fprintf(stderr, "error: failed to load %s\n", filename);
+    return 1;
+  }
+
+  int bad = 0;
+  if (!same(data.lon1, header[0]) || !same(data.lat1, header[1]) ||
+      !same(data.lon2, header[2]) || !same(data.lat2, header[3]) ||
+      !same(data.distkm, header[4]) || !same(data.samplerate, header[5]) ||
+      !same(data.asnr, header[6]) || !same(data.csnr, header[7]) ||
+      data.daycount != daycount || data.samples != samples) {
+    bad ++;
+  }
+
+  for (int i = 0; i < samples && bad == 0; i ++) {
+    if (!same(data.freq[i], values[5*i]) ||
+	!same(data.sreal[i], values[5*i + 1]) || !same(data.simag[i], values[5*i + 2]) ||
+	!same(data.ncfreal[i], values[5*i + 3]) || !same(data.ncfimag[i], values[5*i + 4])) {
+      bad ++;
+    }
+  }
+
+  printf("%s: %d samples, %s\n", filename, samples, bad == 0 ? "identical" : "MISMATCH");
+  return bad > 0;
+}
+
+int main(int argc, char *argv[])
+{
+  int failed = test_formats();
+
+  for (int i = 1; i < argc; i ++) {
+    failed += test_dispersion(argv[i]);
+  }
+
+  if (failed > 0) {
+    printf("FAILED\n");
+    return -1;
+  }
+
+  printf("OK\n");
+  return 0;
+}
@@ -33,6 +33,7 @@
 #include "lobattoprojection.hpp"
 
 #include "encodedecode.hpp"
+#include "textfile.hpp"
 
 template
 <
@@ -612,6 +613,48 @@ public:
     return true;
   }
 
+  bool read(TextFile &file)
+  {
+    double fthickness;
+    int fparameters;
+    if (!(file.read(fthickness) && file.read(fparameters))) {
+      ERROR("Failed to reader header");
+      return false;
+    }
+
+    if (fparameters != parameterset::NPARAMETERS) {
+      ERROR("Invalid n parameters. (%d != %d)", fparameters, parameterset::NPARAMETERS);
+      return false;
+    }
+    
+    thickness = fthickness;
+
+    for (size_t k = 0; k < parameterset::NPARAMETERS; k ++) {
+
+      int o;
+      if (!file.read(o)) {
+	ERROR("Failed to read order");
+	return false;
+      }
+
+      if (o < 0 || o > (int)maxorder) {
+	ERROR("Order out of range");
+	return false;
+      }
+      
+      order[k] = o;
+      for (size_t i = 0; i <= order[k]; i ++) {
+	if (!nodes[i].read_parameter(k, file)) {
+	  ERROR("Failed to read node parameter");
+	  return false;
+	}
+      }
+
+    }
+    
+    return true;
+  }
+
   bool save(FILE *fp) const
   {
     fprintf(fp, "%15.9f %d\n", (double)thickness, (int)parameterset::NPARAMETERS);
@@ -0,0 +1,217 @@
+//
+//    AkiEstimate : A method for the joint estimation of Love and Rayleigh surface wave
+//    dispersion from ambient noise cross-correlations.
+//
+//      Hawkins R. and Sambridge M., "An adjoint technique for estimation of interstation phase
+//    and group dispersion from ambient noise cross-correlations", BSSA, 2019
+//
+//    Copyright (C) 2014 - 2018 Rhys Hawkins
+//
+//    This program is free software: you can redistribute it and/or modify
+//    it under the terms of the GNU General Public License as published by
+//    the Free Software Foundation, either version 3 of the License, or
+//    (at your option) any later version.
+//
+//    This program is distributed in the hope that it will be useful,
+//    but WITHOUT ANY WARRANTY; without even the implied warranty of
+//    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+//    GNU General Public License for more details.
+//
+//    You should have received a copy of the GNU General Public License
+//    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+//
+//
+
+#pragma once
+#ifndef dispersionfile_hpp
+#define dispersionfile_hpp
+
+#include <stdio.h>
+#include <stdint.h>
+#include <string.h>
+
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+
+#include <string>
+
+//
+// Binary (memory mapped) version of the dispersion_<pair>.txt spectrum files. The
+// layout is documented in InitialPhase/scripts/dispersionfile.py which also contains
+// the converter from the text format. All values are little endian: a fixed 88 byte
+// header followed by the frequencies (float64[N]) and the spectrum and noise
+// correlation function (complex128[N] each, that is float64 real and imaginary
+// parts interleaved).
+//
+struct dispersion_binary_header_t {
+  char magic[8];
+  int32_t version;
+  int32_t samples;
+  double lon1, lat1;
+  double lon2, lat2;
+  double distkm;
+  double samplerate;
+  int32_t daycount;
+  int32_t reserved;
+  double asnr, csnr;
+};
+
+static_assert(sizeof(dispersion_binary_header_t) == 88, "unexpected binary dispersion header size");
+
+class DispersionBinaryFile {
+public:
+
+  static constexpr int32_t VERSION = 1;
+
+  static const char *magic()
+  {
+    return "AKISPEC1";
+  }
+
+  DispersionBinaryFile() :
+    header(nullptr),
+    freq(nullptr),
+    spec(nullptr),
+    ncf(nullptr),
+    base(nullptr),
+    size(0)
+  {
+  }
+
+  ~DispersionBinaryFile()
+  {
+    close();
+  }
+
+  static bool is_binary(const char *filename)
+  {
+    FILE *fp = fopen(filename, "rb");
+    if (fp == NULL) {
+      return false;
+    }
+
+    char buffer[8];
+    bool binary = (fread(buffer, 1, sizeof(buffer), fp) == sizeof(buffer) &&
+		   memcmp(buffer, magic(), sizeof(buffer)) == 0);
+    fclose(fp);
+
+    return binary;
+  }
+
+  //
+  // The binary or text version of a dispersion_<pair>.txt/.bin file, whichever
+  // is current: the .bin if it exists and is no older than the .txt (or there
+  // is no .txt), otherwise the .txt with a warning if a stale .bin exists. Other
+  // file names are returned unchanged.
+  //
+  static std::string preferred_path(const char *filename)
+  {
+    std::string name(filename);
+    size_t n = name.size();
+    if (n < 4 || (name.compare(n - 4, 4, ".txt") != 0 && name.compare(n - 4, 4, ".bin") != 0)) {
+      return name;
+    }
+
+    std::string binname = name.substr(0, n - 4) + ".bin";
+    std::string txtname = name.substr(0, n - 4) + ".txt";
+
+    struct stat binst, txtst;
+    if (stat(binname.c_str(), &binst) < 0) {
+      return txtname;
+    }
+
+    if (stat(txtname.c_str(), &txtst) < 0 ||
+	binst.st_mtim.tv_sec > txtst.st_mtim.tv_sec ||
+	(binst.st_mtim.tv_sec == txtst.st_mtim.tv_sec && binst.st_mtim.tv_nsec >= txtst.st_mtim.tv_nsec)) {
+      return binname;
+    }
+
+    fprintf(stderr, "warning: %s is older than %s, using the text file\n", binname.c_str(), txtname.c_str());
+    return txtname;
+  }
+
+  bool open(const char *filename)
+  {
+    close();
+
+    int fd = ::open(filename, O_RDONLY);
+    if (fd < 0) {
+      fprintf(stderr, "error: failed to open %s for reading\n", filename);
+      return false;
+    }
+
+    struct stat st;
+    if (fstat(fd, &st) < 0 || (size_t)st.st_size < sizeof(dispersion_binary_header_t)) {
+      fprintf(stderr, "error: truncated binary dispersion file %s\n", filename);
+      ::close(fd);
+      return false;
+    }
+
+    size = st.st_size;
+    base = mmap(NULL, size, PROT_READ, MAP_PRIVATE, fd, 0);
+    ::close(fd);
+
+    if (base == MAP_FAILED) {
+      fprintf(stderr, "error: failed to map %s\n", filename);
+      base = nullptr;
+      size = 0;
+      return false;
+    }
+
+    header = (const dispersion_binary_header_t*)base;
+    if (memcmp(header->magic, magic(), sizeof(header->magic)) != 0) {
+      fprintf(stderr, "error: %s is not a binary dispersion file\n", filename);
+      close();
+      return false;
+    }
+
+    if (header->version != VERSION) {
+      fprintf(stderr, "error: unsupported binary dispersion version %d\n", (int)header->version);
+      close();
+      return false;
+    }
+
+    size_t N = header->samples;
+    if (header->samples <= 0 ||
+	size != sizeof(dispersion_binary_header_t) + N * 5 * sizeof(double)) {
+      fprintf(stderr, "error: size mismatch in binary dispersion file %s\n", filename);
+      close();
+      return false;
+    }
+
+    freq = (const double*)((const char*)base + sizeof(dispersion_binary_header_t));
+    spec = freq + N;
+    ncf = spec + 2*N;
+
+    return true;
+  }
+
+  void close()
+  {
+    if (base != nullptr) {
+      munmap(base, size);
+      base = nullptr;
+      size = 0;
+    }
+
+    header = nullptr;
+    freq = nullptr;
+    spec = nullptr;
+    ncf = nullptr;
+  }
+
+  const dispersion_binary_header_t *header;
+  const double *freq;
+  const double *spec;
+  const double *ncf;
+
+private:
+
+  void *base;
+  size_t size;
+
+};
+
+#endif // dispersionfile_hpp
@@ -0,0 +1,202 @@
+//
+//    AkiEstimate : A method for the joint estimation of Love and Rayleigh surface wave
+//    dispersion from ambient noise cross-correlations.
+//
+//      Hawkins R. and Sambridge M., "An adjoint technique for estimation of interstation phase
+//    and group dispersion from ambient noise cross-correlations", BSSA, 2019
+//
+//    Copyright (C) 2014 - 2018 Rhys Hawkins
+//
+//    This program is free software: you can redistribute it and/or modify
+//    it under the terms of the GNU General Public License as published by
+//    the Free Software Foundation, either version 3 of the License, or
+//    (at your option) any later version.
+//
+//    This program is distributed in the hope that it will be useful,
+//    but WITHOUT ANY WARRANTY; without even the implied warranty of
+//    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+//    GNU General Public License for more details.
+//
+//    You should have received a copy of the GNU General Public License
+//    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+//
+//
+
+#pragma once
+#ifndef fftplans_hpp
+#define fftplans_hpp
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <fcntl.h>
+#include <sys/file.h>
+
+#include <map>
+#include <mutex>
+#include <string>
+#include <tuple>
+
+#include <fftw3.h>
+
+//
+// Process wide cache of FFTW plans for out of place complex transforms. A plan
+// is created once per size, batch count and direction and shared by every
+// DispersionData (and thread) of the process. Plans are executed with
+// fftw_execute_dft on arrays allocated with fftw_malloc, and destroyed at exit.
+//
+// Planning defaults to FFTW_ESTIMATE, or is set with the AKI_FFTW_PLANNING
+// environment variable (estimate, measure or patient) or configure. With
+// FFTW_MEASURE or FFTW_PATIENT the transforms are faster but plans take longer
+// to create (much longer for FFTW_PATIENT) and results may differ from
+// FFTW_ESTIMATE in the last bits. If a wisdom file is set (AKI_FFTW_WISDOM or
+// configure), it is loaded before the first plan and saved after each new plan
+// so that plans measured by one process are reused by the others. Saving holds
+// an advisory lock (on the wisdom file name with .lock appended) and merges
+// the wisdom saved by other processes since it was loaded.
+//
+class FFTPlans {
+public:
+
+  static FFTPlans &instance()
+  {
+    static FFTPlans plans;
+    return plans;
+  }
+
+  void configure(unsigned int _flags, const char *_wisdom)
+  {
+    std::lock_guard<std::mutex> lock(mutex);
+
+    flags = _flags;
+    if (_wisdom == NULL) {
+      wisdom.clear();
+    } else {
+      wisdom = _wisdom;
+    }
+    wisdom_loaded = false;
+  }
+
+  //
+  // Plan for howmany contiguous transforms of N samples, sign FFTW_FORWARD or
+  // FFTW_BACKWARD
+  //
+  fftw_plan plan(int N, int howmany, int sign)
+  {
+    std::lock_guard<std::mutex> lock(mutex);
+
+    plan_key_t key(N, howmany, sign, flags);
+    auto p = plans.find(key);
+    if (p != plans.end()) {
+      return p->second;
+    }
+
+    bool use_wisdom = (!wisdom.empty() && flags != FFTW_ESTIMATE);
+    if (use_wisdom && !wisdom_loaded) {
+      fftw_import_wisdom_from_filename(wisdom.c_str());
+      wisdom_loaded = true;
+    }
+
+    //
+    // Measuring overwrites the arrays so plans are made on scratch arrays
+    // (with the same alignment as any others from fftw_malloc)
+    //
+    fftw_complex *in = (fftw_complex*)fftw_malloc(sizeof(fftw_complex) * N * howmany);
+    fftw_complex *out = (fftw_complex*)fftw_malloc(sizeof(fftw_complex) * N * howmany);
+
+    fftw_plan newplan = fftw_plan_many_dft(1, &N, howmany,
+					   in, NULL, 1, N,
+					   out, NULL, 1, N,
+					   sign, flags);
+
+    fftw_free(in);
+    fftw_free(out);
+
+    if (newplan == NULL) {
+      fprintf(stderr, "error: failed to create FFTW plan of size %d\n", N);
+      return NULL;
+    }
+
+    plans[key] = newplan;
+
+    if (use_wisdom) {
+      save_wisdom();
+    }
+
+    return newplan;
+  }
+
+private:
+
+  typedef std::tuple<int, int, int, unsigned int> plan_key_t;
+
+  FFTPlans() :
+    flags(FFTW_ESTIMATE),
+    wisdom_loaded(false)
+  {
+    const char *planning = getenv("AKI_FFTW_PLANNING");
+    if (planning != NULL) {
+      if (strcmp(planning, "measure") == 0) {
+	flags = FFTW_MEASURE;
+      } else if (strcmp(planning, "patient") == 0) {
+	flags = FFTW_PATIENT;
+      } else if (strcmp(planning, "estimate") != 0) {
+	fprintf(stderr, "warning: unknown AKI_FFTW_PLANNING %s, using estimate\n", planning);
+      }
+    }
+
+    const char *path = getenv("AKI_FFTW_WISDOM");
+    if (path != NULL) {
+      wisdom = path;
+    }
+  }
+
+  ~FFTPlans()
+  {
+    for (auto &p : plans) {
+      fftw_destroy_plan(p.second);
+    }
+  }
+
+  FFTPlans(const FFTPlans &) = delete;
+  FFTPlans &operator=(const FFTPlans &) = delete;
+
+  void save_wisdom()
+  {
+    //
+    // Other processes may be saving at the same time so the file is locked,
+    // its current contents merged into ours, then written to a temporary and
+    // renamed as other processes may be reading it (without the lock)
+    //
+    std::string lockname = wisdom + ".lock";
+    int fd = open(lockname.c_str(), O_CREAT | O_RDWR, 0644);
+    if (fd < 0 || flock(fd, LOCK_EX) < 0) {
+      fprintf(stderr, "warning: failed to lock FFTW wisdom %s\n", lockname.c_str());
+      if (fd >= 0) {
+	close(fd);
+      }
+      return;
+    }
+
+    fftw_import_wisdom_from_filename(wisdom.c_str());
+
+    std::string tmpname = wisdom + ".tmp" + std::to_string((int)getpid());
+    if (!fftw_export_wisdom_to_filename(tmpname.c_str()) || rename(tmpname.c_str(), wisdom.c_str()) < 0) {
+      fprintf(stderr, "warning: failed to save FFTW wisdom to %s\n", wisdom.c_str());
+      unlink(tmpname.c_str());
+    }
+
+    flock(fd, LOCK_UN);
+    close(fd);
+  }
+
+  std::mutex mutex;
+  unsigned int flags;
+  std::string wisdom;
+  bool wisdom_loaded;
+  std::map<plan_key_t, fftw_plan> plans;
+
+};
+
+#endif // fftplans_hpp
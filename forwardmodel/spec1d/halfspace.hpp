@@ -30,6 +30,8 @@
 #include <stdio.h>
 #include <string>
 
+#include "textfile.hpp"
+
 template
 <
   typename real,
@@ -73,6 +75,34 @@ public:
 
     return true;
   }
+
+  bool read(TextFile &file)
+  {
+    int nparameters;
+    double thickness;
+    
+    if (!(file.read(nparameters) && file.read(thickness))) {
+      ERROR("Failed to read cell parameters");
+      return false;
+    }
+
+    if (nparameters != (int)np || thickness != 0.0) {
+      ERROR("Expected terminating cell parameters, got %d %f", nparameters, thickness);
+      return false;
+    }
+
+    for (size_t i = 0; i < np; i ++) {
+      double p;
+      if (!file.read(p)) {
+	ERROR("Failed to read parameters");
+	return false;
+      }
+
+      parameters[i] = p;
+    }
+
+    return true;
+  }
   
   bool save(FILE *fp) const
   {
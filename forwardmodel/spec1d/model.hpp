@@ -36,6 +36,7 @@
 #include "mesh.hpp"
 
 #include "encodedecode.hpp"
+#include "textfile.hpp"
 
 template
 <
@@ -86,6 +87,37 @@ public:
     return true;
   }
 
+  bool read(TextFile &file)
+  {
+    int fcells;
+    if (!file.read(fcells)) {
+      ERROR("Failed to read no. cells");
+      return false;
+    }
+
+    if (fcells < 0) {
+      ERROR("No. cells out of range");
+      return false;
+    }
+
+    cells.clear();
+    cells.resize(fcells);
+    
+    for (int i = 0; i < fcells; i ++) {
+      if (!cells[i].read(file)) {
+	ERROR("Failed to read cell");
+	return false;
+      }
+    }
+
+    if (!boundary.read(file)) {
+      ERROR("Failed to read boundary");
+      return false;
+    }
+
+    return true;
+  }
+
   virtual void project(Mesh<real, maxorder> &mesh, size_t order) const
   {
     mesh.cells.clear();
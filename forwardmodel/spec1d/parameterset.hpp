@@ -31,6 +31,7 @@
 #include <array>
 
 #include "encodedecode.hpp"
+#include "textfile.hpp"
 
 template
 <
@@ -103,6 +104,22 @@ public:
     return true;
   }
 
+  virtual bool read_parameter(int k, TextFile &file)
+  {
+    if (k < 0 || k >= (int)set_size) {
+      return false;;
+    }
+
+    double t;
+
+    if (!file.read(t)) {
+      return false;
+    }
+
+    (*this)[k] = t;
+    return true;
+  }
+
   virtual bool write(FILE *fp) const
   {
     for (auto &r : *this) {
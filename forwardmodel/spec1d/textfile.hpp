@@ -0,0 +1,180 @@
+//
+//    AkiEstimate : A method for the joint estimation of Love and Rayleigh surface wave
+//    dispersion from ambient noise cross-correlations.
+//
+//      Hawkins R. and Sambridge M., "An adjoint technique for estimation of interstation phase
+//    and group dispersion from ambient noise cross-correlations", BSSA, 2019
+//
+//    Copyright (C) 2014 - 2018 Rhys Hawkins
+//
+//    This program is free software: you can redistribute it and/or modify
+//    it under the terms of the GNU General Public License as published by
+//    the Free Software Foundation, either version 3 of the License, or
+//    (at your option) any later version.
+//
+//    This program is distributed in the hope that it will be useful,
+//    but WITHOUT ANY WARRANTY; without even the implied warranty of
+//    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+//    GNU General Public License for more details.
+//
+//    You should have received a copy of the GNU General Public License
+//    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+//
+//
+
+#pragma once
+#ifndef textfile_hpp
+#define textfile_hpp
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <ctype.h>
+
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/stat.h>
+
+#include <vector>
+
+//
+// Whitespace separated text files (dispersion spectra, picks, models) read whole
+// with a single read and parsed in memory. Values are converted with strtod and
+// strtol, which are what fscanf's %lf and %d use, so they are bit identical to
+// reading the same file with fscanf (see Phase/optimizer/tests/test_textfile.cpp).
+// As with fscanf, line breaks are just whitespace.
+//
+class TextFile {
+public:
+
+  TextFile() :
+    p(nullptr)
+  {
+  }
+
+  bool open(const char *filename)
+  {
+    buffer.clear();
+    p = nullptr;
+
+    int fd = ::open(filename, O_RDONLY);
+    if (fd < 0) {
+      return false;
+    }
+
+    struct stat st;
+    if (fstat(fd, &st) < 0) {
+      ::close(fd);
+      return false;
+    }
+
+    //
+    // Size from fstat is a hint (eg for pipes), read until end of file and
+    // terminate for strtod
+    //
+    size_t size = 0;
+    buffer.resize((size_t)st.st_size + 1);
+    while (true) {
+
+      if (size + 1 >= buffer.size()) {
+	buffer.resize(2*buffer.size() + 4096);
+      }
+
+      ssize_t n = ::read(fd, buffer.data() + size, buffer.size() - size - 1);
+      if (n < 0) {
+	::close(fd);
+	buffer.clear();
+	return false;
+      }
+
+      if (n == 0) {
+	break;
+      }
+
+      size += n;
+    }
+
+    ::close(fd);
+
+    buffer.resize(size + 1);
+    buffer[size] = '\0';
+    p = buffer.data();
+
+    return true;
+  }
+
+  bool read(double &v)
+  {
+    char *end;
+    double t = strtod(p, &end);
+    if (end == p) {
+      return false;
+    }
+
+    v = t;
+    p = end;
+    return true;
+  }
+
+  bool read(int &v)
+  {
+    char *end;
+    long t = strtol(p, &end, 10);
+    if (end == p) {
+      return false;
+    }
+
+    v = (int)t;
+    p = end;
+    return true;
+  }
+
+  //
+  // Next whitespace delimited word (as %s), at most size - 1 characters
+  //
+  bool read(char *word, size_t size)
+  {
+    skip();
+
+    size_t n = 0;
+    while (*p != '\0' && !isspace((unsigned char)*p)) {
+      if (n + 1 >= size) {
+	return false;
+      }
+      word[n] = *p;
+      n ++;
+      p ++;
+    }
+
+    if (n == 0) {
+      return false;
+    }
+
+    word[n] = '\0';
+    return true;
+  }
+
+  //
+  // True if only whitespace remains
+  //
+  bool eof()
+  {
+    skip();
+    return *p == '\0';
+  }
+
+private:
+
+  void skip()
+  {
+    while (isspace((unsigned char)*p)) {
+      p ++;
+    }
+  }
+
+  std::vector<char> buffer;
+  char *p;
+
+};
+
+#endif // textfile_hpp
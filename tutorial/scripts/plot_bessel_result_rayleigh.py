@@ -1,4 +1,5 @@
 import os
+import sys
 import argparse
 
 import numpy
@@ -6,19 +7,8 @@ import matplotlib.pyplot as P
 
 from scipy.special import jacobi
 
-def loaddispersion(fname):
-
-    f = open(fname, 'r')
-    lines = f.readlines()
-
-    slon, slat, dlon, dlat, distkm = map(float, lines[0].split())
-    freq, count, acsn, csn, N = map(float, lines[1].split())
-
-    f, r, i, ncfr, ncfi = zip(*map(lambda x: map(float, x.split()), lines[2:]))
-
-    spec = numpy.array(r) + numpy.array(i)*1.0j
-    ncf = numpy.array(ncfr) + numpy.array(ncfi)*1.0j
-    return (slon, slat, dlon, dlat, distkm, int(count)), numpy.array(f), freq, acsn, csn, spec, ncf
+sys.path.insert(1, os.path.join(sys.path[0], '../../InitialPhase/scripts'))
+import dispersionfile
 
 if __name__ == '__main__':
 
@@ -42,9 +32,9 @@ if __name__ == '__main__':
 
     stationpair = '_'.join(os.path.basename(args.fits.rstrip('/')).split('_')[1:3])
 
-    rayleighdata = os.path.join(args.data, 'RayleighResponse/dispersion_%s.txt' % stationpair)
+    rayleighdata = dispersionfile.dispersionpath(args.data, 'RayleighResponse', stationpair)
 
-    (_, _, _, _, distkm, _), f, sample_rate, rayleigh_acsn, rayleigh_csn, rayleigh_spec, rayleigh_ncf = loaddispersion(rayleighdata)
+    (_, _, _, _, distkm, _), f, sample_rate, rayleigh_acsn, rayleigh_csn, rayleigh_spec, rayleigh_ncf = dispersionfile.loaddispersion(rayleighdata)
 
     figB, bx = P.subplots()
     figB.set_size_inches((args.width, args.height))
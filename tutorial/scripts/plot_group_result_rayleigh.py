@@ -1,5 +1,6 @@
 
 import os
+import sys
 
 import argparse
 
@@ -10,23 +11,12 @@ import matplotlib.gridspec
 import scipy.signal
 from scipy.special import jacobi
 
+sys.path.insert(1, os.path.join(sys.path[0], '../../InitialPhase/scripts'))
+import dispersionfile
+
 def autosigma(distkm):
     return 0.4418954398283702/numpy.sqrt(distkm) - 0.007296666006375768
 
-def loaddispersion(fname):
-
-    f = open(fname, 'r')
-    lines = f.readlines()
-
-    slon, slat, dlon, dlat, distkm = map(float, lines[0].split())
-    freq, count, acsn, csn, N = map(float, lines[1].split())
-
-    f, r, i, ncfr, ncfi = zip(*map(lambda x: map(float, x.split()), lines[2:]))
-
-    spec = numpy.array(r) + numpy.array(i)*1.0j
-    ncf = numpy.array(ncfr) + numpy.array(ncfi)*1.0j
-    return (slon, slat, dlon, dlat, distkm, int(count)), numpy.array(f), freq, acsn, csn, spec, ncf
-
 def mkftan(f, sample_rate, spec, period_min, period_max, vmin, vmax, vsample, distkm, sigma, period = False):
 
     vaxis = numpy.linspace(vmin, vmax, vsample)
@@ -95,9 +85,9 @@ if __name__ == '__main__':
 
     stationpair = '_'.join(os.path.basename(args.fits.rstrip('/')).split('_')[1:3])
 
-    rayleighdata = os.path.join(args.data, 'RayleighResponse/dispersion_%s.txt' % stationpair)
+    rayleighdata = dispersionfile.dispersionpath(args.data, 'RayleighResponse', stationpair)
 
-    (_, _, _, _, distkm, _), f, sample_rate, rayleigh_acsn, rayleigh_csn, rayleigh_spec, rayleigh_ncf = loaddispersion(rayleighdata)
+    (_, _, _, _, distkm, _), f, sample_rate, rayleigh_acsn, rayleigh_csn, rayleigh_spec, rayleigh_ncf = dispersionfile.loaddispersion(rayleighdata)
 
     print(distkm, args.sigma, distkm/args.sigma, args.sigma/distkm)
 